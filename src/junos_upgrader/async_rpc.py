@@ -0,0 +1,112 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+from rpc_caller import RpcCaller
+from rpc_processor import RpcProcessor
+
+
+class RpcBridge:
+    """
+    Runs blocking PyEZ calls on a bounded thread pool so that many sessions can be driven from a
+    single event loop. An idle session holds no thread; only RPCs in flight do, and at most
+    max_workers of them run at once across every session sharing the bridge.
+    """
+    def __init__(self, max_workers: int = 64):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rpc-bridge')
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class AsyncRpcCaller:
+    """
+    asyncio counterpart of RpcCaller. Every public RpcCaller method is available as a coroutine
+    with the same arguments. Calls on one session are serialized because a PyEZ Device must not be
+    used from two threads at once; calls on different sessions run concurrently.
+    """
+    def __init__(self, host, username, password, port, logger, connection_retries=20, connection_retry_interval=5,
+                 bridge: RpcBridge = None):
+        self.caller = RpcCaller(host=host, username=username, password=password, port=port, logger=logger,
+                                connection_retries=connection_retries, connection_retry_interval=connection_retry_interval)
+        self.bridge = bridge if bridge is not None else RpcBridge()
+        self.session_lock = asyncio.Lock()
+
+    def __str__(self):
+        return f"Instance of AsyncRpcCaller( {self.caller})"
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def host(self):
+        return self.caller.host
+
+    @property
+    def device(self):
+        return self.caller.device
+
+    async def _call(self, method_name: str, *args, **kwargs):
+        async with self.session_lock:
+            return await self.bridge.run(getattr(self.caller, method_name), *args, **kwargs)
+
+
+class AsyncRpcProcessor:
+    """
+    asyncio counterpart of RpcProcessor. Create it with `await AsyncRpcProcessor.create(...)`, which
+    opens the session on the bridge. Every public RpcProcessor method is available as a coroutine
+    with the same arguments.
+    """
+    def __init__(self, processor: RpcProcessor, bridge: RpcBridge):
+        self.processor = processor
+        self.bridge = bridge
+        self.session_lock = asyncio.Lock()
+
+    def __str__(self):
+        return f"Instance of AsyncRpcProcessor( {self.processor})"
+
+    @classmethod
+    async def create(cls, logger, upgrade_error_log, upgrade_warning_log, bridge: RpcBridge = None, **kwargs):
+        bridge = bridge if bridge is not None else RpcBridge()
+        processor = await bridge.run(RpcProcessor, logger, upgrade_error_log, upgrade_warning_log, **kwargs)
+        return cls(processor, bridge)
+
+    @property
+    def dev(self):
+        return self.processor.dev
+
+    async def close(self):
+        async with self.session_lock:
+            await self.bridge.run(self.processor.dev.close)
+
+    async def _call(self, method_name: str, *args, **kwargs):
+        async with self.session_lock:
+            return await self.bridge.run(getattr(self.processor, method_name), *args, **kwargs)
+
+
+def _async_method(method_name: str, source_class):
+    async def method(self, *args, **kwargs):
+        return await self._call(method_name, *args, **kwargs)
+    method.__name__ = method_name
+    method.__qualname__ = method_name
+    method.__doc__ = f'Runs {source_class.__name__}.{method_name} on the RPC bridge.'
+    return method
+
+
+# give the async classes the same method surface as the classes they wrap
+for _async_class, _source_class in ((AsyncRpcCaller, RpcCaller), (AsyncRpcProcessor, RpcProcessor)):
+    for _name, _value in vars(_source_class).items():
+        if callable(_value) and not _name.startswith('_') and _name not in vars(_async_class):
+            setattr(_async_class, _name, _async_method(_name, _source_class))
@@ -0,0 +1,72 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os, json, time
+from junos_upgrader_exceptions import JunosInputsError
+
+
+class Checkpoint:
+    """
+    Durable record of the upgrade steps completed on one device, and of the data needed to carry
+    on after them, e.g. the pre-upgrade state. The state file is rewritten atomically after every
+    step so that a run killed at any point leaves either the previous or the new checkpoint behind.
+    """
+    def __init__(self, path: str, device: dict):
+        self.path = path
+        self.state = {'device': device, 'completed_steps': [], 'data': {}, 'updated': None}
+
+    def __str__(self):
+        return f"Instance of Checkpoint( path: {self.path}, completed steps: {self.completed_steps})"
+
+    @classmethod
+    def load(cls, path: str, device: dict):
+        """
+        Returns the checkpoint saved at path, or None if there is none. Raises JunosInputsError if
+        the checkpoint belongs to another device or target version.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as file:
+                state = json.load(file)
+        except Exception as e:
+            raise JunosInputsError(f'Unable to read checkpoint {path}: {e}')
+        if state.get('device') != device:
+            raise JunosInputsError(f'Checkpoint {path} is for {state.get("device")}, not for {device}')
+        checkpoint = cls(path, device)
+        checkpoint.state = state
+        return checkpoint
+
+    @property
+    def completed_steps(self) -> list:
+        return self.state['completed_steps']
+
+    @property
+    def data(self) -> dict:
+        return self.state['data']
+
+    def is_complete(self, step: str) -> bool:
+        return step in self.state['completed_steps']
+
+    def complete(self, step: str, **data):
+        if step not in self.state['completed_steps']:
+            self.state['completed_steps'].append(step)
+        self.state['data'].update(data)
+        self.save()
+
+    def save(self):
+        self.state['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(self.state, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,69 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import re, json
+
+SET_VERBS = ('set', 'delete', 'deactivate', 'activate', 'protect', 'unprotect')
+# a statement starts with a verb after whitespace, so "set" inside a word such as "offset" does not split a line.
+# Quoted values are matched whole, so a verb inside a value such as description "set by ops; delete later" does
+# not split it either
+STATEMENT_START = re.compile(r'"(?:[^"\\]|\\.)*"|\s+(?=(?:' + '|'.join(SET_VERBS) + r') )')
+
+
+def split_statements(text: str):
+    """
+    Yields the statements of set lines whose line breaks were normalised to spaces.
+    """
+    start = 0
+    for match in STATEMENT_START.finditer(text):
+        if not match.group().startswith('"'):
+            yield text[start:match.start()]
+            start = match.end()
+    yield text[start:]
+
+
+def config_set_lines(reply):
+    """
+    Yields the set lines of a 'show configuration | display set' reply straight from its text nodes,
+    without serialising the reply. The reply should be fetched without normalisation so that each
+    statement is on a line of its own. A reply whose line breaks were normalised to spaces is split
+    before each statement outside a quoted value.
+    """
+    for text in reply.xpath('//text()'):
+        for line in text.splitlines() if '\n' in text.strip() else split_statements(text):
+            line = line.strip()
+            if line.startswith(SET_VERBS):
+                yield line
+
+
+def hierarchy(line: str) -> str:
+    """
+    Returns the top level hierarchy of a set line, e.g. 'interfaces' for 'set interfaces xe-0/0/0 mtu 9192'.
+    """
+    words = line.split(maxsplit=2)
+    return words[1] if len(words) > 1 else words[0]
+
+
+def diff_config_lines(pre_upgrade_lines: list, post_upgrade_lines: list) -> dict:
+    """
+    Returns the lines removed from and added to the config, grouped by top level hierarchy, in their
+    original order. Both sides are indexed into hash sets, so the diff takes linear time and a change
+    in the order of the lines is not a difference.
+    """
+    pre_upgrade_set, post_upgrade_set = set(pre_upgrade_lines), set(post_upgrade_lines)
+    hierarchies = {}
+    for change, lines, other in (('removed', pre_upgrade_lines, post_upgrade_set),
+                                 ('added', post_upgrade_lines, pre_upgrade_set)):
+        for line in dict.fromkeys(lines):
+            if line not in other:
+                hierarchies.setdefault(hierarchy(line), {'removed': [], 'added': []})[change].append(line)
+    return {'removed': sum(len(changes['removed']) for changes in hierarchies.values()),
+            'added': sum(len(changes['added']) for changes in hierarchies.values()),
+            'hierarchies': dict(sorted(hierarchies.items()))}
+
+
+def write_config_diff(diff: dict, diff_file: str):
+    with open(diff_file, 'w') as file:
+        json.dump(diff, file, indent=4)
@@ -0,0 +1,85 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import time, random, socket
+import paramiko
+from ncclient.transport.errors import AuthenticationError, SSHUnknownHostError, TransportError
+from jnpr.junos.exception import ConnectAuthError, ConnectUnknownHostError, ConnectClosedError
+
+# errors that a retry cannot fix: wrong credentials, an unknown or changed host key and a host name that does not resolve
+PERMANENT_ERRORS = (ConnectAuthError, ConnectUnknownHostError, AuthenticationError, SSHUnknownHostError,
+                    paramiko.AuthenticationException, paramiko.BadHostKeyException)
+
+# errors raised by an RPC whose session was closed, e.g. by a reboot, or found dead by the keepalives
+SESSION_LOST_ERRORS = (ConnectClosedError, TransportError, EOFError, ConnectionError)
+
+
+def is_permanent(error: BaseException) -> bool:
+    """
+    Returns True if a connection error will not go away by retrying. PyEZ wraps the errors it does not
+    classify itself in a ConnectError, with the original error in _orig.
+    """
+    while error is not None:
+        if isinstance(error, PERMANENT_ERRORS):
+            return True
+        error = getattr(error, '_orig', None) or error.__cause__
+    return False
+
+
+def is_session_lost(error: BaseException) -> bool:
+    return isinstance(error, SESSION_LOST_ERRORS)
+
+
+def enable_keepalive(transport: paramiko.Transport, interval: int, count: int) -> bool:
+    """
+    Sends an SSH keepalive after interval seconds without traffic, and has the kernel close the socket
+    once data sent has not been acknowledged for interval * count seconds. ncclient then fails the RPCs
+    waiting on the session, so a peer that died, e.g. an RE that rebooted or lost power, is noticed
+    within seconds rather than when the RPC times out. Returns False if the transport has no socket.
+    """
+    sock = getattr(transport, 'sock', None)
+    if not isinstance(sock, socket.socket):
+        return False
+    transport.set_keepalive(interval)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # the TCP options are only available on Linux
+    for option, value in (('TCP_KEEPIDLE', interval), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count),
+                          ('TCP_USER_TIMEOUT', interval * count * 1000)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+    return True
+
+
+class ConnectionPolicy:
+    """
+    Decides how long to wait before each attempt to open a session. The wait doubles from
+    retry_interval up to max_retry_interval and is shortened by a random fraction of up to jitter, so
+    that sessions to a recovering RE, e.g. from a fleet upgrade, do not retry in lockstep. No attempt is
+    made after deadline seconds, and permanent errors are not retried at all.
+    """
+    def __init__(self, retries: int = 20, retry_interval: float = 5, max_retry_interval: float = 60,
+                 jitter: float = 0.5, deadline: float = None):
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def __str__(self):
+        return (f"Instance of ConnectionPolicy( retries: {self.retries}, retry_interval: {self.retry_interval},"
+                f" max_retry_interval: {self.max_retry_interval}, jitter: {self.jitter}, deadline: {self.deadline})")
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the wait after the given failed attempt, counting from 1.
+        """
+        interval = min(self.max_retry_interval, self.retry_interval * 2 ** (attempt - 1))
+        return interval * (1 - self.jitter * random.random())
+
+    def deadline_reached(self, started: float, delay: float) -> bool:
+        """
+        Returns True if an attempt made after delay would start after the deadline.
+        """
+        return self.deadline is not None and time.monotonic() + delay - started > self.deadline
@@ -37,3 +37,54 @@ class Helpers:
         formatter = logging.Formatter('%(message)s')
         file_handler = logging.FileHandler(f'{cwd}/logs/{logfile}', mode='w')
         return formatter, file_handler, logger
+
+    @staticmethod
+    def create_device_logger(name, logs_dir, logfile, debug=False):
+        """
+        Creates a logger dedicated to one device so that concurrent upgrades, e.g. those run by
+        the fleet upgrader, each write to their own logfile in logs_dir.
+        """
+        os.makedirs(logs_dir, exist_ok=True)
+        logger = logging.getLogger(f'{__name__}.{name}')
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        formatter = logging.Formatter('%(message)s')
+        file_handler = logging.FileHandler(os.path.join(logs_dir, logfile), mode='w')
+        file_handler.setLevel(logging.DEBUG if debug else logging.INFO)
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+        return logger
+
+
+class BufferedLogger:
+    """
+    Stands in for a logger while a block of checks runs on a worker thread. Messages are kept in
+    order and written to the wrapped logger by flush, so blocks that ran concurrently can be
+    logged one after the other instead of interleaved.
+    """
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.records = []
+
+    def log(self, level: int, msg, *args, **kwargs):
+        self.records.append((level, msg, args, kwargs))
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def flush(self):
+        for level, msg, args, kwargs in self.records:
+            self.logger.log(level, msg, *args, **kwargs)
+        self.records.clear()
@@ -36,6 +36,14 @@ class JunosRebootError(JunosUpgradeError):
         super().__init__(error_message)
 
 
+class JunosPackageStagingError(JunosUpgradeError):
+    """
+    Custom error class for all Junos package staging related exceptions
+    """
+    def __init__(self, error_message: str):
+        super().__init__(error_message)
+
+
 class JunosValidationError(JunosUpgradeError):
     """
     Custom error class for all junos validation related exceptions
@@ -76,6 +84,14 @@ class JunosConnectError(JunosUpgradeError):
         super().__init__(error_message)
 
 
+class JunosSessionLostError(JunosConnectError):
+    """
+    Custom error class for an RPC whose session was lost before it replied
+    """
+    def __init__(self, error_message: str):
+        super().__init__(error_message)
+
+
 class JunosInputsError(JunosUpgradeError):
     """
     Custom error class for all inputs exceptions
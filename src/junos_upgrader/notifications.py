@@ -0,0 +1,168 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import re, time, logging, threading
+from collections import deque
+from lxml import etree
+
+MASTERSHIP = 'mastership'
+ADJACENCY = 'adjacency'
+SYSLOG = 'syslog'
+
+# syslog tags, by prefix, of the events the waits of the upgrader are woken by
+EVENT_TAGS = {
+    MASTERSHIP: ('CHASSISD_RE_MASTERSHIP', 'CHASSISD_RE_SWITCHOVER'),
+    ADJACENCY: ('RPD_ISIS_ADJ', 'RPD_OSPF_NBR', 'RPD_LDP_NBR', 'RPD_LDP_SESSION', 'BFDD_STATE'),
+}
+
+SYSLOG_TAG = re.compile(r'\b([A-Z][A-Z0-9]+(?:_[A-Z0-9]+)+)\b')
+
+
+class NotificationEvent:
+    def __init__(self, index: int, kind: str, tag: str, message: str):
+        self.index = index
+        self.kind = kind
+        self.tag = tag
+        self.message = message
+        self.received = time.monotonic()
+
+    def __str__(self):
+        return f"Instance of NotificationEvent( index: {self.index}, kind: {self.kind}, tag: {self.tag}, message: {self.message})"
+
+
+def classify(tag: str, message: str) -> str:
+    for kind, prefixes in EVENT_TAGS.items():
+        if tag is not None and tag.startswith(prefixes):
+            return kind
+    return MASTERSHIP if 'mastership' in message.lower() else SYSLOG
+
+
+def parse_notification(notification: etree.Element) -> tuple:
+    """
+    Returns the kind, syslog tag and message of a NETCONF notification. The message is the text of
+    the notification without its eventTime, e.g. "rpd[1234]: RPD_ISIS_ADJUP: IS-IS new L2 adjacency".
+    """
+    texts = [text.strip() for child in notification if etree.QName(child).localname != 'eventTime'
+             for text in child.itertext() if text.strip()]
+    message = ' '.join(texts)
+    match = SYSLOG_TAG.search(message)
+    tag = match.group(1) if match else None
+    return classify(tag, message), tag, message
+
+
+class NotificationListener:
+    """
+    Collects the notifications of one NETCONF session on a thread of its own. source(timeout)
+    returns the next notification element, or None if there was none within timeout, and close, if
+    given, is called once the listener has stopped. Waits block on wait until a notification of a kind
+    they are interested in arrives.
+    """
+    def __init__(self, source, logger: logging.Logger = None, host: str = None, history: int = 1000, close=None):
+        self.source = source
+        self.close = close
+        self.logger = logger or logging.getLogger(__name__)
+        self.host = host
+        self.events = deque(maxlen=history)
+        self.received = 0
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __str__(self):
+        return f"Instance of NotificationListener( host: {self.host}, received: {self.received}, running: {self.running})"
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.listen, name=f'notifications-{self.host}', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.close is not None:
+            self.close()
+
+    def listen(self):
+        while not self.stopped.is_set():
+            try:
+                notification = self.source(0.5)
+            except Exception as e:
+                # the session is down, e.g. while its RE reboots, and the source opens it again
+                self.logger.debug(f'No notifications from {self.host}: {e}')
+                self.stopped.wait(1)
+                continue
+            if notification is not None:
+                self.add(notification)
+
+    def add(self, notification: etree.Element) -> NotificationEvent:
+        kind, tag, message = parse_notification(notification)
+        with self.condition:
+            event = NotificationEvent(self.received, kind, tag, message)
+            self.received += 1
+            self.events.append(event)
+            self.condition.notify_all()
+        self.logger.debug(f'Notification from {self.host}: {message}')
+        return event
+
+    def cursor(self) -> int:
+        """
+        Returns the index the next notification will have.
+        """
+        with self.condition:
+            return self.received
+
+    def wait(self, kinds: tuple, timeout: float, since: int = 0):
+        """
+        Returns the first notification of one of kinds with an index of since or more, waiting up to
+        timeout seconds for one to arrive, or None if none does.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                for event in self.events:
+                    if event.index >= since and event.kind in kinds:
+                        return event
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+
+class NotificationWaiter:
+    """
+    Sleeps between the polls of one wait and wakes early when a notification of one of kinds arrives,
+    so the wait re-polls at once. Notifications that arrived before the wait started are ignored.
+    Without a listener, or once the listener has stopped, it sleeps for the full time, so the wait
+    falls back to polling.
+    """
+    def __init__(self, listener: NotificationListener, kinds: tuple):
+        self.listener = listener
+        self.kinds = kinds
+        self.since = listener.cursor() if listener is not None else 0
+
+    def __str__(self):
+        return f"Instance of NotificationWaiter( kinds: {self.kinds}, since: {self.since})"
+
+    def sleep(self, seconds: float):
+        """
+        Returns the notification that ended the sleep early, or None if the sleep ran its full time.
+        """
+        if self.listener is None or not self.listener.running:
+            time.sleep(seconds)
+            return None
+        event = self.listener.wait(self.kinds, seconds, self.since)
+        if event is not None:
+            self.since = event.index + 1
+            self.listener.logger.info(f'Notification from {self.listener.host}: {event.message}. Checking again now')
+        return event
@@ -0,0 +1,133 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os, time, errno, hashlib, logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from rpc_caller import RpcCaller
+from junos_upgrader_exceptions import JunosPackageStagingError
+
+
+def local_checksum(path: str, algorithm: str = 'sha256', chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remote_size(sftp, path: str):
+    """
+    Returns the size of a file on the RE, or None if there is no such file.
+    """
+    try:
+        return sftp.stat(path).st_size
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+
+
+class BandwidthLimiter:
+    """
+    Caps the average rate of a transfer at bytes_per_second by sleeping whenever it gets ahead.
+    """
+    def __init__(self, bytes_per_second: float = None):
+        self.bytes_per_second = bytes_per_second
+        self.start = time.monotonic()
+        self.sent = 0
+
+    def __str__(self):
+        return f"Instance of BandwidthLimiter( bytes_per_second: {self.bytes_per_second}, sent: {self.sent})"
+
+    def wait(self, sent: int):
+        self.sent += sent
+        if not self.bytes_per_second:
+            return
+        ahead = self.sent / self.bytes_per_second - (time.monotonic() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def stage_package(caller: RpcCaller, local_package: str, junos_package_path: str, package_name: str = None,
+                  checksum: str = None, algorithm: str = 'sha256', bandwidth_limit: float = None,
+                  chunk_size: int = 262144) -> dict:
+    """
+    Copies local_package to junos_package_path on the RE of caller over SFTP, unless a copy with the
+    right checksum is already there. The copy is written to a .part file, which an interrupted transfer
+    appends to from where it stopped, and is only renamed to package_name once the checksum calculated
+    on the box matches checksum, or that of local_package. Raises JunosPackageStagingError otherwise.
+    """
+    package_name = package_name or os.path.basename(local_package)
+    remote = f"{junos_package_path.rstrip('/')}/{package_name}"
+    part = f'{remote}.part'
+    size = os.path.getsize(local_package)
+    checksum = (checksum or local_checksum(local_package, algorithm)).lower()
+    result = {'host': caller.host, 'package': remote, 'status': 'present', 'bytes_sent': 0, 'resumed_from': 0,
+              'seconds': 0.0}
+    start = time.monotonic()
+
+    with caller.sftp() as sftp:
+        stat = caller.file_stat(remote)
+        if stat is not None and stat['size'] == size and caller.file_checksum(remote, algorithm) == checksum:
+            result['seconds'] = time.monotonic() - start
+            return result
+
+        offset = remote_size(sftp, part) or 0
+        if offset > size:
+            offset = 0
+        limiter = BandwidthLimiter(bandwidth_limit)
+        with open(local_package, 'rb') as source, sftp.open(part, 'ab' if offset else 'wb') as target:
+            source.seek(offset)
+            # send the writes without waiting for each to be acknowledged
+            target.set_pipelined(True)
+            for chunk in iter(lambda: source.read(chunk_size), b''):
+                target.write(chunk)
+                result['bytes_sent'] += len(chunk)
+                limiter.wait(len(chunk))
+
+        on_box_checksum = caller.file_checksum(part, algorithm)
+        if on_box_checksum != checksum:
+            # start again from the beginning next time rather than appending to a corrupt copy
+            sftp.remove(part)
+            raise JunosPackageStagingError(f'The {algorithm} checksum of {part} on {caller.host} is {on_box_checksum}, '
+                                           f'expected {checksum}')
+        if remote_size(sftp, remote) is not None:
+            sftp.remove(remote)
+        sftp.rename(part, remote)
+    # the package was verified above, so the checks that follow need not calculate its checksum again
+    caller.file_changed(remote, checksum, algorithm)
+
+    result.update(status='staged', resumed_from=offset, seconds=time.monotonic() - start)
+    return result
+
+
+def stage_package_on_res(callers: list, local_package: str, junos_package_path: str, package_name: str = None,
+                         checksum: str = None, algorithm: str = 'sha256', bandwidth_limit: float = None,
+                         max_workers: int = 8, logger: logging.Logger = None, connect=None) -> list:
+    """
+    Stages the package on the REs of callers, up to max_workers at a time, and returns the result of
+    each in the order of callers. A failed RE has status 'failed' and its error rather than raising.
+    With connect, callers are the hosts of the REs instead and each worker opens the session to its RE
+    with connect(host), a context manager that yields the RpcCaller, so that the sessions are opened in
+    parallel too and an unreachable RE only holds up its own worker.
+    """
+    logger = logger or logging.getLogger(__name__)
+    checksum = checksum or local_checksum(local_package, algorithm)
+
+    def stage(caller) -> dict:
+        host = caller if connect is not None else caller.host
+        try:
+            with connect(host) if connect is not None else nullcontext(caller) as caller:
+                result = stage_package(caller, local_package, junos_package_path, package_name, checksum, algorithm,
+                                       bandwidth_limit)
+            logger.info(f'{result["package"]} is {result["status"]} on {host}. \u2705')
+            return result
+        except Exception as e:
+            logger.error(f'\u274C ERROR: Unable to stage {local_package} on {host}. Exception: {e}')
+            return {'host': host, 'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage') as executor:
+        return list(executor.map(stage, callers))
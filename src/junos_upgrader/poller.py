@@ -0,0 +1,67 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import time
+
+
+class Poller:
+    """
+    Calls a probe until a condition holds for its result. The first wait is interval seconds and
+    each wait after it is backoff times longer, up to max_interval, so a condition that holds soon is
+    seen within seconds while a device that is still settling is not polled hard. Gives up after
+    timeout seconds, or as soon as stop holds for a result that waiting will not change. A probe that
+    raises counts as an attempt that did not pass, e.g. while a session drops during a switchover.
+    sleep is called to wait between probes, e.g. NotificationWaiter.sleep, which ends the wait early
+    when the device reports the change that is being waited for.
+    """
+    def __init__(self, timeout: float, interval: float = 1, max_interval: float = 15, backoff: float = 2,
+                 sleep=None):
+        self.timeout = timeout
+        self.sleep = sleep
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.attempts = 0
+        self.result = None
+        self.error = None
+        self.stopped = False
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f"Instance of Poller( timeout: {self.timeout}, interval: {self.interval},"
+                f" max_interval: {self.max_interval}, backoff: {self.backoff}, attempts: {self.attempts})")
+
+    def poll(self, probe, condition=bool, stop=None, on_retry=None) -> bool:
+        """
+        Returns True once condition(probe()) holds, or False at the timeout or when stop(probe()) holds.
+        on_retry(attempt, wait) is called before each wait. The last result, or the error the last
+        probe raised, is kept in result and error.
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        interval = self.interval
+        while True:
+            self.attempts += 1
+            try:
+                self.result, self.error = probe(), None
+                if condition(self.result):
+                    self.elapsed = time.monotonic() - start
+                    return True
+                if stop is not None and stop(self.result):
+                    self.stopped = True
+                    self.elapsed = time.monotonic() - start
+                    return False
+            except Exception as e:
+                self.result, self.error = None, e
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.elapsed = time.monotonic() - start
+                return False
+            wait = min(interval, remaining)
+            if on_retry is not None:
+                on_retry(self.attempts, wait)
+            (self.sleep or time.sleep)(wait)
+            interval = min(interval * self.backoff, self.max_interval)
@@ -0,0 +1,118 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os, json, time, threading, functools
+from contextlib import contextmanager
+
+
+class RunProfiler:
+    """
+    Records the start, duration, bytes received and outcome of every RPC, upgrade step and wait of a
+    run, so that the time an upgrade takes can be broken down afterwards. The events are written as a
+    JSON profile and as a Chrome trace, which can be opened in chrome://tracing or ui.perfetto.dev.
+    A disabled profiler records nothing, so instrumented code costs next to nothing without one.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.events = []
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.origin = time.perf_counter()
+
+    def __str__(self):
+        return f"Instance of RunProfiler( enabled: {self.enabled}, events: {len(self.events)})"
+
+    @contextmanager
+    def span(self, name: str, category: str, **details):
+        """
+        Times the enclosed block. Yields the event dict so the block can add the number of bytes it
+        received, or replace the outcome, e.g. with 'cached'. An exception sets the outcome to its type.
+        """
+        event = {'name': name, 'category': category, 'start': 0.0, 'duration': 0.0, 'bytes': None,
+                 'outcome': 'ok', 'thread': threading.current_thread().name, **details}
+        if not self.enabled:
+            yield event
+            return
+        start = time.perf_counter()
+        try:
+            yield event
+        except BaseException as e:
+            event['outcome'] = f'error: {type(e).__name__}'
+            raise
+        finally:
+            event['start'] = start - self.origin
+            event['duration'] = time.perf_counter() - start
+            with self.lock:
+                self.events.append(event)
+
+    def summary(self) -> list:
+        """
+        Returns the count, total and longest duration and total bytes of the events of each category
+        and name, longest total first.
+        """
+        totals = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            total = totals.setdefault((event['category'], event['name']), {
+                    'category': event['category'], 'name': event['name'], 'count': 0, 'total_seconds': 0.0,
+                    'max_seconds': 0.0, 'bytes': 0, 'errors': 0})
+            total['count'] += 1
+            total['total_seconds'] += event['duration']
+            total['max_seconds'] = max(total['max_seconds'], event['duration'])
+            total['bytes'] += event['bytes'] or 0
+            total['errors'] += event['outcome'].startswith('error')
+        return sorted(totals.values(), key=lambda total: total['total_seconds'], reverse=True)
+
+    def chrome_trace(self) -> dict:
+        with self.lock:
+            events = list(self.events)
+        threads = list(dict.fromkeys(event['thread'] for event in events))
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': thread}}
+                 for tid, thread in enumerate(threads, 1)]
+        for event in events:
+            args = {key: value for key, value in event.items()
+                    if key not in ('name', 'category', 'start', 'duration', 'thread') and value is not None}
+            trace.append({'name': event['name'], 'cat': event['category'], 'ph': 'X', 'pid': 1,
+                          'tid': threads.index(event['thread']) + 1, 'ts': round(event['start'] * 1e6),
+                          'dur': round(event['duration'] * 1e6), 'args': args})
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def write(self, logs_dir: str, logger=None) -> list:
+        """
+        Writes upgrade_profile.json and upgrade_profile.trace.json to logs_dir and returns their paths.
+        """
+        if not self.enabled:
+            return []
+        with self.lock:
+            events = list(self.events)
+        profile = {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                   'duration_seconds': time.perf_counter() - self.origin,
+                   'summary': self.summary(),
+                   'events': events}
+        paths = [os.path.join(logs_dir, 'upgrade_profile.json'), os.path.join(logs_dir, 'upgrade_profile.trace.json')]
+        os.makedirs(logs_dir, exist_ok=True)
+        for path, content in zip(paths, (profile, self.chrome_trace())):
+            with open(path, 'w') as file:
+                json.dump(content, file, indent=1)
+        if logger is not None:
+            logger.info(f'Run profile written to {paths[0]} and {paths[1]}')
+            for total in profile['summary'][:5]:
+                logger.debug(f'{total["category"]} {total["name"]}: {total["count"]} calls, '
+                             f'{total["total_seconds"]:.1f}s in total, longest {total["max_seconds"]:.1f}s')
+        return paths
+
+
+def profiled(category: str):
+    """
+    Decorates an RpcProcessor method so that every call is recorded by the processor's profiler.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.span(method.__name__, category, host=self.host):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -4,15 +4,176 @@ Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
 """
 
 from jnpr.junos import Device
+from jnpr.junos.jxml import remove_namespaces_and_spaces
 from jnpr.junos.utils.fs import FS
 from lxml import etree
-import time
+from contextlib import contextmanager
+import paramiko
+import time, threading, socket
+
+from junos_upgrader_exceptions import JunosConnectError, JunosSessionLostError
+from profiler import RunProfiler
+from connection_policy import ConnectionPolicy, is_permanent, is_session_lost, enable_keepalive
+from notifications import NotificationListener
+
+
+class NetconfReplyStream:
+    """
+    Incremental parser for a NETCONF 1.0 reply. Bytes are fed as they arrive from the channel and
+    every completed `tag` element is returned straight away, so parsing starts before the reply
+    has fully arrived. Elements that have been returned are removed from the tree on the next
+    feed, which keeps memory flat however long the reply is.
+    """
+    DELIMITER = b']]>]]>'
+
+    def __init__(self, tag: str):
+        self.parser = etree.XMLPullParser(events=('end',), tag=(f'{{*}}{tag}', '{*}rpc-error'), huge_tree=True)
+        self.pending = b''
+        self.returned = []
+        self.complete = False
+
+    def feed(self, data: bytes) -> list:
+        self._release()
+        data = self.pending + data
+        end = data.find(self.DELIMITER)
+        if end != -1:
+            data = data[:end]
+            self.complete = True
+            self.pending = b''
+        else:
+            # keep a possible partial delimiter for the next feed
+            keep = len(self.DELIMITER) - 1
+            self.pending = data[-keep:]
+            data = data[:-keep]
+        self.parser.feed(data)
+        elements = []
+        for _, element in self.parser.read_events():
+            if etree.QName(element).localname == 'rpc-error':
+                message = element.findtext('{*}error-message') or etree.tostring(element, encoding='unicode')
+                raise RuntimeError(f'RPC error: {message.strip()}')
+            elements.append(element)
+        self.returned = elements
+        return elements
+
+    def _release(self):
+        for element in self.returned:
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+        self.returned = []
+
+
+class NotificationSession:
+    """
+    A NETCONF 1.0 session of its own to the device, subscribed to its notifications with
+    create-subscription. Notifications are never sent on the PyEZ session: the Junos device handler
+    of ncclient takes every message it receives for an rpc-reply and closes the session on the first
+    notification. When the session drops, e.g. while the RE reboots, take opens it again.
+    """
+    SUBSCRIBE = ('<rpc message-id="subscribe" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+                 '<create-subscription xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">{stream}'
+                 '</create-subscription></rpc>')
+
+    def __init__(self, caller, stream: str = None):
+        self.caller = caller
+        self.stream = stream
+        self.client = None
+        self.channel = None
+        self.data = b''
 
-from junos_upgrader_exceptions import JunosConnectError
+    def __str__(self):
+        return f"Instance of NotificationSession( host: {self.caller.host}, stream: {self.stream}, open: {self.channel is not None})"
+
+    def open(self):
+        client = self.caller._ssh_client()
+        try:
+            self.channel = client.get_transport().open_session()
+            self.channel.invoke_subsystem('netconf')
+            hello = ('<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+                     '<capability>urn:ietf:params:netconf:base:1.0</capability></capabilities></hello>')
+            self.channel.sendall(hello.encode() + NetconfReplyStream.DELIMITER)
+            server_hello = self._read(30)
+            if server_hello is None or b'urn:ietf:params:netconf:capability:notification:1.0' not in server_hello:
+                raise JunosConnectError(f'{self.caller.host} does not support NETCONF notifications')
+            stream = f'<stream>{self.stream}</stream>' if self.stream else ''
+            self.channel.sendall(self.SUBSCRIBE.format(stream=stream).encode() + NetconfReplyStream.DELIMITER)
+            reply = self._read(30)
+            if reply is None or b'<ok/>' not in reply:
+                raise JunosConnectError(f'{self.caller.host} refused the notification subscription: {reply}')
+        except BaseException:
+            client.close()
+            self.channel = None
+            self.data = b''
+            raise
+        self.client = client
+
+    def _read(self, timeout: float) -> bytes:
+        """
+        Returns the next message, or None if none is complete within timeout.
+        """
+        self.channel.settimeout(timeout)
+        while NetconfReplyStream.DELIMITER not in self.data:
+            try:
+                chunk = self.channel.recv(65536)
+            except socket.timeout:
+                return None
+            if not chunk:
+                raise ConnectionError(f'The notification session to {self.caller.host} was closed')
+            self.data += chunk
+        message, self.data = self.data.split(NetconfReplyStream.DELIMITER, 1)
+        return message
+
+    def take(self, timeout: float) -> etree.Element:
+        """
+        Returns the next notification, or None if none arrives within timeout.
+        """
+        if self.client is None:
+            # a TCP connection to the NETCONF port is cheap, so a rebooting RE is not sent SSH handshakes
+            if not self.caller.port_is_open(timeout=1):
+                raise ConnectionError(f'The NETCONF port of {self.caller.host} is closed')
+            self.open()
+        try:
+            message = self._read(timeout)
+        except Exception:
+            self.close()
+            raise
+        if message is None:
+            return None
+        element = etree.fromstring(message.strip())
+        return element if etree.QName(element).localname == 'notification' else None
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        self.channel = None
+        self.data = b''
 
 
 class RpcCaller:
-    def __init__(self, host, username, password, port, logger, connection_retries=20, connection_retry_interval=5):
+    # Read-only RPCs that several RpcProcessor methods fetch with the same arguments in one phase.
+    # RPCs that change the device are never cached. Methods that poll one of these RPCs while
+    # waiting for the device to change must call it with use_cache=False.
+    CACHEABLE_RPCS = {
+        'get_route_engine_information',
+        'get_alarm_information',
+        'get_isis_adjacency_information',
+        'get_ldp_session_information',
+        'get_l2ckt_connection_information',
+        'get_routing_task_replication_state',
+        'file_stat',
+        'file_checksum',
+    }
+
+    CHECKSUM_RPCS = {
+        'md5': 'get_checksum_information',
+        'sha1': 'get_sha1_checksum_information',
+        'sha256': 'get_sha256_checksum_information',
+    }
+
+    def __init__(self, host, username, password, port, logger, connection_retries=20, connection_retry_interval=5,
+                 profiler: RunProfiler = None, connection_max_retry_interval=60, connection_deadline=None,
+                 keepalive_interval=10, keepalive_count=3):
         self.host = host
         self.username = username
         self.password = password
@@ -20,8 +181,25 @@ class RpcCaller:
         self.logger = logger
         self.connection_retries = connection_retries
         self.connection_retry_interval = connection_retry_interval
+        self.connection_policy = ConnectionPolicy(retries=connection_retries, retry_interval=connection_retry_interval,
+                                                  max_retry_interval=connection_max_retry_interval,
+                                                  deadline=connection_deadline)
+        self.connect_attempts = []
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        # serializes opening the session and the RPCs on it, as a SessionPool may share it between threads
+        self.session_lock = threading.RLock()
         self.device = Device(host=host, user=username, password=password, port=port, conn_open_timeout=30, normalize=True)
         self.fs = FS(self.device)
+        self.cache_phase = None
+        self.cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_lock = threading.Lock()
+        self.prefetched = {}
+        self.profiler = profiler if profiler is not None else RunProfiler(enabled=False)
+        # set by subscribe_notifications
+        self.notifications = None
 
     def __str__(self):
         return (f"Instance of RpcCaller("
@@ -40,105 +218,471 @@ class RpcCaller:
     def __exit__(self):
         self.close()
 
-    def open(self):
-        for i in range(1, self.connection_retries + 1):
+    def open(self, retries: int = None, reopen: bool = False):
+        """
+        Opens the session, re-trying transient errors as the connection policy allows. Permanent errors,
+        e.g. an authentication failure, are raised straight away. Every attempt is added to
+        connect_attempts, with its duration and outcome, and recorded by the profiler. Does nothing if
+        the session is open, e.g. because a SessionPool re-opened it in the background, unless reopen
+        is set, e.g. after a reboot the transport may not have noticed yet.
+        """
+        with self.session_lock:
+            if not reopen and self.healthy():
+                return self
+            return self._open(retries)
+
+    def _open(self, retries: int = None):
+        retries = self.connection_policy.retries if retries is None else retries
+        started = time.monotonic()
+        for i in range(1, retries + 1):
+            self.logger.info(f'Trying to connect to {self.host}. Attempt {i} of {retries}.')
+            attempt = {'attempt': i, 'start': time.monotonic() - started, 'seconds': 0.0, 'outcome': 'not connected',
+                       'error': None}
+            self.connect_attempts.append(attempt)
             try:
-                self.logger.info(f'Trying to connect to {self.host}. Attempt {i} of {self.connection_retries}.')
-                self.device.open()
+                with self.profiler.span('open', 'connect', host=self.host, attempt=i):
+                    self.device.open()
+                attempt['seconds'] = time.monotonic() - started - attempt['start']
                 if self.device.connected:
+                    attempt['outcome'] = 'connected'
+                    self._enable_keepalive()
                     self.logger.info(f'Connected to {self.host} \u2705')
                     return self
             except Exception as e:
-                error = f'Cannot connect to {self.host}. Re-trying in {self.connection_retry_interval} seconds. Error: {e}'
-                time.sleep(self.connection_retry_interval)
-                self.logger.info(error)
+                permanent = is_permanent(e)
+                attempt.update(seconds=time.monotonic() - started - attempt['start'], error=f'{type(e).__name__}: {e}',
+                               outcome='permanent error' if permanent else 'transient error')
+                if permanent:
+                    error = f'Cannot connect to {self.host}. {type(e).__name__} is not re-tried. Error: {e}'
+                    self.logger.info(error)
+                    raise JunosConnectError(error)
+                if i == retries:
+                    self.logger.info(f'Cannot connect to {self.host}. Error: {e}')
+                    break
+                delay = self.connection_policy.delay(i)
+                if self.connection_policy.deadline_reached(started, delay):
+                    error = (f'Cannot connect to {self.host}. The connection deadline of '
+                             f'{self.connection_policy.deadline} seconds has been reached. Error: {e}')
+                    self.logger.info(error)
+                    raise JunosConnectError(error)
+                self.logger.info(f'Cannot connect to {self.host}. Re-trying in {delay:.1f} seconds. Error: {e}')
+                time.sleep(delay)
         error = f'Cannot connect to {self.host}. Maximum number of retries has been reached'
         raise JunosConnectError(error)
 
+    def _enable_keepalive(self):
+        if not self.keepalive_interval:
+            return
+        session = getattr(self.device._conn, '_session', None)
+        if enable_keepalive(getattr(session, '_transport', None), self.keepalive_interval, self.keepalive_count):
+            self.logger.debug(f'Session to {self.host} is checked every {self.keepalive_interval} seconds and '
+                              f'found dead after {self.keepalive_interval * self.keepalive_count} seconds')
+
+    def healthy(self) -> bool:
+        """
+        Returns True if the session is open, without sending an RPC. The NETCONF transport notices a
+        session closed by the device, e.g. by a reboot, before PyEZ does.
+        """
+        return self.device.connected and getattr(self.device._conn, 'connected', True)
+
+    def subscribe_notifications(self, stream: str = None) -> NotificationListener:
+        """
+        Subscribes to the NETCONF notifications of the RE, e.g. its syslog events, on a NotificationSession
+        of its own, and starts a NotificationListener that collects them. Raises JunosConnectError if
+        the RE does not support notifications or refuses the subscription.
+        """
+        if self.notifications is None or not self.notifications.running:
+            session = NotificationSession(self, stream)
+            session.open()
+            self.notifications = NotificationListener(session.take, self.logger, self.host, close=session.close)
+        return self.notifications.start()
+
     def close(self):
+        if self.notifications is not None:
+            self.notifications.stop()
+            self.notifications = None
         self.device.close()
         if not self.device.connected:
             self.logger.info(f'Disconnected from {self.host}')
 
-    def show_chassis_routing_engine(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_route_engine_information(*args, **kwargs)
+    def port_is_open(self, timeout: int = 5) -> bool:
+        """
+        Returns True if a TCP connection to the NETCONF port can be established. Used to find out
+        cheaply whether a rebooting RE is reachable before trying to open a session.
+        """
+        try:
+            with socket.create_connection((self.host, int(self.port)), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def start_cache_phase(self, phase: str):
+        """
+        Starts caching the replies of CACHEABLE_RPCS until end_cache_phase is called.
+        Cached replies are shared between callers so they must not be modified.
+        """
+        with self.cache_lock:
+            self.cache_phase = phase
+            self.cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
+        self.logger.debug(f'Started RPC cache for {phase} phase on {self.host}')
+
+    def end_cache_phase(self) -> dict:
+        with self.cache_lock:
+            stats = {'phase': self.cache_phase, 'hits': self.cache_hits, 'misses': self.cache_misses}
+            self.cache_phase = None
+            self.cache.clear()
+        self.logger.info(f'RPC cache for {stats["phase"]} phase on {self.host}: {stats["hits"]} hits, {stats["misses"]} misses')
+        return stats
+
+    def invalidate_cache(self, reason: str):
+        with self.cache_lock:
+            if len(self.cache) != 0 or len(self.prefetched) != 0:
+                self.logger.debug(f'Invalidating RPC cache on {self.host} after {reason}')
+            self.cache.clear()
+            self.prefetched.clear()
+
+    def discard_prefetched(self):
+        with self.cache_lock:
+            self.prefetched.clear()
+
+    @staticmethod
+    def _cache_key(rpc_name: str, args: tuple, kwargs: dict) -> tuple:
+        return rpc_name, repr(args), repr(sorted(kwargs.items()))
+
+    def _rpc(self, rpc_name: str, *args, use_cache: bool = True, **kwargs):
+        return self._cached(rpc_name, getattr(self.device.rpc, rpc_name), args, kwargs, use_cache)
+
+    def _cached(self, rpc_name: str, rpc, args: tuple, kwargs: dict, use_cache: bool = True):
+        with self.profiler.span(rpc_name, 'rpc', host=self.host) as event:
+            key = self._cache_key(rpc_name, args, kwargs)
+            if use_cache and self.prefetched:
+                with self.cache_lock:
+                    if key in self.prefetched:
+                        event['outcome'] = 'prefetched'
+                        return self.prefetched.pop(key)
+
+            if not use_cache or self.cache_phase is None or rpc_name not in self.CACHEABLE_RPCS:
+                return self._profiled_reply(self._call(rpc_name, rpc, args, kwargs), event)
+
+            with self.cache_lock:
+                if key in self.cache:
+                    self.cache_hits += 1
+                    event['outcome'] = 'cached'
+                    return self.cache[key]
+            response = self._profiled_reply(self._call(rpc_name, rpc, args, kwargs), event)
+            with self.cache_lock:
+                self.cache_misses += 1
+                if self.cache_phase is not None:
+                    self.cache[key] = response
+            return response
+
+    def _call(self, rpc_name: str, rpc, args: tuple, kwargs: dict):
+        """
+        Runs the RPC on the session. An RPC whose session is lost, e.g. found dead by the keepalives
+        during a long install, raises JunosSessionLostError straight away rather than at its timeout.
+        """
+        with self.session_lock:
+            start = time.monotonic()
+            try:
+                return rpc(*args, **kwargs)
+            except Exception as e:
+                if not is_session_lost(e):
+                    raise
+                error = (f'The session to {self.host} was lost {time.monotonic() - start:.0f} seconds into '
+                         f'{rpc_name}. Error: {type(e).__name__}: {e}')
+                self.logger.info(error)
+                raise JunosSessionLostError(error) from e
+
+    def _profiled_reply(self, response, event: dict):
+        # PyEZ does not expose the size of the reply on the wire so the size of the parsed reply is recorded
+        if self.profiler.enabled and isinstance(response, (etree._Element, etree._ElementTree)):
+            event['bytes'] = len(etree.tostring(response))
+        return response
+
+    def show_chassis_routing_engine(self, *args, use_cache: bool = True, **kwargs) -> etree.ElementTree:
+        return self._rpc('get_route_engine_information', *args, use_cache=use_cache, **kwargs)
 
     def show_bgp_summary_for_bgp_group_name(self, group_name) -> etree.ElementTree:
-        return self.device.rpc.get_bgp_summary_information(group=group_name)
+        return self._rpc('get_bgp_summary_information', group=group_name)
 
     def show_bgp_summary(self) -> etree.ElementTree:
-        return self.device.rpc.get_bgp_summary_information()
+        return self._rpc('get_bgp_summary_information')
 
-    def show_task_replication(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_routing_task_replication_state(*args, **kwargs)
+    def show_task_replication(self, *args, use_cache: bool = True, **kwargs) -> etree.ElementTree:
+        return self._rpc('get_routing_task_replication_state', *args, use_cache=use_cache, **kwargs)
 
     def show_version(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_software_information(*args, **kwargs)
+        return self._rpc('get_software_information', *args, **kwargs)
 
     def show_vmhost_hardware(self, slot: int) -> etree.ElementTree:
         if slot == 0:
-            return self.device.rpc.get_vmhost_hardware(re0=True)
+            return self._rpc('get_vmhost_hardware', re0=True)
         elif slot == 1:
-            return self.device.rpc.get_vmhost_hardware(re1=True)
+            return self._rpc('get_vmhost_hardware', re1=True)
 
-    def show_isis_adjacency(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_isis_adjacency_information(*args, **kwargs)
+    def show_isis_adjacency(self, *args, use_cache: bool = True, **kwargs) -> etree.ElementTree:
+        return self._rpc('get_isis_adjacency_information', *args, use_cache=use_cache, **kwargs)
 
     def show_ospf_neighbor(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_ospf_neighbor_information(*args, **kwargs)
+        return self._rpc('get_ospf_neighbor_information', *args, **kwargs)
 
     def show_chassis_fpc_pic_status(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_pic_information(*args, **kwargs)
+        return self._rpc('get_pic_information', *args, **kwargs)
 
     def show_chassis_alarms(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_alarm_information(*args, **kwargs)
+        return self._rpc('get_alarm_information', *args, **kwargs)
 
     def show_configuration(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_config(*args, **kwargs)
+        return self._rpc('get_config', *args, **kwargs)
 
     def show_chassis_hardware(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_chassis_inventory(*args, **kwargs)
+        return self._rpc('get_chassis_inventory', *args, **kwargs)
 
     def show_bgp_summary(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_bgp_summary_information(*args, **kwargs)
+        return self._rpc('get_bgp_summary_information', *args, **kwargs)
 
     def show_interfaces(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_interface_information(*args, **kwargs)
+        return self._rpc('get_interface_information', *args, **kwargs)
 
     def show_subscribers(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_subscribers(*args, **kwargs)
+        return self._rpc('get_subscribers', *args, **kwargs)
+
+    def stream_subscribers(self, timeout: int = 300, **options):
+        """
+        Yields each subscriber element of get-subscribers as soon as it has been received. See
+        stream_rpc_elements.
+        """
+        return self.stream_rpc_elements(self._build_rpc('get_subscribers', options), 'subscriber', timeout=timeout)
+
+    @staticmethod
+    def _build_rpc(rpc_name: str, options: dict) -> etree.Element:
+        """
+        Builds the request element of rpc_name the way PyEZ does: every option becomes a child
+        element, empty for options set to True. dev_timeout only applies to the PyEZ session.
+        """
+        rpc = etree.Element(rpc_name.replace('_', '-'))
+        for option, value in options.items():
+            if option == 'dev_timeout':
+                continue
+            child = etree.SubElement(rpc, option.replace('_', '-'))
+            if value is not True:
+                child.text = str(value)
+        return rpc
+
+    def _ssh_client(self) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(self.host, port=int(self.port), username=self.username, password=self.password,
+                       timeout=30, look_for_keys=False, allow_agent=False)
+        return client
+
+    @contextmanager
+    def _netconf_session(self, timeout: int, chunk_size: int = 65536):
+        """
+        Opens a NETCONF 1.0 session of its own to the device, next to the PyEZ session, and yields
+        the SSH client, the channel and any data received after the server hello.
+        """
+        client = self._ssh_client()
+        try:
+            channel = client.get_transport().open_session()
+            channel.settimeout(timeout)
+            channel.invoke_subsystem('netconf')
+            # only advertise base:1.0 so that the reply uses end of message framing
+            hello = ('<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+                     '<capability>urn:ietf:params:netconf:base:1.0</capability></capabilities></hello>')
+            channel.sendall(hello.encode() + NetconfReplyStream.DELIMITER)
+            server_hello = b''
+            while NetconfReplyStream.DELIMITER not in server_hello:
+                data = channel.recv(chunk_size)
+                if not data:
+                    raise JunosConnectError(f'NETCONF session to {self.host} closed before hello')
+                server_hello += data
+            yield client, channel, server_hello.split(NetconfReplyStream.DELIMITER, 1)[1]
+        finally:
+            client.close()
+
+    def stream_rpc_elements(self, rpc: etree.Element, tag: str, timeout: int = 300, chunk_size: int = 65536):
+        """
+        Runs rpc on a NETCONF session of its own and yields each `tag` element of the reply while
+        the reply is still arriving. PyEZ reads the whole reply into one DOM before returning, which
+        for very large replies, e.g. the subscriber detail of a BNG, costs hundreds of MB.
+        Each element is only valid until the next one is requested and must not be kept.
+        """
+        with self.profiler.span(f'stream {rpc.tag}', 'rpc', host=self.host) as event, \
+                self._netconf_session(timeout, chunk_size) as (client, channel, leftover):
+            request = (b'<rpc message-id="1" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+                       + etree.tostring(rpc) + b'</rpc>')
+            channel.sendall(request + NetconfReplyStream.DELIMITER)
+            stream = NetconfReplyStream(tag)
+            data = leftover
+            event['bytes'] = 0
+            while not stream.complete:
+                if data:
+                    event['bytes'] += len(data)
+                    yield from stream.feed(data)
+                if stream.complete:
+                    break
+                data = channel.recv(chunk_size)
+                if not data:
+                    raise JunosConnectError(f'NETCONF session to {self.host} closed before the reply was complete')
+
+    def prefetch_rpcs(self, calls: list, timeout: int = 300, chunk_size: int = 65536) -> dict:
+        """
+        Sends every RPC of calls, a list of (rpc_name, kwargs) pairs, back to back on a NETCONF session
+        of its own and only then reads the replies, so the whole set costs one round trip instead of one
+        per RPC. Each reply is kept until the first call of the same RPC with the same arguments, which
+        returns it instead of running the RPC. Calls already in the RPC cache are not sent and replies
+        that contain an rpc-error are not kept, so those RPCs run as usual.
+        Returns the number of RPCs sent, the time taken, the round trip time, the time taken to open the
+        session of its own and an estimate of the time saved over sending the RPCs one after the other on
+        the PyEZ session, all in seconds. The saving is the round trips avoided less the session setup, so
+        it is negative when opening the session cost more than the pipelining saved.
+        """
+        with self.cache_lock:
+            calls = [(rpc_name, kwargs) for rpc_name, kwargs in calls
+                     if self._cache_key(rpc_name, (), kwargs) not in self.cache]
+        if len(calls) == 0:
+            return {'rpcs': 0, 'seconds': 0.0, 'round_trip_seconds': 0.0, 'setup_seconds': 0.0, 'saved_seconds': 0.0}
+
+        start = time.monotonic()
+        with self.profiler.span('prefetch_rpcs', 'rpc', host=self.host, rpcs=len(calls)) as event, \
+                self._netconf_session(timeout, chunk_size) as (client, channel, leftover):
+            # the SSH handshake and NETCONF hello are paid on every batch and not on the PyEZ session
+            setup = time.monotonic() - start
+
+            # an SSH keepalive is answered by the SSH server straight away so it times one round trip
+            start = time.monotonic()
+            client.get_transport().global_request('keepalive@openssh.com', wait=True)
+            round_trip = time.monotonic() - start
+
+            start = time.monotonic()
+            request = b''
+            for message_id, (rpc_name, kwargs) in enumerate(calls, 1):
+                request += (f'<rpc message-id="{message_id}" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'.encode()
+                            + etree.tostring(self._build_rpc(rpc_name, kwargs)) + b'</rpc>' + NetconfReplyStream.DELIMITER)
+            channel.sendall(request)
+
+            # only the bytes received since the last scan are searched for a delimiter, so a reply of
+            # hundreds of MB, e.g. the subscriber detail of a BNG, is read in linear time
+            replies = []
+            data = bytearray(leftover)
+            scan = 0
+            while len(replies) < len(calls):
+                end = data.find(NetconfReplyStream.DELIMITER, scan)
+                if end >= 0:
+                    replies.append(bytes(data[:end]))
+                    del data[:end + len(NetconfReplyStream.DELIMITER)]
+                    scan = 0
+                    continue
+                scan = max(len(data) - len(NetconfReplyStream.DELIMITER) + 1, 0)
+                chunk = channel.recv(chunk_size)
+                if not chunk:
+                    raise JunosConnectError(f'NETCONF session to {self.host} closed before all replies were received')
+                data += chunk
+            seconds = time.monotonic() - start
+            event['bytes'] = sum(len(reply) for reply in replies)
+
+        prefetched = {}
+        for reply in replies:
+            reply = remove_namespaces_and_spaces(etree.fromstring(reply.strip(), etree.XMLParser(huge_tree=True)))
+            message_id = int(reply.get('message-id', 0))
+            if not 1 <= message_id <= len(calls) or reply.find('.//rpc-error') is not None:
+                continue
+            rpc_name, kwargs = calls[message_id - 1]
+            # PyEZ returns the first child of the rpc-reply, or True if there is none
+            prefetched[self._cache_key(rpc_name, (), kwargs)] = reply[0] if len(reply) else True
+        with self.cache_lock:
+            self.prefetched.update(prefetched)
+
+        saved = round_trip * (len(calls) - 1) - setup
+        return {'rpcs': len(calls), 'seconds': seconds, 'round_trip_seconds': round_trip, 'setup_seconds': setup,
+                'saved_seconds': saved}
 
     def show_l2circuit_connections(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_l2ckt_connection_information(*args, **kwargs)
+        return self._rpc('get_l2ckt_connection_information', *args, **kwargs)
 
     def show_ldp_session(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_ldp_session_information(*args, **kwargs)
+        return self._rpc('get_ldp_session_information', *args, **kwargs)
 
     def show_route_summary(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_route_summary_information(*args, **kwargs)
+        return self._rpc('get_route_summary_information', *args, **kwargs)
 
     def show_bfd_session(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_bfd_session_information(*args, **kwargs)
+        return self._rpc('get_bfd_session_information', *args, **kwargs)
+
+    @contextmanager
+    def sftp(self):
+        """
+        Yields an SFTP client on the SSH connection of the PyEZ session, or on a connection of its own
+        if the session is not open.
+        """
+        transport = getattr(getattr(self.device._conn, '_session', None), '_transport', None)
+        if transport is not None and transport.is_active():
+            client, sftp = None, paramiko.SFTPClient.from_transport(transport)
+        else:
+            client = self._ssh_client()
+            sftp = client.open_sftp()
+        try:
+            yield sftp
+        finally:
+            sftp.close()
+            if client is not None:
+                client.close()
+
+    def file_stat(self, path: str) -> dict:
+        """
+        Returns the type, size and date of a single file on the RE, or None if there is no such file.
+        Only the file is listed, not its directory, which on /var/tmp may hold thousands of files.
+        """
+        return self._cached('file_stat', self.fs.stat, (path,), {})
+
+    def file_checksum(self, path: str, algorithm: str = 'sha256') -> str:
+        """
+        Returns the checksum of a file on the RE, calculated on the box.
+        """
+        if algorithm not in self.CHECKSUM_RPCS:
+            raise ValueError(f"Unknown checksum algorithm: {algorithm}")
+        return self._cached('file_checksum', self._file_checksum, (path, algorithm), {})
+
+    def _file_checksum(self, path: str, algorithm: str) -> str:
+        checksum = getattr(self.device.rpc, self.CHECKSUM_RPCS[algorithm])(path=path).findtext('.//checksum')
+        return checksum.strip() if checksum is not None else None
+
+    def file_changed(self, path: str, checksum: str = None, algorithm: str = 'sha256'):
+        """
+        Drops the cached status and checksums of a file written on the RE, and caches its checksum if it
+        is known, e.g. verified when the file was staged, so it is not calculated again.
+        """
+        with self.cache_lock:
+            self.cache.pop(self._cache_key('file_stat', (path,), {}), None)
+            for name in self.CHECKSUM_RPCS:
+                self.cache.pop(self._cache_key('file_checksum', (path, name), {}), None)
+            if checksum is not None and self.cache_phase is not None:
+                self.cache[self._cache_key('file_checksum', (path, algorithm), {})] = checksum
 
     def copy_file_rpc(self, source_path: str, dest_path: str) -> bool:
         return self.fs.cp(source_path, dest_path)
 
     def request_vmhost_snapshot(self, slot: int) -> etree.Element:
         if slot == 0:
-            return self.device.rpc.get_vmhost_snapshot_information(re0=True)
+            return self._rpc('get_vmhost_snapshot_information', re0=True)
         if slot == 1:
-            return self.device.rpc.get_vmhost_snapshot_information(re1=True)
+            return self._rpc('get_vmhost_snapshot_information', re1=True)
         else:
             raise ValueError("Slot must be an int of 0 or 1")
 
     def show_vmhost_version_information(self, *args, **kwargs) -> etree.ElementTree:
-        return self.device.rpc.get_vmhost_version_information(*args, **kwargs)
+        return self._rpc('get_vmhost_version_information', *args, **kwargs)
 
     def request_chassis_routing_engine_master_switch(self, *args, **kwargs) -> etree.Element:
-        return self.device.rpc.request_chassis_routing_engine_switch(*args, **kwargs)
+        self.invalidate_cache('switchover')
+        return self._rpc('request_chassis_routing_engine_switch', *args, **kwargs)
 
     def request_vmhost_software_validate(self, package) -> str:
-        validation_resp = self.device.rpc.request_vmhost_package_validate(
+        validation_resp = self._rpc(
+                'request_vmhost_package_validate',
                 {'format': 'text'},
                 package_name=package,
                 dev_timeout=600,
@@ -147,15 +691,18 @@ class RpcCaller:
         return etree.tostring(validation_resp, encoding='unicode', pretty_print='True')
 
     def request_vmhost_snapshot(self) -> etree.Element:
-        return self.device.rpc.request_vmhost_snapshot(dev_timeout=360, ignore_warning=True)
+        return self._rpc('request_vmhost_snapshot', dev_timeout=360, ignore_warning=True)
 
     def request_vmhost_software_add(self, *args, **kwargs) -> etree.Element:
-        return self.device.rpc.request_vmhost_package_add(*args, **kwargs)
+        return self._rpc('request_vmhost_package_add', *args, **kwargs)
 
     def request_vmhost_reboot_re(self, re_number: int) -> etree.Element:
-        if re_number == 0:
-            return self.device.rpc.request_vmhost_reboot(re0=True, dev_timeout=900)
-        elif re_number == 1:
-            return self.device.rpc.request_vmhost_reboot(re1=True, dev_timeout=900)
-        else:
+        self.invalidate_cache('reboot')
+        if re_number not in (0, 1):
             raise ValueError("RE number must be an int of 0 or 1")
+        try:
+            return self._rpc('request_vmhost_reboot', **{f're{re_number}': True}, dev_timeout=900)
+        except JunosSessionLostError:
+            # the RE went down before it replied, so the reboot is under way
+            self.logger.info(f'The session to {self.host} closed while RE{re_number} rebooted')
+            return None
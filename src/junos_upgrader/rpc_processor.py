@@ -2,14 +2,36 @@
 Copyright (c) Juniper Networks 2024
 Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
 """
-import re, time, sys, difflib
+import time, sys
 from lxml import etree
 from jnpr.junos.utils.config import Config, ConfigLoadError
 from rpc_caller import RpcCaller
+from config_diff import config_set_lines, diff_config_lines, write_config_diff
+from state_diff import diff_state
+from package_staging import stage_package
+from poller import Poller
+from notifications import NotificationWaiter, MASTERSHIP, ADJACENCY
+from profiler import RunProfiler, profiled
 from junos_upgrader_exceptions import *
 
 
 class RpcProcessor:
+    # the RPCs, with the arguments the record_* methods use, that record_state can fetch in one batch
+    STATE_CAPTURE_RPCS = [
+        ('get_chassis_inventory', {}),
+        ('get_isis_adjacency_information', {'detail': True}),
+        ('get_ospf_neighbor_information', {'extensive': True}),
+        ('get_bgp_summary_information', {}),
+        ('get_interface_information', {'terse': True}),
+        ('get_ldp_session_information', {}),
+        ('get_routing_task_replication_state', {}),
+        ('get_bfd_session_information', {}),
+        ('get_pic_information', {}),
+        ('get_alarm_information', {}),
+        ('get_l2ckt_connection_information', {}),
+        ('get_route_summary_information', {}),
+    ]
+
     def __init__(self, logger, upgrade_error_log, upgrade_warning_log, **kwargs):
         self.logger = logger
         self.upgrade_error_log = upgrade_error_log
@@ -20,17 +42,35 @@ class RpcProcessor:
         self.port = kwargs["port"]
         self.connection_retries = kwargs["connection_retries"]
         self.connection_retry_interval = kwargs["connection_retry_interval"]
+        self.profiler = kwargs.get("profiler") or RunProfiler(enabled=False)
 
-        self.dev = RpcCaller(
-                host=self.host,
-                username=self.username,
-                password=self.password,
-                port=self.port,
-                logger=self.logger,
-                connection_retries=self.connection_retries,
-                connection_retry_interval=self.connection_retry_interval)
+        self.session_pool = kwargs.get("session_pool")
 
-        self.dev.open()
+        caller_kwargs = dict(
+                connection_retries=self.connection_retries,
+                connection_retry_interval=self.connection_retry_interval,
+                profiler=self.profiler,
+                connection_max_retry_interval=kwargs.get("connection_max_retry_interval", 60),
+                connection_deadline=kwargs.get("connection_deadline"),
+                keepalive_interval=kwargs.get("keepalive_interval", 10),
+                keepalive_count=kwargs.get("keepalive_count", 3))
+
+        if self.session_pool is not None:
+            # share the session to the host with every other processor using the pool
+            self.dev = self.session_pool.acquire(self.host, self.username, self.password, self.port, self.logger,
+                                                 **caller_kwargs)
+        else:
+            self.dev = RpcCaller(
+                    host=self.host,
+                    username=self.username,
+                    password=self.password,
+                    port=self.port,
+                    logger=self.logger,
+                    **caller_kwargs)
+            self.dev.open()
+
+        if kwargs.get("notifications"):
+            self.subscribe_notifications()
 
     def __str__(self):
         return (f"Instance of RpcProcessor("
@@ -45,6 +85,25 @@ class RpcProcessor:
                 f" connection_retry_interval: {self.connection_retry_interval},"
                 f" DeviceRpc object: {self.dev})")
 
+    def close(self):
+        """
+        Closes the session, or hands it back to the session pool it came from.
+        """
+        if self.session_pool is not None:
+            self.session_pool.release(self.dev)
+        else:
+            self.dev.close()
+
+    def use_logs(self, logger, upgrade_error_log, upgrade_warning_log):
+        """
+        Points the processor and its RpcCaller at another logger and error/warning logs, e.g. the
+        shared ones once checks that ran on a worker thread with their own logs have been merged.
+        """
+        self.logger = logger
+        self.dev.logger = logger
+        self.upgrade_error_log = upgrade_error_log
+        self.upgrade_warning_log = upgrade_warning_log
+
     def get_config_as_etree(self):
         try:
             return self.dev.show_configuration({'database': 'committed'})
@@ -55,10 +114,11 @@ class RpcProcessor:
 
     def get_config_in_set_format(self):
         try:
-            config = self.dev.show_configuration(options={'database':'committed', 'format':'set'})
-            config = etree.tostring(config, encoding='unicode', pretty_print='True')
-            config = config.replace("set", "\nset")  # etree response is missing \n's so need to add
-            return config
+            # normalising the reply would turn the line breaks between the set lines into spaces
+            config = self.dev.show_configuration(options={'database':'committed', 'format':'set'}, normalize=False)
+            if config is None:
+                raise ValueError('No configuration returned')
+            return '\n'.join(config_set_lines(config))
         except Exception as e:
             error = f'\u274C ERROR: Unable to get configuration. Exception: {e}'
             self.logger.error(error)
@@ -85,7 +145,7 @@ class RpcProcessor:
         self.logger.info('Verify no major alarms on chassis')
         try:
             alarm_list = []
-            chass_alms = self.dev.show_chassis_alarms({})
+            chass_alms = self.dev.show_chassis_alarms()
             if chass_alms.find('alarm-summary/no-active-alarms') is not None:
                 self.logger.info('No alarms on chassis. \u2705')
                 return True
@@ -112,7 +172,7 @@ class RpcProcessor:
         self.logger.info('Verify no alarms on chassis')
         try:
             alarm_list = []
-            chass_alms = self.dev.show_chassis_alarms({})
+            chass_alms = self.dev.show_chassis_alarms()
             if chass_alms.find('alarm-summary/no-active-alarms') is not None:
                 self.logger.info('No alarms on chassis. \u2705')
                 return True
@@ -134,28 +194,40 @@ class RpcProcessor:
             self.logger.error(error)
             self.upgrade_error_log.append(error)
 
-    def verify_re_mastership(self, slot: int, tries: int) -> bool:
+    @profiled('wait')
+    def verify_re_mastership(self, slot: int, timeout: int = 0) -> bool:
+        """
+        Verifies the RE is master, polling it for up to timeout seconds, e.g. after a switchover.
+        """
         self.logger.info(f'Verifying RE{str(slot)} is master')
-        try:
-            for i in range(1, tries + 1):
-                self.logger.info(f'Checking if RE{str(slot)} is master. Attempt {i} of {self.connection_retries}')
-                re_info = self.dev.show_chassis_routing_engine(slot=str(slot))
-                state = re_info.find('route-engine/mastership-state').text
-                if state != 'master':
-                    if i == 1:
-                        error = f'\u274C ERROR: RE{str(slot)} is not master'
-                        self.logger.error(error)
-                        self.upgrade_error_log.append(error)
-                        break
-                    self.logger.info(f'RE{str(slot)} is not yet master. Re-trying in 30 seconds')
-                    time.sleep(30)
-                else:
-                    self.logger.info(f'RE{str(slot)} is master. \u2705')
-                    return True
-        except Exception as e:
-            error = f'\u274C ERROR: Unable to verify that RE{str(slot)} is master. Exception: {e}'
-            self. logger.error(error)
-            self.upgrade_error_log.append(error)
+        poller = Poller(timeout, sleep=self.notification_waiter(MASTERSHIP).sleep)
+
+        def on_retry(attempt: int, wait: float):
+            state = poller.error if poller.error is not None else f'mastership: {poller.result}'
+            self.logger.info(f'RE{str(slot)} is not yet master. Attempt {attempt}: {state}. Re-trying in {wait:.0f} seconds')
+
+        # a one-off check shares the cached reply of the other RE checks, only polls need a fresh one
+        use_cache = not timeout
+        if poller.poll(lambda: self.re_mastership_state(slot, use_cache), lambda state: state == 'master', on_retry=on_retry):
+            self.logger.info(f'RE{str(slot)} is master. \u2705')
+            return True
+        if poller.error is not None:
+            error = f'\u274C ERROR: Unable to verify that RE{str(slot)} is master. Exception: {poller.error}'
+        elif timeout:
+            error = f'\u274C ERROR: RE{str(slot)} is not master after {timeout} seconds'
+        else:
+            error = f'\u274C ERROR: RE{str(slot)} is not master'
+        self.logger.error(error)
+        self.upgrade_error_log.append(error)
+        return False
+
+    def re_mastership_state(self, slot: int, use_cache: bool = False) -> str:
+        """
+        Probes the mastership of the RE. Only the RE in slot is fetched, and only from the RPC cache if
+        use_cache is set.
+        """
+        re_info = self.dev.show_chassis_routing_engine(slot=str(slot), use_cache=use_cache)
+        return re_info.findtext('route-engine/mastership-state')
 
     def verify_re_model(self, re_model: str, slot: int):
         self.logger.info(f'Verify model version of RE{str(slot)}')
@@ -256,22 +328,11 @@ class RpcProcessor:
             self.logger.error(error)
             self.upgrade_error_log.append(error)
 
-    def verify_protocol_replication(self, show_errors: bool = True):
+    def verify_protocol_replication(self, show_errors: bool = True, use_cache: bool = True):
         self.logger.info('Verify protocol replication')
         try:
-            replication_state = self.dev.show_task_replication()
-            protocols = []
-            states = []
-            # Todo - Fix list expression
-            # protocols = [protocols.append(protocol.text) for protocol in replication_state.findall('task-protocol-replication-name')]
-            # states = [states.append(state.text) for state in replication_state.findall('task-protocol-replication-state')]
-            # state_dict = dict(zip(protocols, states))
-
-            for protocol in replication_state.findall('task-protocol-replication-name'):
-                protocols.append(protocol.text)
-            for state in replication_state.findall('task-protocol-replication-state'):
-                states.append(state.text)
-            state_dict = dict(zip(protocols, states))
+            replication_state = self.dev.show_task_replication(use_cache=use_cache)
+            state_dict = self.replication_states(replication_state)
 
             state_error = False
             for protocol, state in state_dict.items():
@@ -300,6 +361,22 @@ class RpcProcessor:
             self.logger.error(error)
             self.upgrade_error_log.append(error)
 
+    @staticmethod
+    def replication_states(replication_state) -> dict:
+        """
+        Returns the replication state of each protocol in a get-routing-task-replication-state reply.
+        """
+        return dict(zip([protocol.text for protocol in replication_state.findall('task-protocol-replication-name')],
+                        [state.text for state in replication_state.findall('task-protocol-replication-state')]))
+
+    def protocol_replication_state(self) -> tuple:
+        """
+        Probes protocol replication. Returns the state of stateful replication, e.g. Enabled, and the
+        state of each protocol.
+        """
+        replication_state = self.dev.show_task_replication(use_cache=False)
+        return replication_state.findtext('task-gres-state'), self.replication_states(replication_state)
+
     def verify_pic_status(self):
         self.logger.info('Verify PIC status')
         try:
@@ -357,31 +434,80 @@ class RpcProcessor:
         self.logger.debug(f'Junos package path: {junos_package_path}')
         self.logger.debug(f'Proposed package name: {proposed_package_name}')
         try:
-            re_files = self.dev.fs.ls(path=junos_package_path)
-            file_exists = False
-            for file in re_files['files']:
-                if file == proposed_package_name:
-                    self.logger.info(f'RE{str(slot)} has the new Junos package: {proposed_package_name} in {junos_package_path}. \u2705')
-                    file_exists = True
-                    break
-            if not file_exists:
+            package = self.dev.file_stat(f'{junos_package_path.rstrip("/")}/{proposed_package_name}')
+            if package is None or package['type'] == 'dir':
                 error = f'\u274C ERROR: RE{str(slot)} does not have the new Junos package {proposed_package_name} in {junos_package_path}'
                 self.logger.error(error)
                 self.upgrade_error_log.append(error)
                 return False
+            if package['size'] == 0:
+                error = f'\u274C ERROR: The new Junos package {proposed_package_name} in {junos_package_path} on RE{str(slot)} is empty'
+                self.logger.error(error)
+                self.upgrade_error_log.append(error)
+                return False
+            self.logger.info(f'RE{str(slot)} has the new Junos package: {proposed_package_name} in {junos_package_path}, '
+                             f'{package["size"]} bytes, dated {package["ts_date"]}. \u2705')
+            return True
+        except Exception as e:
+            error = f'\u274C ERROR: Unable to verify that new Junos package exists on RE{str(slot)}. Exception: {e}'
+            self.logger.error(error)
+            self.upgrade_error_log.append(error)
+
+    def stage_junos_package(self, local_package: str, junos_package_path: str, package_name: str, slot: int,
+                            checksum: str = None, bandwidth_limit: float = None):
+        """
+        Copies the local package to the RE unless it is already there with the right checksum. See
+        package_staging.stage_package. Returns None if there is no local package to stage.
+        """
+        if not local_package:
+            return None
+        self.logger.info(f'Staging {package_name} on RE{str(slot)}')
+        try:
+            result = stage_package(self.dev, local_package, junos_package_path, package_name, checksum,
+                                   bandwidth_limit=bandwidth_limit)
+            if result['status'] == 'present':
+                self.logger.info(f'RE{str(slot)} already has an intact copy of {package_name}. \u2705')
             else:
+                self.logger.info(f'Staged {package_name} on RE{str(slot)}: {result["bytes_sent"]} bytes sent from '
+                                 f'byte {result["resumed_from"]} in {result["seconds"]:.0f} seconds. \u2705')
+            return True
+        except Exception as e:
+            error = f'\u274C ERROR: Unable to stage {package_name} on RE{str(slot)}. Exception: {e}'
+            self.logger.error(error)
+            self.upgrade_error_log.append(error)
+            return False
+
+    def verify_junos_package_checksum(self, junos_package_path: str, proposed_package_name: str, checksum: str,
+                                      slot: int, algorithm: str = 'sha256'):
+        """
+        Verifies the checksum of the package on the RE, calculated on the box, so a truncated or corrupt
+        package fails the pre-checks rather than the install. Returns None if no checksum is given.
+        """
+        if not checksum:
+            self.logger.info(f'No checksum given for {proposed_package_name}. Its checksum on RE{str(slot)} is not verified')
+            return None
+        self.logger.info(f'Verify {algorithm} checksum of {proposed_package_name} on RE{str(slot)}')
+        try:
+            on_box_checksum = self.dev.file_checksum(f'{junos_package_path.rstrip("/")}/{proposed_package_name}', algorithm)
+            if on_box_checksum == checksum.lower():
+                self.logger.info(f'The {algorithm} checksum of {proposed_package_name} on RE{str(slot)} matches. \u2705')
                 return True
+            error = (f'\u274C ERROR: The {algorithm} checksum of {proposed_package_name} on RE{str(slot)} is '
+                     f'{on_box_checksum}, expected {checksum}')
+            self.logger.error(error)
+            self.upgrade_error_log.append(error)
+            return False
         except Exception as e:
-            error = f'\u274C ERROR: Unable to verify that new Junos package exists on RE{str(slot)}. Exception: {e}'
+            error = f'\u274C ERROR: Unable to verify the checksum of {proposed_package_name} on RE{str(slot)}. Exception: {e}'
             self.logger.error(error)
             self.upgrade_error_log.append(error)
+            return False
 
     def verify_number_of_disks_on_re(self, slot: int, expected_disks: int):
         self.logger.info(f'Verify number of disks on RE{str(slot)}')
         try:
             info = self.dev.show_vmhost_version_information({'format': 'text'})
-            info = etree.tostring(info, encoding='unicode', pretty_print='True')
-            disk_count = sum(1 for _ in re.finditer("Junos Disk", info))
+            disk_count = sum(line.count("Junos Disk") for line in self.reply_messages(info))
             if disk_count == 2:
                 self.logger.info('RE has 2 disks. \u2705')
                 return True
@@ -399,7 +525,7 @@ class RpcProcessor:
         self.logger.info("Verify number of 'Up' ISIS adjacencies")
         try:
             adjacency_count = 0
-            isis_info = self.dev.show_isis_adjacency()
+            isis_info = self.dev.show_isis_adjacency(detail=True)
             if isis_info.findall('isis-adjacency') is not None:
                 for adjacency in isis_info.findall('isis-adjacency'):
                     if adjacency.find('adjacency-state').text == 'Up':
@@ -444,7 +570,7 @@ class RpcProcessor:
         try:
             isis_list = []
             isis_adj_info = self.dev.show_isis_adjacency(detail=True)
-            if isis_adj_info is not None and "ISIS instance is not running" in etree.tostring(isis_adj_info, pretty_print=True, encoding='unicode'):
+            if isis_adj_info is not None and self.reply_contains(isis_adj_info, "ISIS instance is not running"):
                 record['isis-adjacency-info'] = "ISIS is not running"
                 return
             elif isis_adj_info is not None and isis_adj_info.findall('isis-adjacency') is not None:
@@ -465,7 +591,7 @@ class RpcProcessor:
         try:
             ospf_list = []
             ospf_neighbor_info = self.dev.show_ospf_neighbor(extensive=True)
-            if ospf_neighbor_info is not None and "OSPF instance is not running" in etree.tostring(ospf_neighbor_info, pretty_print=True, encoding='unicode'):
+            if ospf_neighbor_info is not None and self.reply_contains(ospf_neighbor_info, "OSPF instance is not running"):
                 record['ospf-neighbor-info'] = "OSPF is not running"
                 self.logger.info('OSPF neighbor info recorded. \u2705')
                 return
@@ -504,12 +630,8 @@ class RpcProcessor:
         try:
             replication_state_list = []
             replication_state = self.dev.show_task_replication()
-            if replication_state.findall('task-protocol-replication-name') is not None:
-                list_of_state_items = list(replication_state)
-                for item in list_of_state_items:
-                    if item.tag == 'task-protocol-replication-name':
-                        index = list_of_state_items.index(item)
-                        replication_state_list.append({item.text:list_of_state_items[index+1].text})
+            for item in replication_state.findall('task-protocol-replication-name'):
+                replication_state_list.append({item.text: item.getnext().text})
             record['replication-state'] = replication_state_list
             self.logger.info('Protocol replication state recorded. \u2705')
         except Exception as e:
@@ -585,23 +707,23 @@ class RpcProcessor:
             self.logger.error(error)
             self.upgrade_error_log.append(error)
 
-    def record_subscriber_count_for_each_subscriber_type(self, record: dict):
+    def record_subscriber_count_for_each_subscriber_type(self, record: dict, stream: bool = False):
+        """
+        Counts subscribers by access type. With stream=True the subscriber detail is parsed while it
+        arrives and each subscriber is dropped once counted, so memory stays flat on large BNGs.
+        """
         self.logger.info('Record subscriber count for each subscriber type')
         try:
-            subs = self.dev.show_subscribers(detail=True, dev_timeout=300)
-            sub_type_counts = {}
-            if subs.findall('subscriber') is not None:
-                for sub in subs.findall('subscriber'):
-                    key = sub.find('access-type').text.lower()
-                    if key not in sub_type_counts.keys():
-                        sub_type_counts[key] = 1
-                    else:
-                        sub_type_counts[key] += 1
-                record['subscriber-count-per-type'] = sub_type_counts
-                self.logger.info('Subscriber type count recorded. \u2705')
+            if stream:
+                subscribers = self.dev.stream_subscribers(detail=True)
             else:
-                record['subscriber-count-per-type'] = 0
-                self.logger.info('Subscriber count is zero. \u2705')
+                subscribers = self.dev.show_subscribers(detail=True, dev_timeout=300).findall('subscriber')
+            sub_type_counts = {}
+            for sub in subscribers:
+                key = sub.findtext('{*}access-type').lower()
+                sub_type_counts[key] = sub_type_counts.get(key, 0) + 1
+            record['subscriber-count-per-type'] = sub_type_counts
+            self.logger.info('Subscriber type count recorded. \u2705')
         except Exception as e:
             error = f'\u274C ERROR: Unable to record subscriber count for each type. Exception: {e}'
             self.logger.error(error)
@@ -813,6 +935,48 @@ class RpcProcessor:
             self.logger.error(error)
             self.upgrade_error_log.append(error)
 
+    def record_state(self, record: dict, batch: bool = False, stream: bool = False):
+        """
+        Records the device state with every record_* method. With batch the capture RPCs are first
+        sent pipelined, so that they cost one round trip instead of one each, and each record_* method
+        then parses its reply from the batch. If the batch fails the methods fetch their own replies.
+        """
+        if batch:
+            calls = list(self.STATE_CAPTURE_RPCS)
+            if not stream:
+                calls.append(('get_subscribers', {'detail': True, 'dev_timeout': 300}))
+            self.logger.info(f'Capturing state with {len(calls)} pipelined RPCs')
+            try:
+                stats = self.dev.prefetch_rpcs(calls)
+                per_rpc = stats['saved_seconds'] / stats['rpcs'] * 1000 if stats['rpcs'] else 0
+                captured = (f'Captured {stats["rpcs"]} RPCs in {stats["seconds"]:.2f}s with a round trip time of '
+                            f'{stats["round_trip_seconds"] * 1000:.0f}ms and {stats["setup_seconds"]:.2f}s to open the session.')
+                if stats['saved_seconds'] > 0:
+                    self.logger.info(f'{captured} About {stats["saved_seconds"]:.2f}s, {per_rpc:.0f}ms per RPC, '
+                                     f'saved over the sequential path. \u2705')
+                else:
+                    self.logger.info(f'{captured} Opening the session cost {-stats["saved_seconds"]:.2f}s more than '
+                                     f'the sequential path. \u2705')
+            except Exception as e:
+                self.logger.warning(f'\u26A0\uFE0F WARNING: Unable to capture state in one batch. Capturing it RPC by RPC. Exception: {e}')
+        try:
+            self.record_chassis_hardware(record)
+            self.record_subscriber_count_for_each_subscriber_type(record, stream=stream)
+            self.record_isis_adjacency_info(record)
+            self.record_ospf_neighbor_info(record)
+            self.record_bgp_summary_info(record)
+            self.record_interface_state(record)
+            self.record_ldp_session_info(record)
+            self.record_protocol_replication_state(record)
+            self.record_bfd_session_info(record)
+            self.record_pic_info(record)
+            self.record_chassis_alarms(record)
+            self.record_l2_circuit_info(record)
+            self.record_route_summary(record)
+        finally:
+            self.dev.discard_prefetched()
+
+    @profiled('upgrade-step')
     def copy_file_on_device(self, source_path: str, dest_path: str):
         self.logger.info(f'Copying file from {source_path} to {dest_path}')
         try:
@@ -828,6 +992,7 @@ class RpcProcessor:
             self.logger.error(error)
             self.upgrade_error_log.append(error)
 
+    @profiled('upgrade-step')
     def load_and_commit_config_on_device(self, path: str, mode: str):
         self.logger.info(f'Loading and committing config {path}')
         try:
@@ -835,6 +1000,7 @@ class RpcProcessor:
                 cu.load(path=path, format='set', ignore_warning='statement not found')
                 self.logger.info('Loaded ok')
                 cu.commit(sync=True)
+                self.dev.invalidate_cache('commit')
                 self.logger.info('Config loaded and committed successfully. \u2705')
         except ConfigLoadError as e:
             error = (f'\u274C ERROR: There is a problem with one or more of the commands in file {path}'
@@ -847,6 +1013,7 @@ class RpcProcessor:
             self.logger.error(error)
             raise JunosConfigApplyError(error)
 
+    @profiled('upgrade-step')
     def create_rescue_config(self, mode: str):
         self.logger.info('Creating rescue config')
         try:
@@ -858,6 +1025,7 @@ class RpcProcessor:
             self.logger.error(error)
             raise JunosConfigRescueError(error)
 
+    @profiled('upgrade-step')
     def install_junos_on_device(self, junos_package_path: str, new_junos_package: str, re_number: int):
         self.logger.debug(f'Inputs are - junos_package_path: {junos_package_path}, new_junos_package: {new_junos_package}, re_number: {re_number}')
         self.logger.info(f'Installing {new_junos_package}. This may take up to 10 minutes.')
@@ -887,6 +1055,7 @@ class RpcProcessor:
             self.logger.error(error)
             raise JunosPackageInstallError(error)
 
+    @profiled('upgrade-step')
     def reboot_re(self, re_number: int):
         self.logger.info(f'Initiating reboot of RE{re_number}.')
         try:
@@ -897,6 +1066,7 @@ class RpcProcessor:
             self.logger.error(error)
             raise JunosRebootError(error)
 
+    @profiled('upgrade-step')
     def validate_junos_on_device(self, path: str, package: str):
         self.logger.info(f'Validating {package}. This may take several minutes.')
         try:
@@ -918,13 +1088,11 @@ class RpcProcessor:
             self.logger.error(error)
             raise JunosValidationError(error)
 
+    @profiled('upgrade-step')
     def check_matching_junos_on_partitions(self, image: str):
         self.logger.info(f'Checking that image: {image} exists on both partitions')
         try:
-            info = self.dev.show_vmhost_version_information({'format': 'text'})
-            info = etree.tostring(info, encoding='unicode', pretty_print='True')
-            matches = re.findall(image, info)
-            if len(matches) == 2:
+            if self.count_junos_image_on_partitions(image) == 2:
                 self.logger.info(f'Junos image {image} exists on both partitions. \u2705')
             else:
                 self.logger.error(f'\u274C ERROR: Junos image: {image} does not exist on both partitions')
@@ -933,11 +1101,25 @@ class RpcProcessor:
             error = f"\u26A0\uFE0F WARNING: Unable to confirm image on both partitions. Exception: {e}"
             self.logger.error(error)
 
+    def count_junos_image_on_partitions(self, image: str) -> int:
+        info = self.dev.show_vmhost_version_information({'format': 'text'})
+        return sum(line.count(image) for line in self.reply_messages(info))
+
+    def is_re_master(self, slot: int) -> bool:
+        try:
+            re_info = self.dev.show_chassis_routing_engine(slot=str(slot), use_cache=False)
+            return re_info.find('route-engine/mastership-state').text == 'master'
+        except Exception as e:
+            self.logger.debug(f'Unable to get mastership state of RE{str(slot)}. Exception: {e}')
+            return False
+
+    @profiled('upgrade-step')
     def re_switchover(self):
         try:
             resp = self.dev.request_chassis_routing_engine_master_switch(no_confirm=True, ignore_warning=True)
-            messages = resp.findall('message')
-            if "Complete" in messages[-1].text:
+            # PyEZ may return the messages as elements or as the text of the output element
+            messages = self.reply_messages(resp)
+            if "Complete" in messages[-1]:
                 self.logger.info('RE switchover initiated. \u2705')
             else:
                 error = f'\u274C ERROR: RE switchover initiation failed'
@@ -950,6 +1132,105 @@ class RpcProcessor:
             self.upgrade_error_log.append(error)
             raise JunosReSwitchoverError(error)
 
+    @profiled('wait')
+    def wait_for_re_ready(self, slot: int, timeout: int, initial_delay: int = 60, poll_interval: int = 5,
+                          max_poll_interval: int = 30, reopen_session: bool = True, expect_master: bool = False) -> bool:
+        """
+        Polls the RE until it is usable instead of waiting a fixed time. Each attempt runs the
+        cheapest check first: NETCONF port reachable, session open, get-software-information
+        answered, RE status OK (and RE is master if expect_master). The interval between attempts
+        doubles up to max_poll_interval. Raises JunosConnectError if the RE is not ready by timeout.
+        """
+        self.logger.info(f'Waiting up to {timeout} seconds for RE{str(slot)} to be ready')
+        start = time.monotonic()
+        time.sleep(min(initial_delay, timeout))
+        # after a switchover the session to the RE stays open, so it reports when it becomes master
+        waiter = self.notification_waiter(*((MASTERSHIP,) if expect_master else ()))
+        poller = Poller(max(timeout - (time.monotonic() - start), 0), interval=poll_interval,
+                        max_interval=max_poll_interval, sleep=waiter.sleep)
+        check = {'stage': None, 'reopen_session': reopen_session}
+
+        def probe() -> str:
+            # returns the check the RE did not pass, or None once it is ready
+            check['stage'] = 'port reachable'
+            try:
+                if not self.dev.port_is_open():
+                    return check['stage']
+                check['stage'] = 'session open'
+                if check['reopen_session'] or not self.dev.device.connected:
+                    self.dev.open(retries=1, reopen=check['reopen_session'])
+                    check['reopen_session'] = False
+                check['stage'] = 'software information'
+                if self.dev.show_version() is None:
+                    return check['stage']
+                check['stage'] = 'RE status'
+                re_info = self.dev.show_chassis_routing_engine(slot=str(slot), use_cache=False)
+                status = re_info.find('route-engine/status').text
+                mastership = re_info.find('route-engine/mastership-state').text
+                if status == 'OK' and (not expect_master or mastership == 'master'):
+                    return None
+                return f'RE status (status: {status}, mastership: {mastership})'
+            except Exception:
+                if check['stage'] in ('software information', 'RE status'):
+                    # a booting RE may drop a new session, so open another one on the next attempt
+                    check['reopen_session'] = True
+                raise
+
+        def reason() -> str:
+            if poller.error is not None:
+                return f'{check["stage"]} check failed. Error: {poller.error}'
+            return f'{poller.result} check not passed'
+
+        def on_retry(attempt: int, wait: float):
+            self.logger.info(f'RE{str(slot)} not ready. Attempt {attempt}: {reason()}. Re-trying in {round(wait)} seconds')
+
+        if poller.poll(probe, lambda stage: stage is None, on_retry=on_retry):
+            self.logger.info(f'RE{str(slot)} is ready after {round(time.monotonic() - start)} seconds. \u2705')
+            return True
+        error = f'\u274C ERROR: RE{str(slot)} was not ready after {timeout} seconds. Last check: {reason()}'
+        self.logger.error(error)
+        raise JunosConnectError(error)
+
+    @profiled('wait')
+    def wait_for_routing_convergence(self, min_isis_adjacencies: int, timeout: int, poll_interval: int = 5,
+                                     max_poll_interval: int = 30, stable_polls: int = 2) -> bool:
+        """
+        Polls ISIS until at least min_isis_adjacencies adjacencies are Up on stable_polls consecutive
+        polls, instead of waiting a fixed time for routing to converge. Logs a warning and returns
+        False if routing has not converged by timeout; the post-checks then report what is missing.
+        """
+        self.logger.info(f'Waiting up to {timeout} seconds for routing to converge')
+        poller = Poller(timeout, interval=poll_interval, max_interval=max_poll_interval,
+                        sleep=self.notification_waiter(ADJACENCY).sleep)
+        converged = {'polls': 0, 'adjacencies': None}
+
+        def probe() -> int:
+            try:
+                isis_info = self.dev.show_isis_adjacency(detail=True, use_cache=False)
+            except Exception:
+                converged['polls'] = 0
+                raise
+            adjacency_count = len([adjacency for adjacency in isis_info.findall('isis-adjacency')
+                                   if adjacency.findtext('adjacency-state') == 'Up'])
+            converged['adjacencies'] = adjacency_count
+            converged['polls'] = converged['polls'] + 1 if adjacency_count >= min_isis_adjacencies else 0
+            return adjacency_count
+
+        def on_retry(attempt: int, wait: float):
+            if poller.error is not None:
+                self.logger.info(f'Unable to get ISIS adjacencies. Error: {poller.error}')
+
+        if poller.poll(probe, lambda adjacency_count: converged['polls'] >= stable_polls, on_retry=on_retry):
+            self.logger.info(f'Routing converged after {round(poller.elapsed)} seconds with '
+                             f'{converged["adjacencies"]} ISIS Up adjacencies. \u2705')
+            return True
+        warning = (f'\u26A0\uFE0F WARNING: Routing had not converged after {timeout} seconds. '
+                   f'ISIS Up adjacencies: {converged["adjacencies"]}')
+        self.logger.error(warning)
+        self.upgrade_warning_log.append(warning)
+        return False
+
+    @profiled('upgrade-step')
     def request_vmhost_snapshot(self):
         self.logger.info('Creating vmhost snapshot. This may take several minutes:')
         try:
@@ -965,25 +1246,69 @@ class RpcProcessor:
             self.logger.error(error)
             self.upgrade_warning_log.append(error)
 
-    def confirm_replication_complete(self):
+    @profiled('wait')
+    def confirm_replication_complete(self, timeout: int = 600):
+        """
+        Polls protocol replication for up to timeout seconds until every protocol is Complete and OSPF or
+        ISIS is replicated. Logs a warning and returns False if it is not, and at once if stateful
+        replication is disabled, which waiting will not change.
+        """
+        self.logger.info(f'Waiting up to {timeout} seconds for protocol replication to complete')
+        poller = Poller(timeout)
+
+        def complete(result: tuple) -> bool:
+            _, states = result
+            return (('OSPF' in states or 'IS-IS' in states)
+                    and all(state == 'Complete' for state in states.values()))
+
+        def disabled(result: tuple) -> bool:
+            gres_state, _ = result
+            return gres_state == 'Disabled'
+
+        def on_retry(attempt: int, wait: float):
+            if poller.error is not None:
+                state = f'Error: {poller.error}'
+            else:
+                state = ', '.join(f'{protocol}: {state}' for protocol, state in poller.result[1].items()) or 'no protocols'
+            self.logger.info(f'Protocol replication not complete. Attempt {attempt}: {state}. Re-trying in {wait:.0f} seconds')
+
+        if poller.poll(self.protocol_replication_state, complete, stop=disabled, on_retry=on_retry):
+            self.logger.info(f'Protocol replication is complete after {poller.elapsed:.0f} seconds. \u2705')
+            return True
+        if poller.error is not None:
+            warning = f'\u26A0\uFE0F WARNING: Unable to confirm replication is complete. Exception: {poller.error}'
+        elif poller.stopped:
+            warning = '\u26A0\uFE0F WARNING: Stateful replication is disabled. Protocol replication will not complete'
+        else:
+            warning = f'\u26A0\uFE0F WARNING: Protocol replication not complete after {timeout} seconds'
+        self.logger.error(warning)
+        self.upgrade_warning_log.append(warning)
+        return False
+
+    ##################### Utility Methods #####################
+
+    def subscribe_notifications(self) -> bool:
+        """
+        Subscribes to the notifications of the RE, so that the waits for mastership and adjacencies
+        end as soon as the RE reports the change. Without them the waits only poll.
+        """
         try:
-            for i in range(1, self.connection_retries + 1):
-                self.logger.info(f'Checking protocol replication. Attempt {i} of {self.connection_retries}')
-                if not self.verify_protocol_replication(show_errors=False):
-                    self.logger.info('Protocol replication not complete. Re-trying in 20 seconds')
-                    time.sleep(20)
-                else:
-                    return True
-            self.upgrade_warning_log.append('\u26A0\uFE0F WARNING: "Protocol replication not complete')
+            self.dev.subscribe_notifications()
+            self.logger.info(f'Subscribed to notifications from {self.host}. \u2705')
+            return True
         except Exception as e:
-            error = f"\u26A0\uFE0F WARNING: Unable to confirm replication is complete. Exception: {e}"
-            self.logger.error(error)
-            self.upgrade_warning_log.append(error)
+            self.logger.info(f'Notifications are not available from {self.host}. Waits will poll only. Error: {e}')
+            return False
 
-    ##################### Utility Methods #####################
+    def notification_waiter(self, *kinds) -> NotificationWaiter:
+        return NotificationWaiter(self.dev.notifications, kinds)
 
     @staticmethod
-    def countdown_timer(seconds):
+    def countdown_timer(seconds, quiet=False):
+        if quiet:
+            # several upgrades share the console when run by the fleet upgrader
+            time.sleep(seconds)
+            return
         for remaining in range(seconds, 0, -1):
             sys.stdout.write("\r")
             sys.stdout.write(f"Time remaining: {remaining:2d} seconds")
@@ -991,45 +1316,30 @@ class RpcProcessor:
             time.sleep(1)
         sys.stdout.write("\n")
 
-    def compare_state_dicts(self, dict1, dict2, parent_key=""):
-        differences = {}
+    @staticmethod
+    def reply_messages(reply) -> list:
+        """
+        Returns the lines of the text output, messages and rpc-error messages of an RPC reply, e.g. the
+        text of a text format reply or "OSPF instance is not running". Only these elements are read, so
+        a large reply is not serialised or searched as a whole.
+        """
+        root = reply.getroot() if isinstance(reply, etree._ElementTree) else reply
+        elements = root.xpath('self::output | self::message | output | message | output/message | '
+                              'rpc-error/error-message | self::rpc-error/error-message')
+        # the text of a message inside an output element is read with the output element
+        elements = [element for element in elements if not set(element.iterancestors()) & set(elements)]
+        return [line.strip() for element in elements for text in element.xpath('.//text()')
+                for line in text.splitlines() if line.strip()]
 
-        # Get the union of the keys from both dictionaries
-        all_keys = dict1.keys() | dict2.keys()
+    @staticmethod
+    def reply_contains(reply, text: str) -> bool:
+        return any(text in line for line in RpcProcessor.reply_messages(reply))
 
-        for key in all_keys:
-            full_key = f"{parent_key}.{key}" if parent_key else key
+    def compare_state_dicts(self, dict1, dict2, parent_key="", tolerances: dict = None):
+        return diff_state(dict1, dict2, parent_key=parent_key, tolerances=tolerances)
 
-            if key not in dict1:
-                differences[full_key] = ("Missing in dict1", dict2[key])
-            elif key not in dict2:
-                differences[full_key] = (dict1[key], "Missing in dict2")
-            else:
-                # If the value is a dictionary, recurse into it
-                if isinstance(dict1[key], dict) and isinstance(dict2[key], dict):
-                    sub_diff = self.compare_state_dicts(dict1[key], dict2[key], full_key)
-                    if sub_diff:
-                        differences.update(sub_diff)
-                # If the value is a list, compare element by element
-                elif isinstance(dict1[key], list) and isinstance(dict2[key], list):
-                    if len(dict1[key]) != len(dict2[key]):
-                        differences[full_key] = (dict1[key], dict2[key])
-                    else:
-                        for i, (v1, v2) in enumerate(zip(dict1[key], dict2[key])):
-                            if isinstance(v1, dict) and isinstance(v2, dict):
-                                sub_diff = self.compare_state_dicts(v1, v2, f"{full_key}[{i}]")
-                                if sub_diff:
-                                    differences.update(sub_diff)
-                            elif v1 != v2:
-                                differences[f"{full_key}[{i}]"] = (v1, v2)
-                # Compare values directly if not dictionaries or lists
-                elif dict1[key] != dict2[key]:
-                    differences[full_key] = (dict1[key], dict2[key])
-
-        return differences
-
-    def run_compare_state_dicts(self, dict1, dict2):
-        differences = self.compare_state_dicts(dict1, dict2)
+    def run_compare_state_dicts(self, dict1, dict2, tolerances: dict = None):
+        differences = self.compare_state_dicts(dict1, dict2, tolerances=tolerances)
         if len(differences) == 0:
             self.logger.info('There are no differences between pre and post state. \u2705')
         else:
@@ -1037,32 +1347,22 @@ class RpcProcessor:
             for key, value in differences.items():
                 self.logger.error(f"Parameter {key}: has values: before {value[0]}, after {value[1]}")
 
-    def compare_configs(self, pre_upgrade, post_upgrade):
+    def compare_configs(self, pre_upgrade, post_upgrade, diff_file: str = None):
         try:
-            pre_upgrade_lines = pre_upgrade.splitlines()
-            post_upgrade_lines = post_upgrade.splitlines()
-            pre_upgrade_lines_sorted = sorted(pre_upgrade_lines)
-            post_upgrade_lines_sorted = sorted(post_upgrade_lines)
-
-            diff = difflib.unified_diff(
-                    pre_upgrade_lines_sorted,
-                    post_upgrade_lines_sorted,
-                    lineterm='')
-
-            differences = []
-            count = 0
-            for item in diff:
-                count += 1
-                differences.append(item)
-            if count == 0:
+            diff = diff_config_lines(pre_upgrade.splitlines(), post_upgrade.splitlines())
+            if diff_file is not None:
+                write_config_diff(diff, diff_file)
+            if diff['removed'] == 0 and diff['added'] == 0:
                 self.logger.info('There are no differences between the pre and post configs. \u2705')
                 return
             else:
                 self.logger.info('\u26A0\uFE0F WARNING: There are the following differences between the pre and post configs:')
-                for difference in differences:
-                    if difference.startswith('+') and not difference.startswith('+++') or difference.startswith(
-                            '-') and not difference.startswith('---'):
-                        self.logger.info(difference)
+                for name, changes in diff['hierarchies'].items():
+                    self.logger.info(f'[{name}] {len(changes["removed"])} removed, {len(changes["added"])} added')
+                    for line in changes['removed']:
+                        self.logger.info(f'-{line}')
+                    for line in changes['added']:
+                        self.logger.info(f'+{line}')
         except Exception as e:
             error = f"\u274C ERROR: Unable to compare pre and post configs. Exception: {e}"
             self.logger.error(error)
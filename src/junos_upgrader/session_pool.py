@@ -0,0 +1,110 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import threading
+from rpc_caller import RpcCaller
+
+
+class PooledSession:
+    def __init__(self, caller: RpcCaller):
+        self.caller = caller
+        self.users = 0
+        # False once the last user has released the session, so that it is not reconnected in the background
+        self.wanted = True
+
+
+class SessionPool:
+    """
+    Hands out one RpcCaller, and so one NETCONF session, per host, username and port, shared by every
+    RpcProcessor that acquires it, e.g. those of the devices of a fleet upgrade run on threads. A session
+    is health-checked when it is acquired, without an RPC, and re-opened if it has dropped. With
+    reconnect_interval set, a background thread re-opens the sessions still in use that dropped, e.g.
+    when their RE rebooted, as soon as the NETCONF port accepts connections again, so the session is
+    warm when the upgrader next needs it. RPCs on a shared session are serialized by the RpcCaller.
+    """
+    def __init__(self, reconnect_interval: float = None):
+        self.reconnect_interval = reconnect_interval
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.monitor = None
+        if reconnect_interval:
+            self.monitor = threading.Thread(target=self.reconnect_dropped_sessions, name='session-pool', daemon=True)
+            self.monitor.start()
+
+    def __str__(self):
+        return f"Instance of SessionPool( sessions: {len(self.sessions)}, reconnect_interval: {self.reconnect_interval})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def key(host, username, port) -> tuple:
+        return host, username, str(port)
+
+    def acquire(self, host, username, password, port, logger, **kwargs) -> RpcCaller:
+        """
+        Returns the open session to host for username and port, opening it if there is none or it has
+        dropped. kwargs are passed to RpcCaller when the session is created.
+        """
+        key = self.key(host, username, port)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = PooledSession(
+                        RpcCaller(host=host, username=username, password=password, port=port, logger=logger, **kwargs))
+            session.users += 1
+            session.wanted = True
+        try:
+            if session.caller.healthy():
+                logger.debug(f'Re-using the session to {host} from the session pool')
+            else:
+                session.caller.open()
+        except BaseException:
+            self.release(session.caller)
+            raise
+        return session.caller
+
+    def release(self, caller: RpcCaller):
+        """
+        Hands a session back to the pool. The session is closed once its last user has released it.
+        """
+        with self.lock:
+            session = self.sessions.get(self.key(caller.host, caller.username, caller.port))
+            if session is None or session.caller is not caller:
+                return
+            session.users -= 1
+            if session.users > 0:
+                return
+            session.wanted = False
+            del self.sessions[self.key(caller.host, caller.username, caller.port)]
+        # a dropped session is closed too, so that its notification listener stops re-opening it
+        caller.close()
+
+    def reconnect_dropped_sessions(self):
+        while not self.stopped.wait(self.reconnect_interval):
+            with self.lock:
+                sessions = [session for session in self.sessions.values() if session.wanted]
+            for session in sessions:
+                caller = session.caller
+                # a TCP connection to the NETCONF port is cheap, so a rebooting RE is not sent SSH handshakes
+                if caller.healthy() or not caller.port_is_open():
+                    continue
+                try:
+                    caller.open(retries=1)
+                except Exception as e:
+                    caller.logger.debug(f'Background reconnect to {caller.host} failed: {e}')
+
+    def close(self):
+        self.stopped.set()
+        if self.monitor is not None:
+            self.monitor.join()
+        with self.lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.caller.close()
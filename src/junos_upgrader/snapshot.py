@@ -0,0 +1,149 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os, sys, json, mmap, zlib, struct, threading
+
+MAGIC = b'JUSNAP1\n'
+FOOTER = struct.Struct('>Q')
+
+
+def encode_block(value) -> bytes:
+    """
+    Encodes the value of one record type. A list of dicts, e.g. the interface summary, is stored as one
+    column per field. Every distinct value is stored once, in a table of values, and the columns hold
+    the positions of their values in that table, so keys and repeated values such as 'up' cost a few bytes.
+    """
+    if isinstance(value, list) and value and all(isinstance(row, dict) for row in value):
+        values, ids = [], {}
+        fields = list(dict.fromkeys(field for row in value for field in row))
+        columns = {field: [] for field in fields}
+        for row in value:
+            for field in fields:
+                if field not in row:
+                    columns[field].append(-1)
+                    continue
+                item = row[field]
+                key = (type(item).__name__, item if isinstance(item, (str, int, float, bool, type(None)))
+                       else json.dumps(item, sort_keys=True))
+                if key not in ids:
+                    ids[key] = len(values)
+                    values.append(item)
+                columns[field].append(ids[key])
+        block = {'kind': 'columns', 'rows': len(value), 'values': values, 'columns': columns}
+    else:
+        block = {'kind': 'value', 'value': value}
+    return zlib.compress(json.dumps(block, separators=(',', ':')).encode(), 9)
+
+
+def decode_block(data: bytes):
+    block = json.loads(zlib.decompress(data))
+    if block['kind'] == 'value':
+        return block['value']
+    values, columns = block['values'], block['columns']
+    return [{field: values[ids[row]] for field, ids in columns.items() if ids[row] != -1}
+            for row in range(block['rows'])]
+
+
+class SnapshotWriter:
+    """
+    Writes a compact state snapshot. Each record type is compressed and appended to the file as soon
+    as it is added, and an index of the record types is written when the writer is closed.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.index = {}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def __str__(self):
+        return f"Instance of SnapshotWriter( path: {self.path}, record types: {len(self.index)})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, record_type: str, value):
+        data = encode_block(value)
+        with self.lock:
+            # a record type added again replaces the earlier one in the index
+            self.index[record_type] = [self.file.tell(), len(data)]
+            self.file.write(data)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            index = json.dumps(self.index).encode()
+            self.file.write(index + FOOTER.pack(len(index)))
+            self.file.close()
+
+
+class StreamingRecord(dict):
+    """
+    A pre or post upgrade record that streams each record type to its writers, e.g. a SnapshotWriter,
+    as the record_* methods set it, while still holding the record for the comparison at the end of
+    the upgrade.
+    """
+    def __init__(self, *writers):
+        super().__init__()
+        self.writers = writers
+
+    def __setitem__(self, record_type, value):
+        super().__setitem__(record_type, value)
+        for writer in self.writers:
+            writer.add(record_type, value)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+class Snapshot:
+    """
+    Reads a compact state snapshot. The file is memory-mapped and a record type is only decompressed
+    when it is read, so loading one record type from a large snapshot is fast.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError(f'{path} is not a state snapshot')
+        index_length, = FOOTER.unpack(self.map[-FOOTER.size:])
+        self.index = json.loads(self.map[-FOOTER.size - index_length:-FOOTER.size])
+
+    def __str__(self):
+        return f"Instance of Snapshot( path: {self.path}, record types: {len(self.index)})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record_types(self) -> list:
+        return list(self.index)
+
+    def get(self, record_type: str):
+        offset, length = self.index[record_type]
+        return decode_block(self.map[offset:offset + length])
+
+    def to_dict(self) -> dict:
+        return {record_type: self.get(record_type) for record_type in self.index}
+
+    def close(self):
+        self.map.close()
+
+
+if __name__ == "__main__":
+    # export a snapshot as JSON, e.g. python snapshot.py logs/pre_upgrade_state.snap > pre_upgrade_state.json
+    with Snapshot(sys.argv[1]) as snapshot:
+        json.dump(snapshot.to_dict(), sys.stdout, indent=4)
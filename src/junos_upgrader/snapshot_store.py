@@ -0,0 +1,159 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os, json, time, uuid, sqlite3, threading
+from state_diff import index_entries
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    started TEXT NOT NULL,
+    from_junos TEXT,
+    to_junos TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    phase TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (run_id, phase, record_type)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    phase TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    entry_key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (run_id, record_type, entry_key, phase)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    record_type TEXT NOT NULL,
+    entry_key TEXT NOT NULL,
+    change TEXT NOT NULL,
+    PRIMARY KEY (record_type, change, run_id, entry_key)
+);
+CREATE INDEX IF NOT EXISTS runs_by_device ON runs (device, started);
+CREATE INDEX IF NOT EXISTS entries_by_key ON entries (record_type, entry_key);
+'''
+
+
+class SnapshotStore:
+    """
+    Keeps the pre and post upgrade state of every run in an SQLite database, by device, run, phase and
+    record type, so that the history of a device, or of the fleet, can be queried. Each entry of a list
+    record type, e.g. each BGP peer, is also stored as a row of its own under the key state_diff uses
+    for it. When the post upgrade state is added, the entries lost and gained by the upgrade are stored
+    too, so questions such as which devices lost BGP peers after an upgrade are answered by an index.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # the RE0 and RE1 checks, and the devices of a fleet upgrade, add records from several threads
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def __str__(self):
+        return f"Instance of SnapshotStore( path: {self.path})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_run(self, device: str, from_junos: str = None, to_junos: str = None, run_id: str = None) -> str:
+        run_id = run_id or f'{time.strftime("%Y%m%dT%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO runs VALUES (?, ?, ?, ?, ?)',
+                                    (run_id, device, time.strftime('%Y-%m-%dT%H:%M:%S'), from_junos, to_junos))
+        return run_id
+
+    def add(self, run_id: str, phase: str, record_type: str, value):
+        entries = index_entries(record_type, value if isinstance(value, list) else [])
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)',
+                                    (run_id, phase, record_type, json.dumps(value)))
+            self.connection.execute('DELETE FROM entries WHERE run_id = ? AND phase = ? AND record_type = ?',
+                                    (run_id, phase, record_type))
+            self.connection.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+                                        [(run_id, phase, record_type, key, json.dumps(entry))
+                                         for key, entry in entries.items()])
+            if phase == 'post':
+                self.add_changes(run_id, record_type, entries)
+
+    def add_changes(self, run_id: str, record_type: str, post_entries: dict):
+        pre_keys = {key for key, in self.connection.execute(
+                'SELECT entry_key FROM entries WHERE run_id = ? AND record_type = ? AND phase = ?',
+                (run_id, record_type, 'pre'))}
+        self.connection.execute('DELETE FROM changes WHERE run_id = ? AND record_type = ?', (run_id, record_type))
+        self.connection.executemany('INSERT INTO changes VALUES (?, ?, ?, ?)',
+                                    [(run_id, record_type, key, 'lost') for key in pre_keys if key not in post_entries] +
+                                    [(run_id, record_type, key, 'gained') for key in post_entries if key not in pre_keys])
+
+    def writer(self, run_id: str, phase: str):
+        """
+        Returns a writer that adds the record types of one phase of a run, for a StreamingRecord.
+        """
+        return SnapshotStoreWriter(self, run_id, phase)
+
+    def record(self, run_id: str, phase: str) -> dict:
+        rows = self.query('SELECT record_type, value FROM records WHERE run_id = ? AND phase = ?', (run_id, phase))
+        return {record_type: json.loads(value) for record_type, value in rows}
+
+    def runs(self, device: str = None) -> list:
+        query = 'SELECT run_id, device, started, from_junos, to_junos FROM runs'
+        rows = self.query(query + ' WHERE device = ? ORDER BY started' if device else query + ' ORDER BY started',
+                          (device,) if device else ())
+        return [dict(zip(('run_id', 'device', 'started', 'from_junos', 'to_junos'), row)) for row in rows]
+
+    def lost_entries(self, record_type: str, to_junos: str = None, change: str = 'lost') -> list:
+        """
+        Returns the entries of a record type that were lost by an upgrade, e.g. the BGP peers each device
+        lost, optionally only for the runs that upgraded to to_junos. change='gained' returns the new ones.
+        """
+        rows = self.query('SELECT runs.device, runs.run_id, changes.entry_key FROM changes JOIN runs '
+                          'ON runs.run_id = changes.run_id WHERE changes.record_type = ? AND changes.change = ?' +
+                          (' AND runs.to_junos = ?' if to_junos else '') + ' ORDER BY runs.device, runs.started',
+                          (record_type, change, to_junos) if to_junos else (record_type, change))
+        return [dict(zip(('device', 'run_id', 'entry_key'), row)) for row in rows]
+
+    def query(self, sql: str, parameters: tuple = ()) -> list:
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
+class SnapshotStoreWriter:
+    def __init__(self, store: SnapshotStore, run_id: str, phase: str):
+        self.store = store
+        self.run_id = run_id
+        self.phase = phase
+
+    def add(self, record_type: str, value):
+        self.store.add(self.run_id, self.phase, record_type, value)
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Queries the snapshot store")
+    parser.add_argument('store', help='the SNAPSHOT_STORE file')
+    parser.add_argument('-d', '--device', help='list the runs of this device')
+    parser.add_argument('-l', '--lost', metavar='RECORD_TYPE', help='list the entries of RECORD_TYPE, e.g. bgp-summary, '
+                                                                     'that were lost by an upgrade')
+    parser.add_argument('-j', '--to-junos', help='only the runs that upgraded to this Junos, with --lost')
+    args = parser.parse_args()
+    with SnapshotStore(args.store) as store:
+        for row in store.lost_entries(args.lost, args.to_junos) if args.lost else store.runs(args.device):
+            print(json.dumps(row))
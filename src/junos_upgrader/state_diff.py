@@ -0,0 +1,89 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import json
+
+# the fields that identify an entry of each record type, so entries are matched by key rather than by position
+RECORD_KEYS = {
+    'chassis_hardware': ('name',),
+    'isis-adjacency-info': ('interface', 'level'),
+    'ospf-neighbor-info': ('interface',),
+    'bgp-summary': ('address',),
+    'interface-summary': ('name',),
+    'ldp-neighbors': ('neighbor',),
+    'pic-info': ('fpc_slot', 'pic_slot'),
+    'l2circuit-info': ('connection-address', 'connection-id'),
+    'route-summary': ('route_table_name', 'protocol-name'),
+    'chassis-alarms': ('alarm-class', 'alarm_description'),
+    'replication-state': lambda entry: next(iter(entry)),
+}
+
+# the numeric fields of each record type that may differ by up to a tolerance, e.g. route counts
+TOLERANCE_FIELDS = {
+    'route-summary': ('protocol-route-count', 'active-routes'),
+}
+
+
+def entry_key(record_type: str, entry) -> str:
+    key = RECORD_KEYS.get(record_type)
+    if callable(key):
+        return str(key(entry))
+    if key is not None and isinstance(entry, dict) and all(field in entry for field in key):
+        return '/'.join(str(entry[field]) for field in key)
+    # entries of other record types are matched by their whole value, so only their order is ignored
+    return json.dumps(entry, sort_keys=True) if isinstance(entry, (dict, list)) else str(entry)
+
+
+def index_entries(record_type: str, entries: list) -> dict:
+    """
+    Returns the entries by key. Entries with the same key, e.g. two identical alarms, get #2, #3 etc.
+    appended to their key.
+    """
+    index, counts = {}, {}
+    for entry in entries:
+        key = entry_key(record_type, entry)
+        counts[key] = counts.get(key, 0) + 1
+        index[key if counts[key] == 1 else f'{key}#{counts[key]}'] = entry
+    return index
+
+
+def within_tolerance(before, after, percent: float) -> bool:
+    try:
+        before, after = float(before), float(after)
+    except (TypeError, ValueError):
+        return False
+    return abs(after - before) <= max(abs(before), abs(after)) * percent / 100
+
+
+def diff_state(before, after, record_type: str = '', parent_key: str = '', tolerances: dict = None) -> dict:
+    """
+    Returns the differences between two records, or two values of a record, as a dict of
+    'parameter': (before, after). A value missing on one side is 'Missing in dict1' or 'Missing in
+    dict2'. Lists are indexed by the key of their record type, so an entry that moved is not a
+    difference and the diff takes linear time. tolerances gives the percentage by which the
+    TOLERANCE_FIELDS of a record type may differ, e.g. {'route-summary': 5}.
+    """
+    differences = {}
+    if isinstance(before, list) and isinstance(after, list):
+        before, after = index_entries(record_type, before), index_entries(record_type, after)
+        parameter = lambda key: f'{parent_key}[{key}]'
+    elif isinstance(before, dict) and isinstance(after, dict):
+        parameter = lambda key: f'{parent_key}.{key}' if parent_key else key
+    else:
+        field = parent_key.rsplit('.', 1)[-1]
+        percent = (tolerances or {}).get(record_type)
+        if before != after and not (percent is not None and field in TOLERANCE_FIELDS.get(record_type, ())
+                                    and within_tolerance(before, after, percent)):
+            differences[parent_key] = (before, after)
+        return differences
+
+    for key in list(before) + [key for key in after if key not in before]:
+        if key not in before:
+            differences[parameter(key)] = ("Missing in dict1", after[key])
+        elif key not in after:
+            differences[parameter(key)] = (before[key], "Missing in dict2")
+        else:
+            differences.update(diff_state(before[key], after[key], record_type or key, parameter(key), tolerances))
+    return differences
@@ -0,0 +1,234 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import json, threading
+from string import Template
+from junos_upgrader_exceptions import JunosInputsError
+from helpers import BufferedLogger
+from profiler import RunProfiler
+
+
+class UpgradePlan:
+    """
+    An ordered list of steps, each of which calls an RpcProcessor method on one target, e.g. re0.
+    A step is a dict with the keys:
+
+    * id     - unique name of the step
+    * target - the RpcProcessor the step runs on
+    * method - the RpcProcessor method to call, with optional `args` and `kwargs`
+    * log    - a message to log before the method is called; a step may have a log message only
+    * after  - ids of steps that must have finished before this step starts
+    * when   - id of a step whose result must be truthy for this step to run, otherwise it is skipped
+
+    A step may only refer to steps listed before it, so a plan can never contain a cycle.
+    Strings in args and kwargs of the form $NAME or ${NAME} are replaced by the value of NAME in the
+    context the plan is run with.
+    """
+    def __init__(self, steps: list):
+        self.steps = steps
+        self.validate()
+
+    def __str__(self):
+        return f"Instance of UpgradePlan( steps: {[step['id'] for step in self.steps]})"
+
+    @classmethod
+    def load(cls, inputs_json: dict, phase: str, default_path: str):
+        """
+        Returns the plan for phase from the UPGRADE_PLAN input parameter or, when the inputs have no
+        UPGRADE_PLAN, e.g. those of the fleet upgrader, from the UPGRADE_PLAN json file at default_path.
+        """
+        if "UPGRADE_PLAN" not in inputs_json:
+            return cls.from_file(default_path, phase)
+        if phase not in inputs_json["UPGRADE_PLAN"]:
+            raise JunosInputsError(f'UPGRADE_PLAN has no {phase} plan')
+        return cls(inputs_json["UPGRADE_PLAN"][phase])
+
+    @classmethod
+    def from_file(cls, path: str, phase: str):
+        """
+        Returns the plan for phase, e.g. pre-checks, from an UPGRADE_PLAN json file.
+        """
+        try:
+            with open(path, 'r') as file:
+                return cls(json.load(file)["UPGRADE_PLAN"][phase])
+        except JunosInputsError:
+            raise
+        except Exception as e:
+            raise JunosInputsError(f'Unable to read {phase} plan from {path}: {e}')
+
+    def validate(self):
+        seen = set()
+        for step in self.steps:
+            step_id = step.get('id')
+            if step_id is None or 'target' not in step:
+                raise JunosInputsError(f'Plan step {step} must have an id and a target')
+            if 'method' not in step and 'log' not in step:
+                raise JunosInputsError(f'Plan step {step_id} must have a method or a log message')
+            if step_id in seen:
+                raise JunosInputsError(f'Plan step id {step_id} is used more than once')
+            for dependency in self.dependencies(step):
+                if dependency not in seen:
+                    raise JunosInputsError(f'Plan step {step_id} depends on {dependency}, which is not an earlier step')
+            seen.add(step_id)
+
+    @staticmethod
+    def dependencies(step: dict) -> list:
+        return step.get('after', []) + ([step['when']] if 'when' in step else [])
+
+
+class PlanScheduler:
+    """
+    Runs the steps of an UpgradePlan. Each target has a worker thread of its own, as a PyEZ session
+    must not be used from two threads at once, so steps on different targets run concurrently while
+    the steps on one target run one at a time in plan order. The output and the errors and warnings
+    of each step are buffered and passed on in plan order, so the log reads as if the plan had run
+    one step after the other. Each step is timed by profiler, if one is given.
+    """
+    def __init__(self, plan: UpgradePlan, processors: dict, context: dict, logger, upgrade_error_log: list,
+                 upgrade_warning_log: list, profiler: RunProfiler = None):
+        self.plan = plan
+        self.processors = processors
+        self.context = context
+        self.logger = logger
+        self.upgrade_error_log = upgrade_error_log
+        self.upgrade_warning_log = upgrade_warning_log
+        self.profiler = profiler if profiler is not None else RunProfiler(enabled=False)
+        self.condition = threading.Condition()
+        self.state = {}
+        self.results = {}
+        self.failures = {}
+        self.outputs = {}
+        self.next_to_flush = 0
+
+        for step in plan.steps:
+            if step['target'] not in processors:
+                raise JunosInputsError(f'Plan step {step["id"]} runs on unknown target {step["target"]}')
+            if 'method' in step and not callable(getattr(processors[step['target']], step['method'], None)):
+                raise JunosInputsError(f'Plan step {step["id"]} calls unknown method {step["method"]}')
+            try:
+                self.resolve(step.get('args', []))
+                self.resolve(step.get('kwargs', {}))
+            except (KeyError, ValueError) as e:
+                raise JunosInputsError(f'Plan step {step["id"]} refers to unknown input {e}')
+
+    def __str__(self):
+        return f"Instance of PlanScheduler( {self.plan}, targets: {list(self.processors)})"
+
+    def run(self) -> dict:
+        """
+        Runs every step and returns a dict of the step results by step id. If a step raises, no
+        further steps are started and the exception of the earliest failed step is re-raised once
+        the running steps have finished.
+        """
+        self.state = {step['id']: 'pending' for step in self.plan.steps}
+        targets = list(dict.fromkeys(step['target'] for step in self.plan.steps))
+        workers = [threading.Thread(target=self.worker, args=(target,), name=f'plan-{target}') for target in targets]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # pass on the output of the steps that finished after the first failure
+        with self.condition:
+            for step in self.plan.steps[self.next_to_flush:]:
+                self.flush(step)
+
+        for step in self.plan.steps:
+            if step['id'] in self.failures:
+                raise self.failures[step['id']]
+        return self.results
+
+    def worker(self, target: str):
+        while True:
+            with self.condition:
+                step = self.next_step(target)
+                while step is None and not self.failures and self.has_pending_steps(target):
+                    self.condition.wait()
+                    step = self.next_step(target)
+                if step is None:
+                    return
+                self.state[step['id']] = 'running'
+
+            result, failure, output = self.run_step(step)
+
+            with self.condition:
+                self.state[step['id']] = 'done'
+                self.results[step['id']] = result
+                self.outputs[step['id']] = output
+                if failure is not None:
+                    self.failures[step['id']] = failure
+                self.flush_finished_steps()
+                self.condition.notify_all()
+
+    def next_step(self, target: str):
+        if self.failures:
+            return None
+        for step in self.plan.steps:
+            if step['target'] != target or self.state[step['id']] != 'pending':
+                continue
+            if not all(self.state[dependency] in ('done', 'skipped') for dependency in self.plan.dependencies(step)):
+                # steps on a target run in plan order
+                return None
+            if 'when' in step and not self.results.get(step['when']):
+                self.state[step['id']] = 'skipped'
+                self.results[step['id']] = None
+                self.flush_finished_steps()
+                self.condition.notify_all()
+                continue
+            return step
+        return None
+
+    def has_pending_steps(self, target: str) -> bool:
+        return any(step['target'] == target and self.state[step['id']] == 'pending' for step in self.plan.steps)
+
+    def run_step(self, step: dict):
+        buffered_logger = BufferedLogger(self.logger)
+        errors = []
+        warnings = []
+        result = None
+        failure = None
+        if 'log' in step:
+            buffered_logger.info(step['log'])
+        if 'method' in step:
+            processor = self.processors[step['target']]
+            processor.use_logs(buffered_logger, errors, warnings)
+            try:
+                with self.profiler.span(step['id'], 'plan-step', target=step['target'], method=step['method']) as event:
+                    method = getattr(processor, step['method'])
+                    result = method(*self.resolve(step.get('args', [])), **self.resolve(step.get('kwargs', {})))
+                    if errors:
+                        event['outcome'] = 'check-failed'
+            except BaseException as e:
+                failure = e
+            finally:
+                processor.use_logs(self.logger, self.upgrade_error_log, self.upgrade_warning_log)
+        return result, failure, (buffered_logger, errors, warnings)
+
+    def flush_finished_steps(self):
+        while self.next_to_flush < len(self.plan.steps):
+            step = self.plan.steps[self.next_to_flush]
+            if self.state[step['id']] not in ('done', 'skipped'):
+                break
+            self.flush(step)
+            self.next_to_flush += 1
+
+    def flush(self, step: dict):
+        output = self.outputs.pop(step['id'], None)
+        if output is not None:
+            buffered_logger, errors, warnings = output
+            buffered_logger.flush()
+            self.upgrade_error_log.extend(errors)
+            self.upgrade_warning_log.extend(warnings)
+
+    def resolve(self, value):
+        if isinstance(value, str) and value.startswith('$') and value[1:] in self.context:
+            return self.context[value[1:]]
+        if isinstance(value, str) and '$' in value:
+            return Template(value).substitute(self.context)
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.resolve(item) for key, item in value.items()}
+        return value
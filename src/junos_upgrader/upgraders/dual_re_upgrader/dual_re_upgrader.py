@@ -4,27 +4,43 @@ Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
 """
 
 import os, sys, logging, argparse, json
+from concurrent.futures import ThreadPoolExecutor
 import jnpr.junos
 from rpc_processor import RpcProcessor
 from junos_upgrader_exceptions import JunosPackageInstallError, JunosRpcProcessorInitError, JunosInputsError, JunosReSwitchoverError
 from helpers import Helpers
+from checkpoint import Checkpoint
+from upgrade_plan import UpgradePlan, PlanScheduler
+from profiler import RunProfiler
+from snapshot import SnapshotWriter, StreamingRecord
+from snapshot_store import SnapshotStore
+from session_pool import SessionPool
+from package_staging import local_checksum
 
 
-def dual_re_upgrade_upgrader():
+def dual_re_upgrade_upgrader(inputs_json: dict = None, args: argparse.Namespace = None, logger: logging.Logger = None,
+                             session_pool: SessionPool = None):
     """
     This upgrader is designed to upgrade the JunOS on MX series routers with dual REs
     and redundancy features configured.
     See README.md file for details.
 
+    When run from the command line all arguments are None and the inputs, flags and logger
+    are created from the inputs folder, the command line and the logfile name respectively.
+    Callers that drive many upgrades, such as the fleet upgrader, pass their own per device
+    inputs, flags and logger instead.
+
+    Returns a dict containing the upgrade errors and warnings.
     """
 
     #  Create inputs_json dict by reading all json files in inputs folder
-    try:
-        inputs_json = Helpers.create_inputs_json()
-    except KeyError:
-        raise
-    except Exception as e:
-        raise JunosInputsError(e)
+    if inputs_json is None:
+        try:
+            inputs_json = Helpers.create_inputs_json()
+        except KeyError:
+            raise
+        except Exception as e:
+            raise JunosInputsError(e)
 
     #  Extract input parameters from inputs_json dict
     re0_host: str = inputs_json.get("RE0_HOST")
@@ -36,68 +52,96 @@ def dual_re_upgrade_upgrader():
     new_junos_short: str = inputs_json.get("NEW_JUNOS")
     junos_package_path: str = inputs_json.get("JUNOS_PACKAGE_PATH")
     logfile_name: str = inputs_json.get("LOGFILE_NAME")
-    config_file_to_backup: str = inputs_json.get("CONFIG_FILE_TO_BACKUP")
-    re_model: str = inputs_json.get("RE_MODEL")
     min_isis_adj: int = inputs_json.get("MIN_ISIS_ADJ")
-    min_ospf_nei: int = inputs_json.get("MIN_OSPF_NEI")
-    max_mem_utilization: int = inputs_json.get("MAX_MEM_UTILIZATION_PERCENT")
-    min_cpu_idle: int = inputs_json.get("MIN_CPU_IDLE_PERCENT")
-    post_reboot_delay: int = inputs_json.get("POST_REBOOT_DELAY")
-    post_switchover_delay: int = inputs_json.get("POST_SWITCHOVER_DELAY")
-    post_script_completion_delay: int = inputs_json.get("POST_SCRIPT_COMPLETION_DELAY")
+    stream_subscribers: bool = inputs_json.get("STREAM_SUBSCRIBER_DETAIL", False)
+    batch_state_capture: bool = inputs_json.get("BATCH_STATE_CAPTURE", False)
+    post_reboot_ready_timeout: int = inputs_json.get("POST_REBOOT_READY_TIMEOUT", 900)
+    post_switchover_ready_timeout: int = inputs_json.get("POST_SWITCHOVER_READY_TIMEOUT", 300)
+    ready_initial_delay: int = inputs_json.get("READY_INITIAL_DELAY", 60)
+    ready_poll_interval: int = inputs_json.get("READY_POLL_INTERVAL", 5)
+    ready_max_poll_interval: int = inputs_json.get("READY_MAX_POLL_INTERVAL", 30)
+    convergence_timeout: int = inputs_json.get("CONVERGENCE_TIMEOUT", 300)
+    mastership_timeout: int = inputs_json.get("MASTERSHIP_TIMEOUT", 300)
+    replication_timeout: int = inputs_json.get("REPLICATION_TIMEOUT", 600)
+    route_count_tolerance: float = inputs_json.get("ROUTE_COUNT_TOLERANCE_PERCENT", 0)
+    compact_snapshots: bool = inputs_json.get("COMPACT_STATE_SNAPSHOTS", False)
+    snapshot_store_path: str = inputs_json.get("SNAPSHOT_STORE")
     connection_retries: int = inputs_json.get("CONNECTION_RETRIES")
     connection_retry_interval: int = inputs_json.get("CONNECTION_RETRY_INTERVAL")
+    connection_max_retry_interval: int = inputs_json.get("CONNECTION_MAX_RETRY_INTERVAL", 60)
+    connection_deadline: int = inputs_json.get("CONNECTION_DEADLINE", 600)
+    session_reconnect_interval: int = inputs_json.get("SESSION_RECONNECT_INTERVAL")
+    keepalive_interval: int = inputs_json.get("SESSION_KEEPALIVE_INTERVAL", 10)
+    keepalive_count: int = inputs_json.get("SESSION_KEEPALIVE_COUNT", 3)
+    notifications: bool = inputs_json.get("NOTIFICATIONS", False)
+    local_junos_package: str = inputs_json.get("LOCAL_JUNOS_PACKAGE")
+    junos_package_sha256: str = inputs_json.get("JUNOS_PACKAGE_SHA256")
+    staging_bandwidth_limit: int = inputs_json.get("STAGING_BANDWIDTH_LIMIT")
+    parallel_staging: bool = inputs_json.get("PARALLEL_STAGING", False)
+    logs_dir: str = inputs_json.get("LOGS_DIR", 'logs')
+    deactivate_commands: str = inputs_json.get("DEACTIVATE_REDUNDANCY_FILE", 'inputs/deactivate_redundancy.txt')
+    activate_commands: str = inputs_json.get("ACTIVATE_REDUNDANCY_FILE", 'inputs/activate_redundancy.txt')
 
     # derive additional junos package name parameters
-    new_junos_package: str = f"junos-vmhost-install-mx-x86-64-{new_junos_short}.tgz"
+    new_junos_package: str = new_junos_package_name(new_junos_short)
     new_junos: str = f"junos-install-mx-x86-64-{new_junos_short}"
 
     # process input arguments
-    parser = argparse.ArgumentParser(description="A Junos upgrade script for dual RE MX")
-    parser.add_argument(
-            '-d', '--dryrun',
-            dest='dryrun',
-            action='store_true',
-            help='Run the script without making any changes (default: False)',
-            default=False
-    )
-    parser.add_argument(
-            '-f', '--force',
-            dest='force',
-            action='store_true',
-            help='Run the script ignoring any pre-checks errors (default: False)',
-            default=False
-    )
-
-    parser.add_argument(
-            '-g', '--debug',
-            dest='debug',
-            action='store_true',
-            help='Run the script with more detailed logging (default: False)',
-            default=False
-    )
-
-    # parse input flags
-    args = parser.parse_args()
+    if args is None:
+        parser = argparse.ArgumentParser(description="A Junos upgrade script for dual RE MX")
+        parser.add_argument(
+                '-d', '--dryrun',
+                dest='dryrun',
+                action='store_true',
+                help='Run the script without making any changes (default: False)',
+                default=False
+        )
+        parser.add_argument(
+                '-f', '--force',
+                dest='force',
+                action='store_true',
+                help='Run the script ignoring any pre-checks errors (default: False)',
+                default=False
+        )
+
+        parser.add_argument(
+                '-g', '--debug',
+                dest='debug',
+                action='store_true',
+                help='Run the script with more detailed logging (default: False)',
+                default=False
+        )
+
+        parser.add_argument(
+                '-r', '--resume',
+                dest='resume',
+                action='store_true',
+                help='Resume an interrupted upgrade from its checkpoint (default: False)',
+                default=False
+        )
+
+        # parse input flags
+        args = parser.parse_args()
 
     # initialize logging
-    cwd = os.path.dirname(os.path.abspath(__file__))
-    formatter, file_handler, logger = Helpers.create_logger(cwd, logfile_name)
+    if logger is None:
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        formatter, file_handler, logger = Helpers.create_logger(cwd, logfile_name)
 
-    # process input flags
-    if args.debug:
-        file_handler.setLevel(logging.DEBUG)
-    else:
-        file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(formatter)
-    stream_handler = logging.StreamHandler()
-    if args.debug:
-        stream_handler.setLevel(logging.DEBUG)
-    else:
-        stream_handler.setLevel(logging.INFO)
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+        # process input flags
+        if args.debug:
+            file_handler.setLevel(logging.DEBUG)
+        else:
+            file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(formatter)
+        stream_handler = logging.StreamHandler()
+        if args.debug:
+            stream_handler.setLevel(logging.DEBUG)
+        else:
+            stream_handler.setLevel(logging.INFO)
+        stream_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+        logger.addHandler(stream_handler)
 
     if args.dryrun:
         logger.info("Dryrun mode is enabled.")
@@ -116,409 +160,469 @@ def dual_re_upgrade_upgrader():
     # Create dicts to store pre and post state data for comparison later
     pre_upgrade_record = {}
     post_upgrade_record = {}
+    pre_upgrade_config = None
 
-    logger.info('********** RUNNING RE0 PRE-CHECKS **********')
-
-    # Instantiate instance of RpcProcessor class for RE0
-    logger.debug('Create instance of RpcProcessor class for re0')
-    try:
-        rpc_processor_re0 = RpcProcessor(
-                logger=logger,
-                upgrade_error_log=upgrade_error_log,
-                upgrade_warning_log=upgrade_warning_log,
-                host=re0_host,
-                username=user,
-                password=pw,
-                port=port,
-                connection_retries=connection_retries,
-                connection_retry_interval=connection_retry_interval)
-    except Exception as e:
-        error = f'Unable to create instance of UpgradeUtils: {e}'
-        logger.error(error)
-        upgrade_error_log.append(error)
-        raise JunosRpcProcessorInitError(e)
+    def create_record(phase: str) -> dict:
+        # the record streams each record type to a compact snapshot and the snapshot store as it is captured
+        writers = []
+        if compact_snapshots:
+            writers.append(SnapshotWriter(os.path.join(logs_dir, f'{phase}_upgrade_state.snap')))
+        if snapshot_store is not None:
+            writers.append(snapshot_store.writer(run_id, phase))
+        return StreamingRecord(*writers) if writers else {}
 
     logger.debug(f'Juniper PyEZ Version: {jnpr.junos.__version__}')
-    logger.debug(rpc_processor_re0)
-
-    # get pre upgrade config
-    pre_upgrade_config = rpc_processor_re0.get_config_in_set_format()
-
-    if pre_upgrade_config is not None:
-        # write pre upgrade config to log file
-        with open('logs/pre_upgrade_config.txt', 'w') as file:
-            file.write(pre_upgrade_config)
-
-    # verify no chassis alarms
-    rpc_processor_re0.verify_no_chassis_alarms()
-
-    # Verify RE0 is Master
-    rpc_processor_re0.verify_re_mastership(slot=0, tries=1)
-
-    # verify RE0 status
-    status = rpc_processor_re0.verify_re_status(slot=0)
-    if status:
-
-        # verify RE0 memory usage
-        rpc_processor_re0.verify_re_memory_utilization(max_mem_util=max_mem_utilization, slot=0)
-
-        # verify RE0 CPU idle
-        rpc_processor_re0.verify_cpu_idle_time(min_cpu_idle, slot=0)
-
-    # verify protocol replication
-    rpc_processor_re0.verify_protocol_replication()
-
-    # verify PIC status
-    rpc_processor_re0.verify_pic_status()
-
-    # verify existing Junos version on RE0
-    rpc_processor_re0.verify_active_junos_version(expected_junos=active_junos, slot=0)
-
-    # verify RE0 model version
-    rpc_processor_re0.verify_re_model(re_model, slot=0)
-
-    # verify proposed Junos package exists on RE0
-    rpc_processor_re0.verify_proposed_junos_install_package_exists_on_re(
-        junos_package_path=junos_package_path,
-        proposed_package_name=new_junos_package, slot=0)
-
-    # verify number of disks on RE0
-    rpc_processor_re0.verify_number_of_disks_on_re(slot=0, expected_disks=2)
 
-    # verify minimum number of 'Up' ISIS adjacencies
-    rpc_processor_re0.verify_number_of_up_isis_adjacencies(min_isis_adjacencies=min_isis_adj, slot=0)
-
-    # verify minimum number of 'Full' OSPF neighbors
-    rpc_processor_re0.verify_number_of_full_ospf_neighbors(min_ospf_neighbors=min_ospf_nei, slot=0)
-
-    # backup config files
-    rpc_processor_re0.copy_file_on_device(f're0:/config/{config_file_to_backup}', 're0:/var/tmp/PreUpgrade.conf.gz')
-    rpc_processor_re0.copy_file_on_device(f're1:/config/{config_file_to_backup}', 're1:/var/tmp/PreUpgrade.conf.gz')
-
-    # record chassis hardware
-    rpc_processor_re0.record_chassis_hardware(pre_upgrade_record)
-
-    # record subscriber count for each subscriber type
-    rpc_processor_re0.record_subscriber_count_for_each_subscriber_type(pre_upgrade_record)
-
-    # record isis adjacencies
-    rpc_processor_re0.record_isis_adjacency_info(pre_upgrade_record)
-
-    # record ospf neighbors
-    rpc_processor_re0.record_ospf_neighbor_info(pre_upgrade_record)
-
-    # record bgp summary
-    rpc_processor_re0.record_bgp_summary_info(pre_upgrade_record)
-
-    # record interface state
-    rpc_processor_re0.record_interface_state(pre_upgrade_record)
-
-    # record ldp adjacencies
-    rpc_processor_re0.record_ldp_session_info(pre_upgrade_record)
-
-    # record protocol replication state
-    rpc_processor_re0.record_protocol_replication_state(pre_upgrade_record)
-
-    # record bfd session info
-    rpc_processor_re0.record_bfd_session_info(pre_upgrade_record)
-
-    # record PIC info
-    rpc_processor_re0.record_pic_info(pre_upgrade_record)
-
-    # record chassis alarms
-    rpc_processor_re0.record_chassis_alarms(pre_upgrade_record)
-
-    # record L2 circuit info
-    rpc_processor_re0.record_l2_circuit_info(pre_upgrade_record)
+    # every RPC, step and wait is timed and the run profile is written to the logs folder when the run ends
+    profiler = RunProfiler()
+
+    # every completed upgrade step is recorded in the checkpoint so that an interrupted upgrade can be resumed
+    checkpoint_path = os.path.join(logs_dir, 'upgrade_checkpoint.json')
+    checkpoint_device = {'RE0_HOST': re0_host, 'RE1_HOST': re1_host, 'NEW_JUNOS': new_junos_short}
+    checkpoint = None
+    if getattr(args, 'resume', False) and not args.dryrun:
+        checkpoint = Checkpoint.load(checkpoint_path, checkpoint_device)
+        if checkpoint is None:
+            logger.info('No checkpoint found. Running the upgrade from the start.')
+
+    # the pre and post checks are described by the upgrade plan, see UPGRADE_PLAN.json in the inputs folder
+    plan_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inputs', 'UPGRADE_PLAN.json')
+    pre_check_plan = UpgradePlan.load(inputs_json, 'pre-checks', plan_file)
+    post_check_plan = UpgradePlan.load(inputs_json, 'post-checks', plan_file)
+
+    # a staged package is verified against the checksum of the local package unless one is given
+    if local_junos_package and not junos_package_sha256:
+        junos_package_sha256 = local_checksum(local_junos_package)
+
+    def plan_context(record: dict) -> dict:
+        return {**inputs_json, 'ACTIVE_JUNOS': active_junos, 'NEW_JUNOS_PACKAGE': new_junos_package,
+                'STREAM_SUBSCRIBER_DETAIL': stream_subscribers, 'BATCH_STATE_CAPTURE': batch_state_capture,
+                'LOCAL_JUNOS_PACKAGE': local_junos_package, 'JUNOS_PACKAGE_SHA256': junos_package_sha256,
+                'STAGING_BANDWIDTH_LIMIT': staging_bandwidth_limit, 'RECORD': record}
+
+    def create_rpc_processor(host: str, shared: bool = True) -> RpcProcessor:
+        # a processor that is not shared, e.g. the one staging the package on RE0, opens no notification session and
+        # keeps its errors and warnings to itself, its caller reports its failure
+        error_log = upgrade_error_log if shared else []
+        warning_log = upgrade_warning_log if shared else []
+        logger.debug(f'Create instance of RpcProcessor class for {host}')
+        try:
+            rpc_processor = RpcProcessor(
+                    logger=logger,
+                    upgrade_error_log=error_log,
+                    upgrade_warning_log=warning_log,
+                    host=host,
+                    username=user,
+                    password=pw,
+                    port=port,
+                    connection_retries=connection_retries,
+                    connection_retry_interval=connection_retry_interval,
+                    connection_max_retry_interval=connection_max_retry_interval,
+                    connection_deadline=connection_deadline,
+                    keepalive_interval=keepalive_interval,
+                    keepalive_count=keepalive_count,
+                    notifications=notifications and shared,
+                    session_pool=session_pool if shared else None,
+                    profiler=profiler)
+        except Exception as e:
+            error = f'Unable to create instance of UpgradeUtils: {e}'
+            logger.error(error)
+            error_log.append(error)
+            raise JunosRpcProcessorInitError(e)
+        logger.debug(rpc_processor)
+        return rpc_processor
 
-    # record route summary
-    rpc_processor_re0.record_route_summary(pre_upgrade_record)
+    # the state of every run is also kept in the snapshot store, if there is one, for queries across runs
+    snapshot_store = SnapshotStore(snapshot_store_path) if snapshot_store_path else None
 
-    logger.info('********** RUNNING RE1 PRE-CHECKS **********')
+    # the sessions come from the pool of the fleet upgrade, if any, so that they are shared with its other workers
+    own_session_pool = session_pool is None
+    if own_session_pool:
+        session_pool = SessionPool(reconnect_interval=session_reconnect_interval)
+    run_id = None
+    rpc_processors = {}
 
-    # Instantiate instance of RpcProcessor class for RE1
-    logger.debug('Create instance of RpcProcessor class for re1')
     try:
-        rpc_processor_re1 = RpcProcessor(
-                logger=logger,
-                upgrade_error_log=upgrade_error_log,
-                upgrade_warning_log=upgrade_warning_log,
-                host=re1_host,
-                username=user,
-                password=pw,
-                port=port,
-                connection_retries=connection_retries,
-                connection_retry_interval=connection_retry_interval)
-    except Exception as e:
-        error = f'Unable to create instance of UpgradeUtils: {e}'
-        logger.error(error)
-        sys.exit()
-
-    logger.debug(rpc_processor_re1)
-
-    # verify RE1 status
-    status = rpc_processor_re1.verify_re_status(slot=1)
-    if status:
-
-        # verify RE1 memory usage
-        rpc_processor_re1.verify_re_memory_utilization(max_mem_util=max_mem_utilization, slot=1)
-
-        # verify RE1 CPU idle
-        rpc_processor_re1.verify_cpu_idle_time(min_cpu_idle, slot=1)
-
-    # verify existing Junos version on RE1
-    rpc_processor_re0.verify_active_junos_version(expected_junos=active_junos, slot=1)
-
-    # verify RE1 model version
-    rpc_processor_re1.verify_re_model(re_model, slot=1)
-
-    # verify proposed Junos package exists on RE1
-    rpc_processor_re1.verify_proposed_junos_install_package_exists_on_re(
-        junos_package_path=junos_package_path,
-        proposed_package_name=new_junos_package, slot=1)
-
-    # verify number of disks on RE1
-    rpc_processor_re1.verify_number_of_disks_on_re(slot=0, expected_disks=2)
-
-    # write state info to log file
-    with open('logs/pre_upgrade_state.json', 'w') as file:
-        json.dump(pre_upgrade_record, file, indent=4)
-
-    if len(upgrade_warning_log) != 0:
-        # 1 or more pre-check warnings
-        error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE PRE-CHECK WARNINGS **********'
-        logger.error(error)
-
-        for warning in upgrade_warning_log:
-            logger.error(warning)
-
-    if len(upgrade_error_log) != 0 and not args.force:
-        # 1 or more pre-check errors
-        error = '********** \u274C: THERE ARE ONE OR MORE PRE-CHECK ERRORS **********'
-        logger.error(error)
-        error = '********** PLEASE FIX THE FOLLOWING ERRORS BEFORE RE-TRYING **********'
-        logger.error(error)
-
-        for error in upgrade_error_log:
-            logger.error(error)
-        #
-        # # write error log to log file
-        # with open('logs/upgrade.log', 'w') as file:
-        #     for error in upgrade_error_log:
-        #         file.write(error)
+        # open the RE0 and RE1 sessions concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(create_rpc_processor, host) for host in (re0_host, re1_host)]
+        failures = [future.exception() for future in futures]
+        if any(failure is not None for failure in failures):
+            for future in futures:
+                if future.exception() is None:
+                    future.result().close()
+            if failures[0] is not None:
+                raise failures[0]
+            # RE1 could not be reached
+            sys.exit(1)
+        rpc_processor_re0, rpc_processor_re1 = [future.result() for future in futures]
+        rpc_processors = {'re0': rpc_processor_re0, 're1': rpc_processor_re1}
+
+        if snapshot_store is not None:
+            # a resumed upgrade adds its post upgrade state to the run of its pre upgrade state
+            run_id = snapshot_store.start_run(inputs_json.get("NAME", re0_host), active_junos, new_junos_short,
+                                              checkpoint.data.get('run_id') if checkpoint is not None else None)
+
+        if checkpoint is not None:
+            logger.info(f'********** RESUMING UPGRADE. COMPLETED STEPS: {", ".join(checkpoint.completed_steps)} **********')
+
+            # the pre-checks passed before the upgrade was interrupted so restore their results
+            pre_upgrade_record = checkpoint.data['pre_upgrade_record']
+            pre_upgrade_config = checkpoint.data['pre_upgrade_config']
+            upgrade_error_log.extend(checkpoint.data['upgrade_error_log'])
+            upgrade_warning_log.extend(checkpoint.data['upgrade_warning_log'])
+
+            # the checkpoint is written after a step completes, so check the device for steps that completed
+            # just before the interruption
+            detect_completed_steps(checkpoint, [rpc_processor_re0, rpc_processor_re1], new_junos, logger)
 
-        rpc_processor_re0.dev.close()
-        rpc_processor_re1.dev.close()
-
-        sys.exit()
-
-    else:
-        # PRE-CHECKS COMPLETE
-        logger.info('********** PRE-CHECKS COMPLETE **********')
-        if args.dryrun:
-            logger.info('********** DRY RUN FLAG SET. ENDING UPGRADE SCRIPT **********')
-            sys.exit()
-        elif len(upgrade_error_log) != 0 and args.force:
-            logger.info('********** FORCE FLAG SET. CONTINUING WITH UPGRADE DESPITE ERRORS **********')
         else:
-            logger.info('********** CONTINUING WITH UPGRADE **********')
-
-    logger.info('********** UPGRADING RE1 **********')
-
-    logger.info('Applying commands to deactivate redundancy features')
-    deactivate_commands = 'inputs/deactivate_redundancy.txt'
-    rpc_processor_re0.load_and_commit_config_on_device(deactivate_commands, 'private')
+            pre_upgrade_record = create_record('pre')
+
+            # cache read-only RPC replies shared by several pre-checks
+            for rpc_processor in rpc_processors.values():
+                rpc_processor.dev.start_cache_phase('pre-check')
+
+            # the RE0 and RE1 pre-checks run concurrently, each on its own session
+            with profiler.span('pre-checks', 'phase'):
+                results = PlanScheduler(pre_check_plan, rpc_processors, plan_context(pre_upgrade_record), logger,
+                                        upgrade_error_log, upgrade_warning_log, profiler).run()
+
+            for rpc_processor in rpc_processors.values():
+                rpc_processor.dev.end_cache_phase()
+
+            # get pre upgrade config
+            pre_upgrade_config = results['re0-pre-upgrade-config']
+
+            if pre_upgrade_config is not None:
+                # write pre upgrade config to log file
+                with open(os.path.join(logs_dir, 'pre_upgrade_config.txt'), 'w') as file:
+                    file.write(pre_upgrade_config)
+
+            if isinstance(pre_upgrade_record, StreamingRecord):
+                pre_upgrade_record.close()
+
+            # write state info to log file
+            with open(os.path.join(logs_dir, 'pre_upgrade_state.json'), 'w') as file:
+                json.dump(pre_upgrade_record, file, indent=4)
+
+            if len(upgrade_warning_log) != 0:
+                # 1 or more pre-check warnings
+                error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE PRE-CHECK WARNINGS **********'
+                logger.error(error)
+
+                for warning in upgrade_warning_log:
+                    logger.error(warning)
+
+            if len(upgrade_error_log) != 0 and not args.force:
+                # 1 or more pre-check errors
+                error = '********** \u274C: THERE ARE ONE OR MORE PRE-CHECK ERRORS **********'
+                logger.error(error)
+                error = '********** PLEASE FIX THE FOLLOWING ERRORS BEFORE RE-TRYING **********'
+                logger.error(error)
+
+                for error in upgrade_error_log:
+                    logger.error(error)
+                #
+                # # write error log to log file
+                # with open('logs/upgrade.log', 'w') as file:
+                #     for error in upgrade_error_log:
+                #         file.write(error)
+
+                sys.exit(1)
+
+            else:
+                # PRE-CHECKS COMPLETE
+                logger.info('********** PRE-CHECKS COMPLETE **********')
+                if args.dryrun:
+                    logger.info('********** DRY RUN FLAG SET. ENDING UPGRADE SCRIPT **********')
+                    sys.exit(0)
+                elif len(upgrade_error_log) != 0 and args.force:
+                    logger.info('********** FORCE FLAG SET. CONTINUING WITH UPGRADE DESPITE ERRORS **********')
+                else:
+                    logger.info('********** CONTINUING WITH UPGRADE **********')
+
+            checkpoint = Checkpoint(checkpoint_path, checkpoint_device)
+            checkpoint.complete('pre-checks', pre_upgrade_record=pre_upgrade_record, pre_upgrade_config=pre_upgrade_config,
+                                upgrade_error_log=upgrade_error_log, upgrade_warning_log=upgrade_warning_log, run_id=run_id)
+
+        logger.info('********** UPGRADING RE1 **********')
+
+        if not checkpoint.is_complete('deactivate-redundancy'):
+            logger.info('Applying commands to deactivate redundancy features')
+            rpc_processor_re0.load_and_commit_config_on_device(deactivate_commands, 'private')
+            checkpoint.complete('deactivate-redundancy')
+
+        if not checkpoint.is_complete('re1-rescue-config'):
+            rpc_processor_re1.create_rescue_config('private')
+            checkpoint.complete('re1-rescue-config')
+
+        def stage_package_on_re0():
+            # the switchover runs on the RE0 session while the package is added, so staging needs a session of its own
+            staging_processor = create_rpc_processor(re0_host, shared=False)
+            try:
+                staging_processor.install_junos_on_device(junos_package_path=junos_package_path,
+                                                          new_junos_package=new_junos_package, re_number=0)
+            finally:
+                staging_processor.close()
+
+        # the package is added to the backup partition of RE0 while RE1 is upgraded, so RE0 only needs to reboot into it
+        staging = None
+        if parallel_staging and not any(checkpoint.is_complete(step) for step in
+                                        ('re0-stage-partition-1', 're0-install-partition-1', 'switchover-to-re1')):
+            logger.info(f'Staging {new_junos_package} on RE0 while RE1 is upgraded')
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stage-re0')
+            staging = executor.submit(stage_package_on_re0)
+            executor.shutdown(wait=False)
+
+        # the package add on RE0 is not abandoned with the upgrade, so it is waited for however the RE1 upgrade ends
+        re1_upgraded = False
+        try:
+            # Installing and rebooting new Junos version on RE1, Partition 1
+            if not checkpoint.is_complete('re1-install-partition-1'):
+                rpc_processor_re1.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=1)
+                rpc_processor_re1.reboot_re(1)
+                rpc_processor_re1.wait_for_re_ready(slot=1, timeout=post_reboot_ready_timeout, initial_delay=ready_initial_delay,
+                                                    poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
+                checkpoint.complete('re1-install-partition-1')
+
+            # Installing and rebooting new Junos version on RE1, Partition 2
+            if not checkpoint.is_complete('re1-install-partition-2'):
+                rpc_processor_re1.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=1)
+                rpc_processor_re1.reboot_re(1)
+                rpc_processor_re1.wait_for_re_ready(slot=1, timeout=post_reboot_ready_timeout, initial_delay=ready_initial_delay,
+                                                    poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
+                checkpoint.complete('re1-install-partition-2')
+
+            if not checkpoint.is_complete('re1-verify'):
+                rpc_processor_re1.check_matching_junos_on_partitions(new_junos)
+
+                # Validate new Junos version on RE1
+                rpc_processor_re1.validate_junos_on_device(junos_package_path, new_junos_package)
+
+                # verify that new Junos is now running on RE1
+                if not rpc_processor_re1.verify_active_junos_version(expected_junos=new_junos_short, slot=1):
+                    raise JunosPackageInstallError(f'RE1 is not running the expected Junos version {new_junos_short}')
+                checkpoint.complete('re1-verify')
+            re1_upgraded = True
+        finally:
+            if staging is not None:
+                # RE0 must not change mastership while the package is being added
+                try:
+                    staging.result()
+                    staged = True
+                except Exception as e:
+                    staged = False
+                    if re1_upgraded:
+                        warning = f'\u26A0\uFE0F WARNING: Unable to stage {new_junos_package} on RE0. It will be installed after the switchover. Exception: {e}'
+                        logger.error(warning)
+                        upgrade_warning_log.append(warning)
+                    else:
+                        logger.info(f'Unable to stage {new_junos_package} on RE0. Exception: {e}')
+                if staged and re1_upgraded:
+                    checkpoint.complete('re0-stage-partition-1')
+                elif staged:
+                    error = (f'\u274C ERROR: The upgrade of RE1 failed after {new_junos_package} was staged on RE0. RE0 will boot '
+                             f'{new_junos_short} at its next reboot unless the package is rolled back with "request vmhost software rollback"')
+                    logger.error(error)
+                    upgrade_error_log.append(error)
+
+        if not checkpoint.is_complete('switchover-to-re1'):
+            logger.info('Initiating switchover to RE1 as master')
+            rpc_processor_re0.re_switchover()
+
+            # poll the new master until it reports mastership instead of waiting a fixed time
+            rpc_processor_re1.wait_for_re_ready(slot=1, timeout=post_switchover_ready_timeout, initial_delay=0,
+                                                poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval,
+                                                reopen_session=False, expect_master=True)
+
+            # Verify RE1 is Master
+            if not rpc_processor_re1.verify_re_mastership(slot=1, timeout=mastership_timeout):
+                raise JunosReSwitchoverError
+            checkpoint.complete('switchover-to-re1')
+
+        logger.info('********** UPGRADING RE0 **********')
+
+        # make sure we are still connected to re0
+        if not rpc_processor_re0.dev.device.connected:
+            rpc_processor_re0.dev.open()
+
+        # create and save rescue config on the device
+        if not checkpoint.is_complete('re0-rescue-config'):
+            rpc_processor_re0.create_rescue_config('private')
+            checkpoint.complete('re0-rescue-config')
+
+        # Installing and rebooting new Junos version on RE0, Partition 1
+        if not checkpoint.is_complete('re0-install-partition-1'):
+            if checkpoint.is_complete('re0-stage-partition-1'):
+                logger.info(f'{new_junos_package} was staged on RE0 while RE1 was upgraded. Rebooting RE0 into it')
+            else:
+                rpc_processor_re0.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
+            rpc_processor_re0.reboot_re(0)
+            rpc_processor_re0.wait_for_re_ready(slot=0, timeout=post_reboot_ready_timeout, initial_delay=ready_initial_delay,
+                                                poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
+            checkpoint.complete('re0-install-partition-1')
+
+        # Installing and rebooting new Junos version on RE0, Partition 2
+        if not checkpoint.is_complete('re0-install-partition-2'):
+            rpc_processor_re0.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
+            rpc_processor_re0.reboot_re(0)
+            rpc_processor_re0.wait_for_re_ready(slot=0, timeout=post_reboot_ready_timeout, initial_delay=ready_initial_delay,
+                                                poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
+            checkpoint.complete('re0-install-partition-2')
+
+        if not checkpoint.is_complete('re0-verify'):
+            # check that new junos is installed on both partitions of re
+            rpc_processor_re0.check_matching_junos_on_partitions(new_junos)
+
+            # Validate new Junos version on RE0
+            rpc_processor_re0.validate_junos_on_device(junos_package_path, new_junos_package)
+
+            # verify that new Junos is now running on RE0
+            if not rpc_processor_re0.verify_active_junos_version(expected_junos=new_junos_short, slot=0):
+                raise JunosPackageInstallError(f'RE0 is not running the expected Junos version {new_junos_short}')
+            checkpoint.complete('re0-verify')
+
+        if not checkpoint.is_complete('switchover-to-re0'):
+            if not rpc_processor_re1.dev.device.connected:
+                rpc_processor_re1.dev.open()
+
+            logger.info('Initiating switchover to RE0 as master')
+            rpc_processor_re1.re_switchover()
+
+            # poll the new master until it reports mastership instead of waiting a fixed time
+            rpc_processor_re0.wait_for_re_ready(slot=0, timeout=post_switchover_ready_timeout, initial_delay=0,
+                                                poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval,
+                                                reopen_session=False, expect_master=True)
+
+            # Verify RE0 is Master
+            if not rpc_processor_re0.verify_re_mastership(slot=0, timeout=mastership_timeout):
+                raise JunosReSwitchoverError
+            checkpoint.complete('switchover-to-re0')
+
+        if not checkpoint.is_complete('activate-redundancy'):
+            # wait for routing to converge on the new master before re-activating redundancy
+            rpc_processor_re0.wait_for_routing_convergence(min_isis_adjacencies=min_isis_adj, timeout=convergence_timeout,
+                                                           poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
+
+            logger.info('Applying commands to activate redundancy features')
+            rpc_processor_re0.load_and_commit_config_on_device(activate_commands, 'private')
+            checkpoint.complete('activate-redundancy')
+
+        # check that redundancy is operational by checking that replication is complete
+        rpc_processor_re0.confirm_replication_complete(timeout=replication_timeout)
+
+        # wait for routing to be stable before running post checks
+        rpc_processor_re0.wait_for_routing_convergence(min_isis_adjacencies=min_isis_adj, timeout=convergence_timeout,
+                                                       poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
+
+        logger.info('********** RUNNING POST UPGRADE CHECKS AND GATHERING STATE DATA **********')
+
+        # reset active junos param prior to post upgrade checks because we are now running new version
+        active_junos: str = new_junos_short
+
+        post_upgrade_record = create_record('post')
+
+        # cache read-only RPC replies shared by several post-checks
+        rpc_processor_re0.dev.start_cache_phase('post-check')
 
-    rpc_processor_re1.create_rescue_config('private')
+        with profiler.span('post-checks', 'phase'):
+            PlanScheduler(post_check_plan, rpc_processors, plan_context(post_upgrade_record), logger,
+                          upgrade_error_log, upgrade_warning_log, profiler).run()
 
-    # Installing and rebooting new Junos version on RE1, Partition 1
-    rpc_processor_re1.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=1)
-    rpc_processor_re1.reboot_re(1)
-    logger.info(f'RE1 rebooting, waiting {post_reboot_delay} seconds before trying to reconnect')
-    rpc_processor_re1.countdown_timer(post_reboot_delay)
-    rpc_processor_re1.dev.open()
+        rpc_processor_re0.dev.end_cache_phase()
+
+        if isinstance(post_upgrade_record, StreamingRecord):
+            post_upgrade_record.close()
 
-    # Installing and rebooting new Junos version on RE1, Partition 2
-    rpc_processor_re1.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=1)
-    rpc_processor_re1.reboot_re(1)
-    logger.info(f'RE1 rebooting, waiting {post_reboot_delay} seconds before trying to reconnect')
-    rpc_processor_re1.countdown_timer(post_reboot_delay)
-    rpc_processor_re1.dev.open()
+        # write state info to log file
+        with open(os.path.join(logs_dir, 'post_upgrade_state.json'), 'w') as file:
+            json.dump(post_upgrade_record, file, indent=4)
 
-    rpc_processor_re1.check_matching_junos_on_partitions(new_junos)
+        # get post upgrade config
+        post_upgrade_config = rpc_processor_re0.get_config_in_set_format()
 
-    # Validate new Junos version on RE1
-    rpc_processor_re1.validate_junos_on_device(junos_package_path, new_junos_package)
+        # write post upgrade config to log file
+        with open(os.path.join(logs_dir, 'post_upgrade_config.txt'), 'w') as file:
+            file.write(post_upgrade_config)
 
-    # verify that new Junos is now running on RE1
-    if not rpc_processor_re1.verify_active_junos_version(expected_junos=new_junos_short, slot=1):
-        raise JunosPackageInstallError(f'RE1 is not running the expected Junos version {new_junos_short}')
-
-    logger.info('Initiating switchover to RE1 as master')
-    rpc_processor_re0.re_switchover()
-
-    logger.info(f'Waiting {post_switchover_delay} seconds for switchover to complete')
-    rpc_processor_re0.countdown_timer(post_switchover_delay)
-
-    # Verify RE1 is Master
-    if not rpc_processor_re1.verify_re_mastership(slot=1, tries=connection_retries):
-        raise JunosReSwitchoverError
-
-    logger.info('********** UPGRADING RE0 **********')
-
-    # make sure we are still connected to re0
-    if not rpc_processor_re0.dev.device.connected:
-        rpc_processor_re0.dev.open()
-
-    # create and save rescue config on the device
-    rpc_processor_re0.create_rescue_config('private')
-
-    # Installing and rebooting new Junos version on RE0, Partition 1
-    rpc_processor_re0.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
-    rpc_processor_re0.reboot_re(0)
-    logger.info(f'RE0 rebooting, waiting {post_reboot_delay} seconds before trying to reconnect')
-    rpc_processor_re0.countdown_timer(post_reboot_delay)
-    rpc_processor_re0.dev.open()
-
-    # Installing and rebooting new Junos version on RE0, Partition 2
-    rpc_processor_re0.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
-    rpc_processor_re0.reboot_re(0)
-    logger.info(f'RE0 rebooting, waiting {post_reboot_delay} seconds before trying to reconnect')
-    rpc_processor_re0.countdown_timer(post_reboot_delay)
-    rpc_processor_re0.dev.open()
-
-    # check that new junos is installed on both partitions of re
-    rpc_processor_re0.check_matching_junos_on_partitions(new_junos)
-
-    # Validate new Junos version on RE0
-    rpc_processor_re0.validate_junos_on_device(junos_package_path, new_junos_package)
-
-    # verify that new Junos is now running on RE0
-    if not rpc_processor_re0.verify_active_junos_version(expected_junos=new_junos_short, slot=0):
-        raise JunosPackageInstallError(f'RE0 is not running the expected Junos version {new_junos_short}')
-
-    if not rpc_processor_re1.dev.device.connected:
-        rpc_processor_re1.dev.open()
-
-    logger.info('Initiating switchover to RE0 as master')
-    rpc_processor_re1.re_switchover()
-
-    logger.info(f'Waiting {post_switchover_delay} seconds for switchover to complete')
-    rpc_processor_re1.countdown_timer(post_switchover_delay)
-
-    # Verify RE0 is Master
-    if not rpc_processor_re0.verify_re_mastership(slot=0, tries=connection_retries):
-        raise JunosReSwitchoverError
-
-    logger.info(f'Waiting {post_script_completion_delay} seconds for convergence after switchover')
-    rpc_processor_re0.countdown_timer(post_script_completion_delay)
-
-    logger.info('Applying commands to activate redundancy features')
-    activate_commands = 'inputs/activate_redundancy.txt'
-    rpc_processor_re0.load_and_commit_config_on_device(activate_commands, 'private')
-
-    # check that redundancy is operational by checking that replication is complete
-    rpc_processor_re0.confirm_replication_complete()
-
-    # delay to ensure everything is stable before running post checks
-    logger.info(f'Waiting {post_script_completion_delay} seconds for routing convergence')
-    rpc_processor_re0.countdown_timer(post_script_completion_delay)
-
-    logger.info('********** RUNNING POST UPGRADE CHECKS AND GATHERING STATE DATA **********')
-
-    # reset active junos param prior to post upgrade checks because we are now running new version
-    active_junos: str = new_junos_short
-
-    # verify no chassis alarms
-    rpc_processor_re0.verify_no_chassis_alarms()
-
-    # verify minimum number of 'Up' ISIS adjacencies
-    rpc_processor_re0.verify_number_of_up_isis_adjacencies(min_isis_adjacencies=min_isis_adj, slot=0)
-
-    # verify minimum number of 'Full' OSPF neighbors
-    rpc_processor_re0.verify_number_of_full_ospf_neighbors(min_ospf_neighbors=min_ospf_nei, slot=0)
-
-    # record chassis hardware
-    rpc_processor_re0.record_chassis_hardware(post_upgrade_record)
-
-    # record subscriber count for each subscriber type
-    rpc_processor_re0.record_subscriber_count_for_each_subscriber_type(post_upgrade_record)
-
-    # record isis adjacencies
-    rpc_processor_re0.record_isis_adjacency_info(post_upgrade_record)
-
-    # record ospf neighbors
-    rpc_processor_re0.record_ospf_neighbor_info(post_upgrade_record)
-
-    # record bgp neighbors
-    rpc_processor_re0.record_bgp_summary_info(post_upgrade_record)
-
-    # record interface state
-    rpc_processor_re0.record_interface_state(post_upgrade_record)
-
-    # record ldp adjacencies
-    rpc_processor_re0.record_ldp_session_info(post_upgrade_record)
-
-    # record protocol replication state
-    rpc_processor_re0.record_protocol_replication_state(post_upgrade_record)
-
-    # record bfd session info
-    rpc_processor_re0.record_bfd_session_info(post_upgrade_record)
-
-    # record PIC info
-    rpc_processor_re0.record_pic_info(post_upgrade_record)
-
-    # record chassis alarms
-    rpc_processor_re0.record_chassis_alarms(post_upgrade_record)
-
-    # record L2 circuit info
-    rpc_processor_re0.record_l2_circuit_info(post_upgrade_record)
+        logger.info('********** UPGRADE COMPLETE **********')
+
+        # if 1 or more warnings
+        if len(upgrade_warning_log) != 0:
+            error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE UPGRADE WARNINGS **********'
+            logger.error(error)
 
-    # record route summary
-    rpc_processor_re0.record_route_summary(post_upgrade_record)
+            for warning in upgrade_warning_log:
+                logger.error(warning)
 
-    # write state info to log file
-    with open('logs/post_upgrade_state.json', 'w') as file:
-        json.dump(post_upgrade_record, file, indent=4)
+        # if 1 or more errors
+        if len(upgrade_error_log) != 0:
+            error = '********** \u274C: THERE ARE ONE OR MORE UPGRADE ERRORS **********'
+            logger.error(error)
 
-    # get post upgrade config
-    post_upgrade_config = rpc_processor_re0.get_config_in_set_format()
+            for error in upgrade_error_log:
+                logger.error(error)
 
-    # write post upgrade config to log file
-    with open('logs/post_upgrade_config.txt', 'w') as file:
-        file.write(post_upgrade_config)
+        # write post upgrade config to log file
+        with open(os.path.join(logs_dir, 'post_upgrade_config.txt'), 'w') as file:
+            file.write(post_upgrade_config)
 
-    logger.info('********** UPGRADE COMPLETE **********')
+        logger.info('********** COMPARING PRE & POST CONFIG **********')
 
-    # if 1 or more warnings
-    if len(upgrade_warning_log) != 0:
-        error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE UPGRADE WARNINGS **********'
-        logger.error(error)
+        rpc_processor_re0.compare_configs(pre_upgrade_config, post_upgrade_config, os.path.join(logs_dir, 'config_diff.json'))
 
-        for warning in upgrade_warning_log:
-            logger.error(warning)
+        logger.info('********** COMPARING PRE & POST STATE **********')
 
-    # if 1 or more errors
-    if len(upgrade_error_log) != 0:
-        error = '********** \u274C: THERE ARE ONE OR MORE UPGRADE ERRORS **********'
-        logger.error(error)
+        rpc_processor_re0.run_compare_state_dicts(pre_upgrade_record, post_upgrade_record,
+                                                  {'route-summary': route_count_tolerance})
 
-        for error in upgrade_error_log:
-            logger.error(error)
+        # the upgrade has completed so there is nothing left to resume
+        checkpoint.remove()
 
-    # write post upgrade config to log file
-    with open('logs/post_upgrade_config.txt', 'w') as file:
-        file.write(post_upgrade_config)
+        logger.info('Enjoy your favorite beverage! \U0001F600')
 
-    logger.info('********** COMPARING PRE & POST CONFIG **********')
+        return {'errors': upgrade_error_log, 'warnings': upgrade_warning_log}
+    finally:
+        # the sessions, the session pool and the snapshot store are closed and the run profile written however
+        # the run ends, so a dry run or a failed device of a fleet upgrade does not leak them
+        for rpc_processor in rpc_processors.values():
+            rpc_processor.close()
+        if own_session_pool:
+            session_pool.close()
+        if snapshot_store is not None:
+            snapshot_store.close()
+        profiler.write(logs_dir, logger)
 
-    rpc_processor_re0.compare_configs(pre_upgrade_config, post_upgrade_config)
 
-    logger.info('********** COMPARING PRE & POST STATE **********')
+def new_junos_package_name(new_junos_short: str) -> str:
+    return f"junos-vmhost-install-mx-x86-64-{new_junos_short}.tgz"
 
-    rpc_processor_re0.run_compare_state_dicts(pre_upgrade_record, post_upgrade_record)
 
-    logger.info('Enjoy your favorite beverage! \U0001F600')
+def detect_completed_steps(checkpoint: Checkpoint, rpc_processors: list, new_junos: str, logger: logging.Logger):
+    """
+    Marks the install and switchover steps whose result is already visible on the device as complete,
+    for steps that finished after the last checkpoint was written.
+    """
+    for slot, rpc_processor in enumerate(rpc_processors):
+        install_steps = [f're{slot}-install-partition-1', f're{slot}-install-partition-2']
+        if all(checkpoint.is_complete(step) for step in install_steps):
+            continue
+        try:
+            installed = rpc_processor.count_junos_image_on_partitions(new_junos) == 2
+        except Exception as e:
+            logger.debug(f'Unable to check the partitions of RE{slot}. Exception: {e}')
+            installed = False
+        if installed:
+            logger.info(f'RE{slot} already has {new_junos} on both partitions. Skipping RE{slot} install')
+            for step in install_steps:
+                checkpoint.complete(step)
+
+    for slot, step in ((1, 'switchover-to-re1'), (0, 'switchover-to-re0')):
+        if (checkpoint.is_complete(f're{slot}-verify') and not checkpoint.is_complete(step)
+                and rpc_processors[slot].is_re_master(slot)):
+            logger.info(f'RE{slot} is already master. Skipping switchover to RE{slot}')
+            checkpoint.complete(step)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,330 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os, logging, argparse, json, time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from upgraders.dual_re_upgrader.dual_re_upgrader import dual_re_upgrade_upgrader, new_junos_package_name
+from junos_upgrader_exceptions import JunosInputsError
+from helpers import Helpers
+from session_pool import SessionPool
+from rpc_caller import RpcCaller
+from package_staging import local_checksum, stage_package_on_res
+
+
+class ErrorCollector(logging.Handler):
+    """
+    Logging handler that keeps every error logged during one device upgrade so that it can be
+    included in the fleet report. The upgrader repeats its errors in a summary at the end of the
+    pre-checks, so each message is kept once and the summary banners are dropped.
+    """
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message not in self.messages and not message.startswith('**********'):
+            self.messages.append(message)
+
+
+def run_device_upgrade(device: dict, inputs_json: dict, dryrun: bool, force: bool, debug: bool, resume: bool = False,
+                       session_pool: SessionPool = None) -> dict:
+    """
+    Runs the dual RE upgrader for a single device of the inventory and returns its result.
+    Any key of the inventory entry overrides the fleet wide input parameter of the same name.
+    This function is run by the fleet worker pool so it must never raise.
+    """
+    name = device["NAME"]
+    device_inputs = {**inputs_json, **device}
+    device_inputs["LOGS_DIR"] = os.path.join(inputs_json["FLEET_LOGS_DIR"], name)
+    logger = Helpers.create_device_logger(name, device_inputs["LOGS_DIR"], device_inputs.get("LOGFILE_NAME", 'upgrade.log'), debug)
+    error_collector = ErrorCollector()
+    logger.addHandler(error_collector)
+    args = argparse.Namespace(dryrun=dryrun, force=force, debug=debug, resume=resume)
+
+    result = {'name': name, 'site': device.get("SITE", 'default'), 'status': None, 'errors': [], 'warnings': []}
+    start = time.monotonic()
+    try:
+        outcome = dual_re_upgrade_upgrader(inputs_json=device_inputs, args=args, logger=logger, session_pool=session_pool)
+        result['errors'] = outcome['errors']
+        result['warnings'] = outcome['warnings']
+        result['status'] = 'complete' if len(outcome['errors']) == 0 else 'complete-with-errors'
+    except SystemExit as e:
+        # the upgrader exits with 0 at the end of a dryrun and with 1 when the pre-checks fail
+        result['status'] = 'pre-check-failed' if e.code else 'dryrun-complete'
+        result['errors'] = error_collector.messages
+    except Exception as e:
+        result['status'] = 'failed'
+        result['errors'] = error_collector.messages + [f'{type(e).__name__}: {e}']
+    finally:
+        result['duration_seconds'] = round(time.monotonic() - start, 1)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+    return result
+
+
+def run_fleet(devices: list, inputs_json: dict, executor, args: argparse.Namespace, logger: logging.Logger,
+              session_pool: SessionPool = None) -> list:
+    """
+    Submits the device upgrades to the executor, never running more than MAX_CONCURRENT_UPGRADES
+    upgrades in total or more than the site limit at any one site, and returns the results in
+    inventory order.
+    """
+    max_concurrent: int = inputs_json.get("MAX_CONCURRENT_UPGRADES", 4)
+    default_site_limit: int = inputs_json.get("MAX_CONCURRENT_UPGRADES_PER_SITE")
+    site_limits: dict = inputs_json.get("SITE_CONCURRENCY_LIMITS", {})
+
+    pending = list(devices)
+    running = {}
+    running_per_site = Counter()
+    results = {}
+
+    while pending or running:
+        for device in list(pending):
+            if len(running) >= max_concurrent:
+                break
+            site = device.get("SITE", 'default')
+            site_limit = site_limits.get(site, default_site_limit)
+            if site_limit is not None and running_per_site[site] >= site_limit:
+                continue
+            pending.remove(device)
+            running_per_site[site] += 1
+            logger.info(f'Starting upgrade of {device["NAME"]} at site {site}')
+            future = executor.submit(run_device_upgrade, device, inputs_json, args.dryrun, args.force, args.debug,
+                                     getattr(args, 'resume', False), session_pool)
+            running[future] = device
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            device = running.pop(future)
+            running_per_site[device.get("SITE", 'default')] -= 1
+            try:
+                result = future.result()
+            except Exception as e:
+                # only reached if the worker itself died, e.g. a killed worker process
+                result = {'name': device["NAME"], 'site': device.get("SITE", 'default'), 'status': 'failed',
+                          'errors': [f'{type(e).__name__}: {e}'], 'warnings': [], 'duration_seconds': None}
+            results[device["NAME"]] = result
+            logger.info(f'Upgrade of {result["name"]} finished with status {result["status"]} '
+                        f'in {result["duration_seconds"]} seconds')
+
+    return [results[device["NAME"]] for device in devices]
+
+
+def stage_fleet_package(devices: list, inputs_json: dict, logger: logging.Logger, session_pool: SessionPool = None) -> list:
+    """
+    Stages LOCAL_JUNOS_PACKAGE on both REs of every device, up to STAGING_MAX_CONCURRENT REs at a time,
+    before any upgrade starts, and returns the result of each RE. The pre-checks of each upgrade then
+    find the package in place and only verify its checksum. Each RE is connected to by the worker that
+    stages it, so an unreachable RE does not hold up the others while it uses up its retries.
+    """
+    local_package = inputs_json["LOCAL_JUNOS_PACKAGE"]
+    checksum = inputs_json.get("JUNOS_PACKAGE_SHA256") or local_checksum(local_package)
+    groups = {}
+    inputs_by_host = {}
+    for device in devices:
+        device_inputs = {**inputs_json, **device}
+        key = (device_inputs["JUNOS_PACKAGE_PATH"], new_junos_package_name(device_inputs["NEW_JUNOS"]))
+        for host in (device_inputs["RE0_HOST"], device_inputs["RE1_HOST"]):
+            groups.setdefault(key, []).append(host)
+            inputs_by_host[host] = device_inputs
+
+    @contextmanager
+    def connect(host: str):
+        device_inputs = inputs_by_host[host]
+        settings = dict(connection_retries=device_inputs.get("CONNECTION_RETRIES", 20),
+                        connection_retry_interval=device_inputs.get("CONNECTION_RETRY_INTERVAL", 5))
+        if session_pool is not None:
+            caller = session_pool.acquire(host, device_inputs["USERNAME"], device_inputs["PASSWORD"],
+                                          device_inputs["PORT"], logger, **settings)
+        else:
+            caller = RpcCaller(host=host, username=device_inputs["USERNAME"], password=device_inputs["PASSWORD"],
+                               port=device_inputs["PORT"], logger=logger, **settings).open()
+        try:
+            yield caller
+        finally:
+            if session_pool is not None:
+                session_pool.release(caller)
+            else:
+                caller.close()
+
+    results = []
+    for (junos_package_path, package_name), hosts in groups.items():
+        results.extend(stage_package_on_res(hosts, local_package, junos_package_path, package_name, checksum,
+                                            bandwidth_limit=inputs_json.get("STAGING_BANDWIDTH_LIMIT"),
+                                            max_workers=inputs_json.get("STAGING_MAX_CONCURRENT", 8), logger=logger,
+                                            connect=connect))
+    return results
+
+
+def load_inventory(inputs_json: dict, inventory_file: str = None) -> list:
+    if inventory_file is not None:
+        try:
+            with open(inventory_file, 'r') as file:
+                devices = json.load(file).get("DEVICES")
+        except Exception as e:
+            raise JunosInputsError(f'Unable to read inventory file {inventory_file}: {e}')
+    else:
+        devices = inputs_json.get("DEVICES")
+
+    if not devices:
+        raise JunosInputsError('The inventory does not contain any DEVICES')
+    names = [device.get("NAME") for device in devices]
+    for device in devices:
+        if device.get("NAME") is None or device.get("RE0_HOST") is None or device.get("RE1_HOST") is None:
+            raise JunosInputsError(f'Every inventory device needs a NAME, RE0_HOST and RE1_HOST: {device}')
+        if names.count(device["NAME"]) > 1:
+            raise JunosInputsError(f'Device name {device["NAME"]} appears more than once in the inventory')
+    return devices
+
+
+def validate_concurrency_limits(inputs_json: dict):
+    """
+    A limit below 1 would leave devices that can never be scheduled, so reject it before any upgrade starts.
+    """
+    limits = {"MAX_CONCURRENT_UPGRADES": inputs_json.get("MAX_CONCURRENT_UPGRADES", 4),
+              "MAX_CONCURRENT_UPGRADES_PER_SITE": inputs_json.get("MAX_CONCURRENT_UPGRADES_PER_SITE")}
+    for site, limit in inputs_json.get("SITE_CONCURRENCY_LIMITS", {}).items():
+        limits[f'SITE_CONCURRENCY_LIMITS.{site}'] = limit
+    for name, limit in limits.items():
+        if limit is None and name == "MAX_CONCURRENT_UPGRADES_PER_SITE":
+            continue
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            raise JunosInputsError(f'{name} must be an integer of 1 or more, got {limit}')
+
+
+def fleet_upgrader():
+    """
+    This upgrader runs the dual RE upgrader against every device in an inventory, running many
+    independent upgrades at once through a thread or process pool.
+    See README.md file for details.
+
+    """
+
+    #  Create inputs_json dict by reading all json files in inputs folder
+    try:
+        inputs_json = Helpers.create_inputs_json()
+    except KeyError:
+        raise
+    except Exception as e:
+        raise JunosInputsError(e)
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    inputs_json.setdefault("FLEET_LOGS_DIR", os.path.join(cwd, 'logs'))
+    inputs_json.setdefault("DEACTIVATE_REDUNDANCY_FILE", os.path.join(cwd, 'inputs', 'deactivate_redundancy.txt'))
+    inputs_json.setdefault("ACTIVATE_REDUNDANCY_FILE", os.path.join(cwd, 'inputs', 'activate_redundancy.txt'))
+    fleet_logfile_name: str = inputs_json.get("FLEET_LOGFILE_NAME", 'fleet.log')
+    fleet_report_name: str = inputs_json.get("FLEET_REPORT_NAME", 'fleet_report.json')
+
+    # process input arguments
+    parser = argparse.ArgumentParser(description="A Junos upgrade script for a fleet of dual RE MX")
+    parser.add_argument(
+            '-d', '--dryrun',
+            dest='dryrun',
+            action='store_true',
+            help='Run the pre-checks only on every device (default: False)',
+            default=False
+    )
+    parser.add_argument(
+            '-f', '--force',
+            dest='force',
+            action='store_true',
+            help='Run the upgrades ignoring any pre-checks errors (default: False)',
+            default=False
+    )
+    parser.add_argument(
+            '-g', '--debug',
+            dest='debug',
+            action='store_true',
+            help='Run the upgrades with more detailed logging (default: False)',
+            default=False
+    )
+    parser.add_argument(
+            '-r', '--resume',
+            dest='resume',
+            action='store_true',
+            help='Resume interrupted upgrades from their checkpoints (default: False)',
+            default=False
+    )
+    parser.add_argument(
+            '-i', '--inventory',
+            dest='inventory',
+            help='Path to an inventory json file (default: DEVICES from the inputs folder)',
+            default=None
+    )
+    parser.add_argument(
+            '-p', '--pool',
+            dest='pool',
+            choices=['thread', 'process'],
+            help='Type of worker pool used to run the upgrades (default: POOL_TYPE input)',
+            default=None
+    )
+
+    # parse input flags
+    args = parser.parse_args()
+
+    # initialize logging
+    logger = Helpers.create_device_logger('fleet', inputs_json["FLEET_LOGS_DIR"], fleet_logfile_name, args.debug)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(logging.DEBUG if args.debug else logging.INFO)
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(stream_handler)
+
+    validate_concurrency_limits(inputs_json)
+    devices = load_inventory(inputs_json, args.inventory)
+    pool_type = args.pool or inputs_json.get("POOL_TYPE", 'thread')
+    max_concurrent = inputs_json.get("MAX_CONCURRENT_UPGRADES", 4)
+
+    logger.info(f'********** UPGRADING {len(devices)} DEVICES, UP TO {max_concurrent} AT A TIME **********')
+    if args.dryrun:
+        logger.info("Dryrun mode is enabled.")
+
+    started = time.time()
+    pool = ProcessPoolExecutor if pool_type == 'process' else ThreadPoolExecutor
+    # workers on threads share one session per device, workers in processes each open their own
+    session_pool = SessionPool(inputs_json.get("SESSION_RECONNECT_INTERVAL")) if pool_type == 'thread' else None
+    staging = []
+    if inputs_json.get("LOCAL_JUNOS_PACKAGE"):
+        logger.info(f'********** STAGING {inputs_json["LOCAL_JUNOS_PACKAGE"]} ON {len(devices)} DEVICES **********')
+        staging = stage_fleet_package(devices, inputs_json, logger, session_pool)
+    with pool(max_workers=max_concurrent) as executor:
+        results = run_fleet(devices, inputs_json, executor, args, logger, session_pool)
+    if session_pool is not None:
+        session_pool.close()
+    finished = time.time()
+
+    report = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(finished)),
+        'duration_seconds': round(finished - started, 1),
+        'summary': dict(Counter(result['status'] for result in results)),
+        'devices': results
+    }
+    if staging:
+        report['staging'] = staging
+
+    # write fleet report to log folder
+    with open(os.path.join(inputs_json["FLEET_LOGS_DIR"], fleet_report_name), 'w') as file:
+        json.dump(report, file, indent=4)
+
+    logger.info('********** FLEET UPGRADE REPORT **********')
+    for result in results:
+        logger.info(f'{result["name"]} ({result["site"]}): {result["status"]}, '
+                    f'{len(result["errors"])} errors, {len(result["warnings"])} warnings')
+    for status, count in report['summary'].items():
+        logger.info(f'{status}: {count}')
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    return report
+
+
+if __name__ == "__main__":
+    fleet_upgrader()
@@ -8,6 +8,12 @@ import jnpr.junos
 from rpc_processor import RpcProcessor
 from junos_upgrader_exceptions import JunosPackageInstallError, JunosRpcProcessorInitError, JunosInputsError, JunosReSwitchoverError
 from helpers import Helpers
+from upgrade_plan import UpgradePlan, PlanScheduler
+from profiler import RunProfiler
+from snapshot import SnapshotWriter, StreamingRecord
+from snapshot_store import SnapshotStore
+from session_pool import SessionPool
+from package_staging import local_checksum
 
 
 def single_re_upgrade_upgrader():
@@ -34,22 +40,48 @@ def single_re_upgrade_upgrader():
     new_junos_short: str = inputs_json.get("NEW_JUNOS")
     junos_package_path: str = inputs_json.get("JUNOS_PACKAGE_PATH")
     logfile_name: str = inputs_json.get("LOGFILE_NAME")
-    config_file_to_backup: str = inputs_json.get("CONFIG_FILE_TO_BACKUP")
-    re_model: str = inputs_json.get("RE_MODEL")
     min_isis_adj: int = inputs_json.get("MIN_ISIS_ADJ")
-    min_ospf_nei: int = inputs_json.get("MIN_OSPF_NEI")
-    max_mem_utilization: int = inputs_json.get("MAX_MEM_UTILIZATION_PERCENT")
-    min_cpu_idle: int = inputs_json.get("MIN_CPU_IDLE_PERCENT")
-    post_reboot_delay: int = inputs_json.get("POST_REBOOT_DELAY")
-    post_switchover_delay: int = inputs_json.get("POST_SWITCHOVER_DELAY")
-    post_script_completion_delay: int = inputs_json.get("POST_SCRIPT_COMPLETION_DELAY")
+    stream_subscribers: bool = inputs_json.get("STREAM_SUBSCRIBER_DETAIL", False)
+    batch_state_capture: bool = inputs_json.get("BATCH_STATE_CAPTURE", False)
+    post_reboot_ready_timeout: int = inputs_json.get("POST_REBOOT_READY_TIMEOUT", 900)
+    ready_initial_delay: int = inputs_json.get("READY_INITIAL_DELAY", 60)
+    ready_poll_interval: int = inputs_json.get("READY_POLL_INTERVAL", 5)
+    ready_max_poll_interval: int = inputs_json.get("READY_MAX_POLL_INTERVAL", 30)
+    convergence_timeout: int = inputs_json.get("CONVERGENCE_TIMEOUT", 300)
+    route_count_tolerance: float = inputs_json.get("ROUTE_COUNT_TOLERANCE_PERCENT", 0)
+    compact_snapshots: bool = inputs_json.get("COMPACT_STATE_SNAPSHOTS", False)
+    snapshot_store_path: str = inputs_json.get("SNAPSHOT_STORE")
     connection_retries: int = inputs_json.get("CONNECTION_RETRIES")
     connection_retry_interval: int = inputs_json.get("CONNECTION_RETRY_INTERVAL")
+    connection_max_retry_interval: int = inputs_json.get("CONNECTION_MAX_RETRY_INTERVAL", 60)
+    connection_deadline: int = inputs_json.get("CONNECTION_DEADLINE", 600)
+    session_reconnect_interval: int = inputs_json.get("SESSION_RECONNECT_INTERVAL")
+    keepalive_interval: int = inputs_json.get("SESSION_KEEPALIVE_INTERVAL", 10)
+    keepalive_count: int = inputs_json.get("SESSION_KEEPALIVE_COUNT", 3)
+    notifications: bool = inputs_json.get("NOTIFICATIONS", False)
+    local_junos_package: str = inputs_json.get("LOCAL_JUNOS_PACKAGE")
+    junos_package_sha256: str = inputs_json.get("JUNOS_PACKAGE_SHA256")
+    staging_bandwidth_limit: int = inputs_json.get("STAGING_BANDWIDTH_LIMIT")
 
     # derive additional junos package name parameters
     new_junos_package: str = f"junos-vmhost-install-mx-x86-64-{new_junos_short}.tgz"
     new_junos: str = f"junos-install-mx-x86-64-{new_junos_short}"
 
+    # the pre and post checks are described by the upgrade plan, see UPGRADE_PLAN.json in the inputs folder
+    plan_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inputs', 'UPGRADE_PLAN.json')
+    pre_check_plan = UpgradePlan.load(inputs_json, 'pre-checks', plan_file)
+    post_check_plan = UpgradePlan.load(inputs_json, 'post-checks', plan_file)
+
+    # a staged package is verified against the checksum of the local package unless one is given
+    if local_junos_package and not junos_package_sha256:
+        junos_package_sha256 = local_checksum(local_junos_package)
+
+    def plan_context(record: dict) -> dict:
+        return {**inputs_json, 'ACTIVE_JUNOS': active_junos, 'NEW_JUNOS_PACKAGE': new_junos_package,
+                'STREAM_SUBSCRIBER_DETAIL': stream_subscribers, 'BATCH_STATE_CAPTURE': batch_state_capture,
+                'LOCAL_JUNOS_PACKAGE': local_junos_package, 'JUNOS_PACKAGE_SHA256': junos_package_sha256,
+                'STAGING_BANDWIDTH_LIMIT': staging_bandwidth_limit, 'RECORD': record}
+
     # process input arguments
     parser = argparse.ArgumentParser(description="A Junos upgrade script for single RE router/switch")
     parser.add_argument(
@@ -115,288 +147,218 @@ def single_re_upgrade_upgrader():
     pre_upgrade_record = {}
     post_upgrade_record = {}
 
-    logger.info('********** RUNNING PRE-CHECKS **********')
-
-    # Instantiate instance of RpcProcessor class
-    logger.debug('Create instance of RpcProcessor class')
-    try:
-        rpc_processor = RpcProcessor(
-                logger=logger,
-                upgrade_error_log=upgrade_error_log,
-                upgrade_warning_log=upgrade_warning_log,
-                host=re0_host,
-                username=user,
-                password=pw,
-                port=port,
-                connection_retries=connection_retries,
-                connection_retry_interval=connection_retry_interval)
-    except Exception as e:
-        error = f'Unable to create instance of UpgradeUtils: {e}'
-        logger.error(error)
-        upgrade_error_log.append(error)
-        raise JunosRpcProcessorInitError(e)
-
-    logger.debug(f'Juniper PyEZ Version: {jnpr.junos.__version__}')
-    logger.debug(rpc_processor)
-
-    # get pre upgrade config
-    pre_upgrade_config = rpc_processor.get_config_in_set_format()
-
-    if pre_upgrade_config is not None:
-        # write pre upgrade config to log file
-        with open('logs/pre_upgrade_config.txt', 'w') as file:
-            file.write(pre_upgrade_config)
-
-    # verify no chassis alarms
-    rpc_processor.verify_no_chassis_alarms()
-
-    # Verify RE0 is Master
-    rpc_processor.verify_re_mastership(slot=0, tries=1)
-
-    # verify RE0 status
-    status = rpc_processor.verify_re_status(slot=0)
-    if status:
-
-        # verify RE0 memory usage
-        rpc_processor.verify_re_memory_utilization(max_mem_util=max_mem_utilization, slot=0)
-
-        # verify RE0 CPU idle
-        rpc_processor.verify_cpu_idle_time(min_cpu_idle, slot=0)
-
-    # verify protocol replication
-    rpc_processor.verify_protocol_replication()
-
-    # verify PIC status
-    rpc_processor.verify_pic_status()
-
-    # verify existing Junos version on RE0
-    rpc_processor.verify_active_junos_version(expected_junos=active_junos, slot=0)
-
-    # verify RE0 model version
-    rpc_processor.verify_re_model(re_model, slot=0)
-
-    # verify proposed Junos package exists on RE0
-    rpc_processor.verify_proposed_junos_install_package_exists_on_re(
-        junos_package_path=junos_package_path,
-        proposed_package_name=new_junos_package, slot=0)
-
-    # verify number of disks on RE0
-    rpc_processor.verify_number_of_disks_on_re(slot=0, expected_disks=2)
-
-    # verify minimum number of 'Up' ISIS adjacencies
-    rpc_processor.verify_number_of_up_isis_adjacencies(min_isis_adjacencies=min_isis_adj, slot=0)
-
-    # verify minimum number of 'Full' OSPF neighbors
-    rpc_processor.verify_number_of_full_ospf_neighbors(min_ospf_neighbors=min_ospf_nei, slot=0)
-
-    # backup config files
-    rpc_processor.copy_file_on_device(f're0:/config/{config_file_to_backup}', 're0:/var/tmp/PreUpgrade.conf.gz')
-    rpc_processor.copy_file_on_device(f're1:/config/{config_file_to_backup}', 're1:/var/tmp/PreUpgrade.conf.gz')
+    def create_record(phase: str) -> dict:
+        # the record streams each record type to a compact snapshot and the snapshot store as it is captured
+        writers = []
+        if compact_snapshots:
+            writers.append(SnapshotWriter(f'logs/{phase}_upgrade_state.snap'))
+        if snapshot_store is not None:
+            writers.append(snapshot_store.writer(run_id, phase))
+        return StreamingRecord(*writers) if writers else {}
 
-    # record chassis hardware
-    rpc_processor.record_chassis_hardware(pre_upgrade_record)
+    # every RPC, step and wait is timed and the run profile is written to the logs folder when the run ends
+    profiler = RunProfiler()
 
-    # record subscriber count for each subscriber type
-    rpc_processor.record_subscriber_count_for_each_subscriber_type(pre_upgrade_record)
+    # the state of every run is also kept in the snapshot store, if there is one, for queries across runs
+    snapshot_store = SnapshotStore(snapshot_store_path) if snapshot_store_path else None
+    session_pool = SessionPool(reconnect_interval=session_reconnect_interval)
+    run_id = None
+    rpc_processor = None
 
-    # record isis adjacencies
-    rpc_processor.record_isis_adjacency_info(pre_upgrade_record)
-
-    # record ospf neighbors
-    rpc_processor.record_ospf_neighbor_info(pre_upgrade_record)
-
-    # record bgp summary
-    rpc_processor.record_bgp_summary_info(pre_upgrade_record)
+    try:
+        logger.info('********** RUNNING PRE-CHECKS **********')
+
+        # Instantiate instance of RpcProcessor class
+        logger.debug('Create instance of RpcProcessor class')
+        try:
+            rpc_processor = RpcProcessor(
+                    logger=logger,
+                    upgrade_error_log=upgrade_error_log,
+                    upgrade_warning_log=upgrade_warning_log,
+                    host=re0_host,
+                    username=user,
+                    password=pw,
+                    port=port,
+                    connection_retries=connection_retries,
+                    connection_retry_interval=connection_retry_interval,
+                    connection_max_retry_interval=connection_max_retry_interval,
+                    connection_deadline=connection_deadline,
+                    keepalive_interval=keepalive_interval,
+                    keepalive_count=keepalive_count,
+                    notifications=notifications,
+                    session_pool=session_pool,
+                    profiler=profiler)
+        except Exception as e:
+            error = f'Unable to create instance of UpgradeUtils: {e}'
+            logger.error(error)
+            upgrade_error_log.append(error)
+            raise JunosRpcProcessorInitError(e)
 
-    # record interface state
-    rpc_processor.record_interface_state(pre_upgrade_record)
+        logger.debug(f'Juniper PyEZ Version: {jnpr.junos.__version__}')
+        logger.debug(rpc_processor)
 
-    # record ldp adjacencies
-    rpc_processor.record_ldp_session_info(pre_upgrade_record)
+        if snapshot_store is not None:
+            run_id = snapshot_store.start_run(inputs_json.get("NAME", re0_host), active_junos, new_junos_short)
 
-    # record protocol replication state
-    rpc_processor.record_protocol_replication_state(pre_upgrade_record)
+        pre_upgrade_record = create_record('pre')
 
-    # record bfd session info
-    rpc_processor.record_bfd_session_info(pre_upgrade_record)
+        # cache read-only RPC replies shared by several pre-checks
+        rpc_processor.dev.start_cache_phase('pre-check')
 
-    # record PIC info
-    rpc_processor.record_pic_info(pre_upgrade_record)
+        with profiler.span('pre-checks', 'phase'):
+            results = PlanScheduler(pre_check_plan, {'re0': rpc_processor}, plan_context(pre_upgrade_record), logger,
+                                    upgrade_error_log, upgrade_warning_log, profiler).run()
 
-    # record chassis alarms
-    rpc_processor.record_chassis_alarms(pre_upgrade_record)
+        # get pre upgrade config
+        pre_upgrade_config = results['re0-pre-upgrade-config']
 
-    # record L2 circuit info
-    rpc_processor.record_l2_circuit_info(pre_upgrade_record)
+        if pre_upgrade_config is not None:
+            # write pre upgrade config to log file
+            with open('logs/pre_upgrade_config.txt', 'w') as file:
+                file.write(pre_upgrade_config)
 
-    # record route summary
-    rpc_processor.record_route_summary(pre_upgrade_record)
+        rpc_processor.dev.end_cache_phase()
 
-    # write state info to log file
-    with open('logs/pre_upgrade_state.json', 'w') as file:
-        json.dump(pre_upgrade_record, file, indent=4)
+        if isinstance(pre_upgrade_record, StreamingRecord):
+            pre_upgrade_record.close()
 
-    if len(upgrade_warning_log) != 0:
-        # 1 or more pre-check warnings
-        error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE PRE-CHECK WARNINGS **********'
-        logger.error(error)
+        # write state info to log file
+        with open('logs/pre_upgrade_state.json', 'w') as file:
+            json.dump(pre_upgrade_record, file, indent=4)
 
-        for warning in upgrade_warning_log:
-            logger.error(warning)
+        if len(upgrade_warning_log) != 0:
+            # 1 or more pre-check warnings
+            error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE PRE-CHECK WARNINGS **********'
+            logger.error(error)
 
-    if len(upgrade_error_log) != 0 and not args.force:
-        # 1 or more pre-check errors
-        error = '********** \u274C: THERE ARE ONE OR MORE PRE-CHECK ERRORS **********'
-        logger.error(error)
-        error = '********** PLEASE FIX THE FOLLOWING ERRORS BEFORE RE-TRYING **********'
-        logger.error(error)
+            for warning in upgrade_warning_log:
+                logger.error(warning)
 
-        for error in upgrade_error_log:
+        if len(upgrade_error_log) != 0 and not args.force:
+            # 1 or more pre-check errors
+            error = '********** \u274C: THERE ARE ONE OR MORE PRE-CHECK ERRORS **********'
+            logger.error(error)
+            error = '********** PLEASE FIX THE FOLLOWING ERRORS BEFORE RE-TRYING **********'
             logger.error(error)
 
-        rpc_processor.dev.close()
-
-        sys.exit()
+            for error in upgrade_error_log:
+                logger.error(error)
 
-    else:
-        # PRE-CHECKS COMPLETE
-        logger.info('********** PRE-CHECKS COMPLETE **********')
-        if args.dryrun:
-            logger.info('********** DRY RUN FLAG SET. ENDING UPGRADE SCRIPT **********')
             sys.exit()
-        elif len(upgrade_error_log) != 0 and args.force:
-            logger.info('********** FORCE FLAG SET. CONTINUING WITH UPGRADE DESPITE ERRORS **********')
-        else:
-            logger.info('********** CONTINUING WITH UPGRADE **********')
-
-    logger.info('********** UPGRADING **********')
-
-    # make sure we are still connected to re
-    if not rpc_processor.dev.device.connected:
-        rpc_processor.dev.open()
-
-    # create and save rescue config on the device
-    rpc_processor.create_rescue_config('private')
 
-    # Installing and rebooting new Junos version on RE, Partition 1
-    rpc_processor.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
-    rpc_processor.reboot_re(0)
-    logger.info(f'RE0 rebooting, waiting {post_reboot_delay} seconds before trying to reconnect')
-    rpc_processor.countdown_timer(post_reboot_delay)
-    rpc_processor.dev.open()
-
-    # Installing and rebooting new Junos version on RE, Partition 2
-    rpc_processor.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
-    rpc_processor.reboot_re(0)
-    logger.info(f'RE0 rebooting, waiting {post_reboot_delay} seconds before trying to reconnect')
-    rpc_processor.countdown_timer(post_reboot_delay)
-    rpc_processor.dev.open()
-
-    # check that new junos is installed on both partitions of re
-    rpc_processor.check_matching_junos_on_partitions(new_junos)
-
-    # Validate new Junos version on RE0
-    rpc_processor.validate_junos_on_device(junos_package_path, new_junos_package)
-
-    # verify that new Junos is now running on RE0
-    if not rpc_processor.verify_active_junos_version(expected_junos=new_junos_short, slot=0):
-        raise JunosPackageInstallError(f'RE0 is not running the expected Junos version {new_junos_short}')
-
-    # delay to ensure everything is stable before running post checks
-    logger.info(f'Waiting {post_script_completion_delay} seconds for routing convergence')
-    rpc_processor.countdown_timer(post_script_completion_delay)
-
-    logger.info('********** RUNNING POST UPGRADE CHECKS AND GATHERING STATE DATA **********')
-
-    # reset active junos param prior to post upgrade checks because we are now running new version
-    active_junos: str = new_junos_short
-
-    # verify no chassis alarms
-    rpc_processor.verify_no_chassis_alarms()
+        else:
+            # PRE-CHECKS COMPLETE
+            logger.info('********** PRE-CHECKS COMPLETE **********')
+            if args.dryrun:
+                logger.info('********** DRY RUN FLAG SET. ENDING UPGRADE SCRIPT **********')
+                sys.exit()
+            elif len(upgrade_error_log) != 0 and args.force:
+                logger.info('********** FORCE FLAG SET. CONTINUING WITH UPGRADE DESPITE ERRORS **********')
+            else:
+                logger.info('********** CONTINUING WITH UPGRADE **********')
 
-    # verify minimum number of 'Up' ISIS adjacencies
-    rpc_processor.verify_number_of_up_isis_adjacencies(min_isis_adjacencies=min_isis_adj, slot=0)
+        logger.info('********** UPGRADING **********')
 
-    # verify minimum number of 'Full' OSPF neighbors
-    rpc_processor.verify_number_of_full_ospf_neighbors(min_ospf_neighbors=min_ospf_nei, slot=0)
+        # make sure we are still connected to re
+        if not rpc_processor.dev.device.connected:
+            rpc_processor.dev.open()
 
-    # record chassis hardware
-    rpc_processor.record_chassis_hardware(post_upgrade_record)
+        # create and save rescue config on the device
+        rpc_processor.create_rescue_config('private')
 
-    # record subscriber count for each subscriber type
-    rpc_processor.record_subscriber_count_for_each_subscriber_type(post_upgrade_record)
+        # Installing and rebooting new Junos version on RE, Partition 1
+        rpc_processor.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
+        rpc_processor.reboot_re(0)
+        rpc_processor.wait_for_re_ready(slot=0, timeout=post_reboot_ready_timeout, initial_delay=ready_initial_delay,
+                                        poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
 
-    # record isis adjacencies
-    rpc_processor.record_isis_adjacency_info(post_upgrade_record)
+        # Installing and rebooting new Junos version on RE, Partition 2
+        rpc_processor.install_junos_on_device(junos_package_path=junos_package_path, new_junos_package=new_junos_package, re_number=0)
+        rpc_processor.reboot_re(0)
+        rpc_processor.wait_for_re_ready(slot=0, timeout=post_reboot_ready_timeout, initial_delay=ready_initial_delay,
+                                        poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
 
-    # record ospf neighbors
-    rpc_processor.record_ospf_neighbor_info(pre_upgrade_record)
+        # check that new junos is installed on both partitions of re
+        rpc_processor.check_matching_junos_on_partitions(new_junos)
 
-    # record bgp neighbors
-    rpc_processor.record_bgp_summary_info(post_upgrade_record)
+        # Validate new Junos version on RE0
+        rpc_processor.validate_junos_on_device(junos_package_path, new_junos_package)
 
-    # record interface state
-    rpc_processor.record_interface_state(post_upgrade_record)
+        # verify that new Junos is now running on RE0
+        if not rpc_processor.verify_active_junos_version(expected_junos=new_junos_short, slot=0):
+            raise JunosPackageInstallError(f'RE0 is not running the expected Junos version {new_junos_short}')
 
-    # record ldp adjacencies
-    rpc_processor.record_ldp_session_info(post_upgrade_record)
+        # wait for routing to be stable before running post checks
+        rpc_processor.wait_for_routing_convergence(min_isis_adjacencies=min_isis_adj, timeout=convergence_timeout,
+                                                   poll_interval=ready_poll_interval, max_poll_interval=ready_max_poll_interval)
 
-    # record protocol replication state
-    rpc_processor.record_protocol_replication_state(post_upgrade_record)
+        logger.info('********** RUNNING POST UPGRADE CHECKS AND GATHERING STATE DATA **********')
 
-    # record bfd session info
-    rpc_processor.record_bfd_session_info(post_upgrade_record)
+        # reset active junos param prior to post upgrade checks because we are now running new version
+        active_junos: str = new_junos_short
 
-    # record PIC info
-    rpc_processor.record_pic_info(post_upgrade_record)
+        post_upgrade_record = create_record('post')
 
-    # record chassis alarms
-    rpc_processor.record_chassis_alarms(post_upgrade_record)
+        # cache read-only RPC replies shared by several post-checks
+        rpc_processor.dev.start_cache_phase('post-check')
 
-    # record L2 circuit info
-    rpc_processor.record_l2_circuit_info(post_upgrade_record)
+        with profiler.span('post-checks', 'phase'):
+            PlanScheduler(post_check_plan, {'re0': rpc_processor}, plan_context(post_upgrade_record), logger,
+                          upgrade_error_log, upgrade_warning_log, profiler).run()
 
-    # record route summary
-    rpc_processor.record_route_summary(post_upgrade_record)
+        rpc_processor.dev.end_cache_phase()
 
-    # write state info to log file
-    with open('logs/post_upgrade_state.json', 'w') as file:
-        json.dump(post_upgrade_record, file, indent=4)
+        if isinstance(post_upgrade_record, StreamingRecord):
+            post_upgrade_record.close()
 
-    # get post upgrade config
-    post_upgrade_config = rpc_processor.get_config_in_set_format()
+        # write state info to log file
+        with open('logs/post_upgrade_state.json', 'w') as file:
+            json.dump(post_upgrade_record, file, indent=4)
 
-    # write post upgrade config to log file
-    with open('logs/post_upgrade_config.txt', 'w') as file:
-        file.write(post_upgrade_config)
+        # get post upgrade config
+        post_upgrade_config = rpc_processor.get_config_in_set_format()
 
-    logger.info('********** UPGRADE COMPLETE **********')
+        # write post upgrade config to log file
+        with open('logs/post_upgrade_config.txt', 'w') as file:
+            file.write(post_upgrade_config)
 
-    # if 1 or more warnings
-    if len(upgrade_warning_log) != 0:
-        error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE UPGRADE WARNINGS **********'
-        logger.error(error)
+        logger.info('********** UPGRADE COMPLETE **********')
 
-        for warning in upgrade_warning_log:
-            logger.error(warning)
+        # if 1 or more warnings
+        if len(upgrade_warning_log) != 0:
+            error = '********** \u26A0\uFE0F: THERE ARE ONE OR MORE UPGRADE WARNINGS **********'
+            logger.error(error)
 
-    # if 1 or more errors
-    if len(upgrade_error_log) != 0:
-        error = '********** \u274C: THERE ARE ONE OR MORE UPGRADE ERRORS **********'
-        logger.error(error)
+            for warning in upgrade_warning_log:
+                logger.error(warning)
 
-        for error in upgrade_error_log:
+        # if 1 or more errors
+        if len(upgrade_error_log) != 0:
+            error = '********** \u274C: THERE ARE ONE OR MORE UPGRADE ERRORS **********'
             logger.error(error)
 
-    logger.info('********** COMPARING PRE & POST CONFIG **********')
+            for error in upgrade_error_log:
+                logger.error(error)
+
+        logger.info('********** COMPARING PRE & POST CONFIG **********')
 
-    rpc_processor.compare_configs(pre_upgrade_config, post_upgrade_config)
+        rpc_processor.compare_configs(pre_upgrade_config, post_upgrade_config, 'logs/config_diff.json')
 
-    logger.info('********** COMPARING PRE & POST STATE **********')
+        logger.info('********** COMPARING PRE & POST STATE **********')
 
-    rpc_processor.run_compare_state_dicts(pre_upgrade_record, post_upgrade_record)
+        rpc_processor.run_compare_state_dicts(pre_upgrade_record, post_upgrade_record,
+                                              {'route-summary': route_count_tolerance})
 
-    logger.info('Enjoy your favorite beverage! \U0001F600')
+        logger.info('Enjoy your favorite beverage! \U0001F600')
+    finally:
+        # the session, the session pool and the snapshot store are closed and the run profile written however
+        # the run ends
+        if rpc_processor is not None:
+            rpc_processor.close()
+        session_pool.close()
+        if snapshot_store is not None:
+            snapshot_store.close()
+        profiler.write('logs', logger)
 
 
 if __name__ == "__main__":
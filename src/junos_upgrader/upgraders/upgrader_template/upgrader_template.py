@@ -148,7 +148,7 @@ def upgrader_template():
         for error in upgrade_error_log:
             logger.error(error)
 
-        rpc_processor_re0.dev.close()
+        rpc_processor_re0.close()
 
         sys.exit()
 
@@ -200,7 +200,7 @@ def upgrader_template():
 
     logger.info('********** COMPARING PRE & POST CONFIG **********')
 
-    rpc_processor_re0.compare_configs(pre_upgrade_config, post_upgrade_config)
+    rpc_processor_re0.compare_configs(pre_upgrade_config, post_upgrade_config, 'logs/config_diff.json')
 
     logger.info('********** COMPARING PRE & POST STATE **********')
 
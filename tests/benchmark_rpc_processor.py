@@ -0,0 +1,220 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+
+Benchmarks the RpcProcessor parsers against replies scaled up from the fixtures in
+resources/rpc_responses, and fails if a parser has become slower or needs more memory than the
+baseline in resources/benchmark_baseline.json allows.
+
+    python benchmark_rpc_processor.py                     # compare with the baseline
+    python benchmark_rpc_processor.py --update-baseline   # store the results as the new baseline
+
+Timings depend on the machine, so update the baseline on the machine the benchmark is run on.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+import multiprocessing
+from pathlib import Path
+from unittest import mock
+from lxml import etree
+from jnpr.junos import Device
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath('src', 'junos_upgrader')))
+from rpc_processor import RpcProcessor
+from netconf_simulator import load_fixture, scale_reply
+
+BASELINE_FILE = Path(__file__).resolve().parent.joinpath('resources', 'benchmark_baseline.json')
+SCALES = [1, 100, 10000]
+
+# method, arguments and the RPC replies the method parses. record_* methods also get an empty record.
+CASES = [
+    ('record_chassis_hardware', {}, {'get-chassis-inventory': 'get_chassis_hardware_as_xml.xml'}),
+    ('record_isis_adjacency_info', {}, {'get-isis-adjacency-information': 'get_isis_adjacency_information.xml'}),
+    ('record_ospf_neighbor_info', {}, {'get-ospf-neighbor-information': 'get_ospf_neighbor_information.xml'}),
+    ('record_bgp_summary_info', {}, {'get-bgp-summary-information': 'get_bgp_peers_by_group.xml'}),
+    ('record_protocol_replication_state', {}, {'get-routing-task-replication-state': 'get_protocol_replication_state.xml'}),
+    ('record_pic_info', {}, {'get-pic-information': 'get_pic_info_as_xml.xml'}),
+    ('record_chassis_alarms', {}, {'get-alarm-information': 'get_chassis_alarm_information_as_xml.xml'}),
+    ('record_interface_state', {}, {'get-interface-information': 'get_interface_info_terse_as_xml.xml'}),
+    ('record_subscriber_count_for_each_subscriber_type', {}, {'get-subscribers': 'get_subscriber_detail_as_xml.xml'}),
+    ('record_l2_circuit_info', {}, {'get-l2ckt-connection-information': 'get_l2_circuit_info_as_xml.xml'}),
+    ('record_ldp_session_info', {}, {'get-ldp-session-information': 'get_ldp_session_info_as_xml.xml'}),
+    ('record_route_summary', {}, {'get-route-summary-information': 'get_route_summary_as_xml.xml'}),
+    ('record_bfd_session_info', {}, {'get-bfd-session-information': 'get_bfd_session_info_as_xml.xml'}),
+    ('verify_no_chassis_alarms', {}, {'get-alarm-information': 'get_chassis_alarm_information_as_xml.xml'}),
+    ('verify_bgp_peers_by_group', {'bgp_group_names': ['GROUP1', 'GROUP2'], 'min_peers_by_group': [2, 2]},
+     {'get-bgp-summary-information': 'get_bgp_peers_by_group.xml'}),
+    ('verify_protocol_replication', {'use_cache': False},
+     {'get-routing-task-replication-state': 'get_protocol_replication_state.xml'}),
+    ('verify_pic_status', {}, {'get-pic-information': 'get_pic_info_as_xml.xml'}),
+    ('verify_number_of_up_isis_adjacencies', {'min_isis_adjacencies': 2, 'slot': 0},
+     {'get-isis-adjacency-information': 'get_isis_adjacency_information.xml'}),
+    ('verify_number_of_full_ospf_neighbors', {'min_ospf_neighbors': 2, 'slot': 0},
+     {'get-ospf-neighbor-information': 'get_ospf_neighbor_information.xml'}),
+    ('verify_l2_circuit_in_up_state', {}, {'get-l2ckt-connection-information': 'get_l2_circuit_info_as_xml.xml'}),
+    ('verify_ldp_sessions_in_operational_and_open_state', {},
+     {'get-ldp-session-information': 'get_ldp_session_info_as_xml.xml'}),
+]
+
+
+def scaled_replies(fixtures: dict, scale: int) -> dict:
+    return {rpc: etree.tostring(scale_reply(load_fixture(name), scale)) for rpc, name in fixtures.items()}
+
+
+def create_rpc_processor(replies: dict) -> RpcProcessor:
+    """
+    Returns an RpcProcessor whose RPCs are answered with replies, parsed from bytes on every call as
+    PyEZ would parse them from the session, so the measurements include building the reply tree.
+    """
+    logger = logging.getLogger('benchmark')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    with mock.patch.object(Device, 'open', lambda device: setattr(device, 'connected', True)):
+        rpc_processor = RpcProcessor(logger=logger, upgrade_error_log=[], upgrade_warning_log=[], host='benchmark',
+                                     username='username', password='password', port=830, connection_retries=1,
+                                     connection_retry_interval=0)
+    parser = etree.XMLParser(huge_tree=True, remove_blank_text=True)
+    rpc_processor.dev.device.execute = lambda rpc_cmd, *args, **kwargs: etree.fromstring(replies[rpc_cmd.tag], parser)
+    return rpc_processor
+
+
+def peak_rss_available() -> bool:
+    return os.path.exists('/proc/self/clear_refs')
+
+
+def read_kb(field: str) -> int:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(method_name: str, kwargs: dict, replies: dict, repeat: int) -> dict:
+    """
+    Runs the method repeat times and returns the best time in seconds and the peak memory in MB the
+    first run needed. Peak memory is the rise in peak RSS, which also covers the memory libxml2
+    allocates for the reply tree, where /proc allows the peak to be reset, and the Python heap
+    high-water mark otherwise.
+    """
+    rpc_processor = create_rpc_processor(replies)
+    method = getattr(rpc_processor, method_name)
+
+    def call():
+        arguments = dict(kwargs)
+        if method_name.startswith('record_'):
+            arguments['record'] = {}
+        method(**arguments)
+        return rpc_processor.upgrade_error_log
+
+    gc.collect()
+    if peak_rss_available():
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        before = read_kb('VmRSS:')
+        errors = call()
+        peak_mb = max(read_kb('VmHWM:') - before, 0) / 1024
+    else:
+        tracemalloc.start()
+        errors = call()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    if any('Unable to' in error for error in errors):
+        raise RuntimeError(f'{method_name} failed: {errors}')
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - start)
+    return {'seconds': round(min(seconds), 6), 'peak_mb': round(peak_mb, 2)}
+
+
+def _measure_in_child(queue, *args):
+    try:
+        queue.put(measure(*args))
+    except Exception as e:
+        queue.put(e)
+
+
+def run_case(method_name: str, kwargs: dict, fixtures: dict, scale: int) -> dict:
+    """
+    Measures one method at one scale in a process of its own, so that memory left over by earlier
+    cases does not hide the memory this one needs.
+    """
+    replies = scaled_replies(fixtures, scale)
+    repeat = 5 if scale < 10000 else 1
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return measure(method_name, kwargs, replies, repeat)
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    child = context.Process(target=_measure_in_child, args=(queue, method_name, kwargs, replies, repeat))
+    child.start()
+    result = queue.get()
+    child.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def run_benchmarks(scales: list = None, methods: list = None, report=print) -> dict:
+    results = {}
+    for method_name, kwargs, fixtures in CASES:
+        if methods and method_name not in methods:
+            continue
+        for scale in scales or SCALES:
+            result = run_case(method_name, kwargs, fixtures, scale)
+            results.setdefault(method_name, {})[str(scale)] = result
+            report(f'{method_name:<52} {scale:>6}x {result["seconds"] * 1000:>10.2f} ms {result["peak_mb"]:>9.2f} MB')
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float = 0.5, min_seconds: float = 0.005,
+                     min_mb: float = 2.0) -> list:
+    """
+    Returns a description of every result that is more than tolerance, e.g. 0.5 for 50%, above its
+    baseline. Differences below min_seconds and min_mb are ignored as noise.
+    """
+    regressions = []
+    for method_name, scales in results.items():
+        for scale, result in scales.items():
+            expected = baseline.get(method_name, {}).get(scale)
+            if expected is None:
+                continue
+            for key, unit, floor in (('seconds', 's', min_seconds), ('peak_mb', 'MB', min_mb)):
+                limit = expected[key] * (1 + tolerance)
+                if result[key] > limit and result[key] - expected[key] > floor:
+                    regressions.append(f'{method_name} at {scale}x: {key} {result[key]:.3f}{unit}, '
+                                       f'baseline {expected[key]:.3f}{unit}')
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the RpcProcessor parsers against large replies")
+    parser.add_argument('-s', '--scales', type=int, nargs='+', default=SCALES, help=f'reply scales (default: {SCALES})')
+    parser.add_argument('-m', '--methods', nargs='+', help='methods to benchmark (default: all)')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.5, help='allowed slow down, 0.5 is 50%% (default: 0.5)')
+    parser.add_argument('-u', '--update-baseline', action='store_true', help='store the results as the baseline')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.methods)
+
+    baseline = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+    if args.update_baseline:
+        for method_name, scales in results.items():
+            baseline.setdefault(method_name, {}).update(scales)
+        BASELINE_FILE.write_text(json.dumps(baseline, indent=4, sort_keys=True) + '\n')
+        print(f'Baseline written to {BASELINE_FILE}')
+        sys.exit(0)
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION: {regression}')
+    sys.exit(1 if regressions else 0)
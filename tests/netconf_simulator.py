@@ -0,0 +1,425 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import re
+import sys
+import time
+import copy
+import socket
+import argparse
+import threading
+from pathlib import Path
+from lxml import etree
+import paramiko
+
+RESOURCES_DIR = Path(__file__).resolve().parent.joinpath('resources', 'rpc_responses')
+DELIMITER = b']]>]]>'
+SERVER_HELLO = (b'<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+                b'<capability>urn:ietf:params:netconf:base:1.0</capability>'
+                b'<capability>http://xml.juniper.net/netconf/junos/1.0</capability>'
+                b'<capability>urn:ietf:params:netconf:capability:notification:1.0</capability>'
+                b'</capabilities><session-id>%d</session-id></hello>' + DELIMITER)
+
+# replies served as they are, by RPC
+FIXTURES = {
+    'get-alarm-information': 'get_chassis_alarm_information_none_as_xml.xml',
+    'get-pic-information': 'get_pic_info_as_xml.xml',
+    'get-routing-task-replication-state': 'get_protocol_replication_state.xml',
+    'get-isis-adjacency-information': 'get_isis_adjacency_information.xml',
+    'get-ospf-neighbor-information': 'get_ospf_neighbor_information.xml',
+    'get-chassis-inventory': 'get_chassis_hardware_as_xml.xml',
+    'get-subscribers': 'get_subscriber_detail_as_xml.xml',
+    'get-bgp-summary-information': 'get_bgp_peers_by_group.xml',
+    'get-interface-information': 'get_interface_info_terse_as_xml.xml',
+    'get-ldp-session-information': 'get_ldp_session_info_as_xml.xml',
+    'get-bfd-session-information': 'get_bfd_session_info_as_xml.xml',
+    'get-l2ckt-connection-information': 'get_l2_circuit_info_as_xml.xml',
+    'get-route-summary-information': 'get_route_summary_as_xml.xml',
+    'get-configuration': 'get_configuration_in_set_format.xml',
+    'request-vmhost-package-validate': 'request_vmhost_package_validate.xml',
+    'request-chassis-routing-engine-switch': 'request_re_switchover.xml',
+}
+
+# RPCs that change the device and are answered with <ok/>
+OK_RPCS = {'open-configuration', 'close-configuration', 'lock-configuration', 'unlock-configuration',
+           'load-configuration', 'commit-configuration', 'request-save-rescue-configuration', 'file-copy',
+           'request-vmhost-package-add', 'request-vmhost-reboot', 'close-session', 'create-subscription'}
+
+
+def load_fixture(name: str) -> etree.Element:
+    return etree.parse(str(RESOURCES_DIR.joinpath(name)), etree.XMLParser(remove_blank_text=True)).getroot()
+
+
+def scale_reply(reply: etree.Element, factor: int) -> etree.Element:
+    """
+    Returns a copy of reply with each repeated child element, e.g. every subscriber or interface,
+    repeated factor times, so replies of any size can be made from the small fixtures.
+    """
+    reply = copy.deepcopy(reply)
+    parents = [reply] + [element for element in reply.iter() if len(element) > 1]
+    for parent in parents:
+        tags = [child.tag for child in parent]
+        repeated = {tag for tag in tags if tags.count(tag) > 1} or ({tags[0]} if parent is reply and tags else set())
+        # repeat the repeated children as a block, so interleaved pairs such as a name followed by its
+        # state stay paired
+        block = [child for child in parent if child.tag in repeated]
+        for _ in range(factor - 1):
+            parent.extend(copy.deepcopy(child) for child in block)
+        if repeated:
+            break
+    return reply
+
+
+class SimulatedRe:
+    """
+    The state of one routing engine: the Junos on each of its two boot partitions, the partition
+    it runs from and whether it is rebooting.
+    """
+    def __init__(self, slot: int, version: str):
+        self.slot = slot
+        self.partitions = {'p': version, 'b': version}
+        self.boot_set = 'p'
+        self.next_boot_set = 'p'
+        self.rebooting = False
+
+    @property
+    def version(self) -> str:
+        return self.partitions[self.boot_set]
+
+
+class NetconfSimulator:
+    """
+    A dual RE MX that speaks NETCONF 1.0 over SSH on the loopback addresses, RE0 on 127.0.0.1 and RE1
+    on 127.0.0.2, both on the same port. Replies are made from the fixtures in resources/rpc_responses.
+
+    Installing a package writes it to the partition the RE does not run from, and a reboot boots
+    that partition, so after two install and reboot cycles the RE runs the new Junos from both.
+    A reboot closes the sessions of the RE and stops it listening for reboot_seconds. A switchover
+    moves mastership to the other RE. Tests can script the same events with reboot and switchover.
+    Sessions that create a subscription are sent a syslog notification on every switchover, and any
+    other notification a test sends with notify.
+
+    files lists the files of each directory with their size, by default the packages in
+    get_re_files.xml. latency is added to every reply, and reply_scale repeats the entries of the replies to the
+    given RPCs, e.g. {'get-subscribers': 10000}, to exercise the upgrader with large devices.
+    """
+    def __init__(self, port: int = 0, username: str = 'username', password: str = 'password',
+                 version: str = '19.4R3-S4.1', latency: float = 0.0, reply_scale: dict = None,
+                 reboot_seconds: float = 1.0, addresses: tuple = ('127.0.0.1', '127.0.0.2'), files: dict = None):
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.reply_scale = reply_scale or {}
+        self.reboot_seconds = reboot_seconds
+        self.addresses = addresses
+        self.res = [SimulatedRe(slot, version) for slot in range(len(addresses))]
+        self.master = 0
+        self.host_key = paramiko.ECDSAKey.generate()
+        self.lock = threading.Lock()
+        self.listeners = {}
+        self.transports = {slot: [] for slot in range(len(addresses))}
+        self.rpcs = []
+        self.sessions = 0
+        # the channels of the sessions that created a subscription, with the lock their writes share
+        self.subscribers = {slot: [] for slot in range(len(addresses))}
+        self.running = False
+        self.fixtures = {rpc: load_fixture(name) for rpc, name in FIXTURES.items()}
+        if files is None:
+            directory = load_fixture('get_re_files.xml').find('directory')
+            files = {directory.get('name') + '/': {name: 1500000000 for name in directory.xpath('file-information/file-name/text()')}}
+        self.files = files
+
+    def __str__(self):
+        return f"Instance of NetconfSimulator( addresses: {self.addresses}, port: {self.port}, master: RE{self.master})"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self.running = True
+        for slot in range(len(self.addresses)):
+            self.listen(slot)
+        return self
+
+    def stop(self):
+        self.running = False
+        for slot in range(len(self.addresses)):
+            self.close_listener(slot)
+            self.drop_sessions(slot)
+
+    def listen(self, slot: int):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.addresses[slot], self.port))
+        # every RE listens on the port the first one was given
+        self.port = listener.getsockname()[1]
+        listener.listen(16)
+        with self.lock:
+            self.listeners[slot] = listener
+        threading.Thread(target=self.accept, args=(slot, listener), name=f'simulator-re{slot}', daemon=True).start()
+
+    def close_listener(self, slot: int):
+        with self.lock:
+            listener = self.listeners.pop(slot, None)
+        if listener is not None:
+            # shutdown wakes the thread blocked in accept so the port is free to listen on again
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            listener.close()
+
+    def drop_sessions(self, slot: int):
+        with self.lock:
+            transports, self.transports[slot] = self.transports[slot], []
+            self.subscribers[slot] = []
+        for transport in transports:
+            transport.close()
+
+    def reboot(self, slot: int, seconds: float = None):
+        """
+        Reboots the RE: its sessions are closed and it is unreachable for seconds, after which it
+        runs from the partition the last install was written to.
+        """
+        seconds = self.reboot_seconds if seconds is None else seconds
+        re_state = self.res[slot]
+        re_state.rebooting = True
+        self.close_listener(slot)
+        self.drop_sessions(slot)
+
+        def boot():
+            re_state.boot_set = re_state.next_boot_set
+            re_state.rebooting = False
+            if self.running:
+                self.listen(slot)
+        timer = threading.Timer(seconds, boot)
+        timer.daemon = True
+        timer.start()
+
+    def switchover(self):
+        with self.lock:
+            self.master = 1 - self.master
+            master = self.master
+        for slot in range(len(self.addresses)):
+            self.notify(slot, f'chassisd[1422]: CHASSISD_RE_MASTERSHIP_CHANGE: Routing Engine {master} became master')
+
+    def notify(self, slot: int, message: str):
+        """
+        Sends a syslog notification, e.g. "rpd[1234]: RPD_ISIS_ADJUP: IS-IS new L2 adjacency to r1 on
+        et-0/0/0.0", to the sessions of the RE that subscribed to notifications.
+        """
+        notification = etree.Element('notification', nsmap={None: 'urn:ietf:params:xml:ns:netconf:notification:1.0'})
+        etree.SubElement(notification, 'eventTime').text = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        etree.SubElement(notification, 'syslog-message').text = message
+        data = etree.tostring(notification) + DELIMITER
+        with self.lock:
+            subscribers = list(self.subscribers[slot])
+        for channel, lock in subscribers:
+            try:
+                with lock:
+                    channel.sendall(data)
+            except (OSError, EOFError, paramiko.SSHException):
+                pass
+
+    def accept(self, slot: int, listener: socket.socket):
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve, args=(slot, connection), daemon=True).start()
+
+    def serve(self, slot: int, connection: socket.socket):
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self.host_key)
+        server = _SshServer(self.username, self.password)
+        try:
+            transport.start_server(server=server)
+            channel = transport.accept(30)
+            if channel is None or not server.netconf.wait(30):
+                return
+            with self.lock:
+                self.transports[slot].append(transport)
+                self.sessions += 1
+                session_id = self.sessions
+            self.netconf(slot, channel, session_id)
+        except (EOFError, OSError, paramiko.SSHException):
+            pass
+        finally:
+            transport.close()
+
+    def netconf(self, slot: int, channel, session_id: int):
+        # replies and notifications are written from different threads
+        send_lock = threading.Lock()
+        channel.sendall(SERVER_HELLO % session_id)
+        data = b''
+        hello_received = False
+        while True:
+            while DELIMITER not in data:
+                chunk = channel.recv(65536)
+                if not chunk:
+                    return
+                data += chunk
+            message, data = data.split(DELIMITER, 1)
+            if not hello_received:
+                hello_received = True
+                continue
+            request = etree.fromstring(message.strip())
+            reply = self.reply(slot, request)
+            if self.latency:
+                time.sleep(self.latency)
+            with send_lock:
+                channel.sendall(reply + DELIMITER)
+            tag = etree.QName(request[0]).localname
+            if tag == 'create-subscription':
+                with self.lock:
+                    self.subscribers[slot].append((channel, send_lock))
+            if tag == 'request-vmhost-reboot':
+                # the RE goes down once it has answered
+                rpc = request[0]
+                self.reboot(1 if rpc.find('{*}re1') is not None else 0 if rpc.find('{*}re0') is not None else slot)
+            if tag in ('close-session', 'request-vmhost-reboot'):
+                return
+
+    def reply(self, slot: int, request: etree.Element) -> bytes:
+        rpc = request[0]
+        tag = etree.QName(rpc).localname
+        with self.lock:
+            self.rpcs.append((slot, tag))
+        try:
+            body = self.rpc_reply_body(slot, tag, rpc)
+        except Exception as e:
+            error = etree.Element('rpc-error')
+            for name, text in (('error-type', 'application'), ('error-tag', 'operation-failed'),
+                               ('error-severity', 'error'), ('error-message', str(e))):
+                etree.SubElement(error, name).text = text
+            body = etree.tostring(error)
+        message_id = request.get('message-id', '1')
+        return (f'<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" '
+                f'xmlns:junos="http://xml.juniper.net/junos/{self.res[slot].version}/junos" '
+                f'message-id="{message_id}">').encode() + body + b'</rpc-reply>'
+
+    def rpc_reply_body(self, slot: int, tag: str, rpc: etree.Element) -> bytes:
+        re_state = self.res[slot]
+        if tag == 'get-software-information':
+            return (f'<software-information><host-name>re{slot}</host-name>'
+                    f'<junos-version>{re_state.version}</junos-version></software-information>').encode()
+        if tag == 'get-route-engine-information':
+            return etree.tostring(self.route_engine_information(int(rpc.findtext('{*}slot', slot))))
+        if tag == 'file-list':
+            return etree.tostring(self.file_list(rpc.findtext('{*}path', '.')))
+        if tag == 'get-vmhost-version-information':
+            return etree.tostring(self.vmhost_version_information(re_state))
+        if tag == 'request-vmhost-package-add':
+            package = rpc.findtext('{*}package-name', '')
+            version = re.search(r'-mx-x86-64-(.+?)\.tgz', package)
+            if version is None:
+                raise ValueError(f'{package} is not a vmhost install package')
+            # the package is installed on the partition the RE does not boot from
+            re_state.next_boot_set = 'b' if re_state.boot_set == 'p' else 'p'
+            re_state.partitions[re_state.next_boot_set] = version.group(1)
+        if tag == 'request-chassis-routing-engine-switch':
+            self.switchover()
+        if tag in OK_RPCS:
+            return b'<ok/>'
+        if tag in FIXTURES:
+            reply = self.fixtures[tag]
+            if tag in self.reply_scale:
+                reply = scale_reply(reply, self.reply_scale[tag])
+            return etree.tostring(reply)
+        raise ValueError(f'syntax error: {tag}')
+
+    def route_engine_information(self, slot: int) -> etree.Element:
+        info = copy.deepcopy(self.fixtures.setdefault('get-route-engine-information', load_fixture('get_re_info.xml')))
+        route_engine = info.find('route-engine')
+        slot_element = route_engine.find('slot')
+        if slot_element is None:
+            slot_element = etree.SubElement(route_engine, 'slot')
+        slot_element.text = str(slot)
+        route_engine.find('mastership-state').text = 'master' if slot == self.master else 'backup'
+        return info
+
+    def file_list(self, path: str) -> etree.Element:
+        directory_list = etree.Element('directory-list')
+        directory_path = path if path.endswith('/') else f'{path}/'
+        if directory_path in self.files:
+            directory = etree.SubElement(directory_list, 'directory', name=path)
+            etree.SubElement(directory, 'directory-name').text = path
+            files = self.files[directory_path].items()
+        else:
+            directory_path, _, name = path.rpartition('/')
+            if name not in self.files.get(f'{directory_path}/', {}):
+                etree.SubElement(directory_list, 'output').text = f'{path}: No such file or directory'
+                return directory_list
+            # a file is listed in a directory element without a name
+            directory = etree.SubElement(directory_list, 'directory')
+            files = [(path, self.files[f'{directory_path}/'][name])]
+        for name, size in files:
+            file_information = etree.SubElement(directory, 'file-information')
+            etree.SubElement(file_information, 'file-name').text = name
+            etree.SubElement(file_information, 'file-owner').text = 'root'
+            etree.SubElement(file_information, 'file-size').text = str(size)
+            etree.SubElement(file_information, 'file-permissions', format='-rw-r--r--').text = '644'
+            etree.SubElement(file_information, 'file-date', format='Aug 27 17:38').text = '1724794731'
+        return directory_list
+
+    def vmhost_version_information(self, re_state: SimulatedRe) -> etree.Element:
+        template = self.fixtures.setdefault('get-vmhost-version-information', load_fixture('get_vmhost_version.xml'))
+        versions = iter([re_state.partitions['p'], re_state.partitions['b']])
+        text = re.sub(r'Junos Disk: junos-install-mx-x86-64-\S+',
+                      lambda match: f'Junos Disk: junos-install-mx-x86-64-{next(versions)}', template.text)
+        output = etree.Element('output')
+        output.text = text
+        return output
+
+
+class _SshServer(paramiko.ServerInterface):
+    def __init__(self, username: str, password: str):
+        self.username = username
+        self.password = password
+        self.netconf = threading.Event()
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_REQUEST
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name == 'netconf':
+            self.netconf.set()
+            return True
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A simulated dual RE MX for running the upgraders without a router")
+    parser.add_argument('-p', '--port', type=int, default=8830, help='NETCONF port of both REs (default: 8830)')
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help='seconds added to every reply (default: 0)')
+    parser.add_argument('-r', '--reboot-seconds', type=float, default=5.0, help='time an RE takes to reboot (default: 5)')
+    parser.add_argument('-s', '--scale', action='append', default=[], metavar='RPC=FACTOR',
+                        help='repeat the entries of the replies to RPC, e.g. get-subscribers=10000')
+    args = parser.parse_args()
+    scale = {rpc: int(factor) for rpc, factor in (item.split('=') for item in args.scale)}
+    simulator = NetconfSimulator(port=args.port, latency=args.latency, reply_scale=scale,
+                                 reboot_seconds=args.reboot_seconds).start()
+    print(f'Simulating RE0 on {simulator.addresses[0]} and RE1 on {simulator.addresses[1]}, port {simulator.port}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+        sys.exit(0)
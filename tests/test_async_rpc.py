@@ -0,0 +1,72 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from jnpr.junos import Device
+import pytest
+
+from test_utils import TestUtils
+from async_rpc import RpcBridge, AsyncRpcCaller, AsyncRpcProcessor
+
+
+class TestAsyncRpc:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self, monkeypatch):
+        self.lock = threading.Lock()
+        self.in_flight = Counter()
+        self.max_in_flight = Counter()
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            with self.lock:
+                self.in_flight['all'] += 1
+                self.in_flight[device.hostname] += 1
+                for key in ('all', device.hostname):
+                    self.max_in_flight[key] = max(self.max_in_flight[key], self.in_flight[key])
+            time.sleep(0.01)
+            with self.lock:
+                self.in_flight['all'] -= 1
+                self.in_flight[device.hostname] -= 1
+            return TestUtils.load_test_file_as_etree('rpc_responses/get_re_info.xml')
+
+        monkeypatch.setattr(Device, 'execute', execute)
+        monkeypatch.setattr(Device, 'open', TestUtils.set_device_connected)
+        monkeypatch.setattr(Device, 'close', TestUtils.do_nothing)
+        self.logger = logging.getLogger(__name__)
+
+    def test_given_many_sessions_when_rpcs_gathered_then_run_concurrently_within_bridge_limit(self):
+        bridge = RpcBridge(max_workers=4)
+
+        async def sweep():
+            callers = [AsyncRpcCaller(f'10.10.{i}.1', 'username', 'password', '22', self.logger, bridge=bridge) for i in range(20)]
+            await asyncio.gather(*(caller.open() for caller in callers))
+            return await asyncio.gather(*(caller.show_chassis_routing_engine(slot='0') for caller in callers))
+
+        replies = asyncio.run(sweep())
+        bridge.close()
+        assert [reply.find('route-engine/status').text for reply in replies] == ['OK'] * 20
+        assert 1 < self.max_in_flight['all'] <= 4
+
+    def test_given_one_session_when_rpcs_gathered_then_rpcs_serialized(self):
+        async def run():
+            caller = AsyncRpcCaller('10.10.10.11', 'username', 'password', '22', self.logger, bridge=RpcBridge(max_workers=4))
+            await asyncio.gather(*(caller.show_chassis_routing_engine(slot='0') for _ in range(5)))
+
+        asyncio.run(run())
+        assert self.max_in_flight['10.10.10.11'] == 1
+
+    def test_given_async_rpc_processor_when_verify_re_status_then_return_result_of_rpc_processor(self):
+        async def run():
+            processor = await AsyncRpcProcessor.create(self.logger, [], [], host='10.10.10.11', username='username',
+                                                       password='password', port='22', connection_retries=1,
+                                                       connection_retry_interval=0)
+            result = await processor.verify_re_status(slot=0)
+            await processor.close()
+            return result
+
+        assert asyncio.run(run()) is True
@@ -0,0 +1,37 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import json
+
+from lxml import etree
+from benchmark_rpc_processor import BASELINE_FILE, CASES, scaled_replies, run_benchmarks, find_regressions
+
+
+class TestBenchmarkRpcProcessor:
+    def test_given_scale_when_scaled_replies_then_name_and_state_pairs_repeated(self):
+        replies = scaled_replies({'get-routing-task-replication-state': 'get_protocol_replication_state.xml'}, 3)
+        reply = etree.fromstring(replies['get-routing-task-replication-state'])
+        names = reply.findall('task-protocol-replication-name')
+        assert len(names) == 21
+        assert all(name.getnext().tag == 'task-protocol-replication-state' for name in names)
+        assert len(reply.findall('task-gres-state')) == 1
+
+    def test_given_every_case_when_run_at_scale_one_then_measured_without_errors(self):
+        results = run_benchmarks([1], report=lambda line: None)
+        assert list(results) == list(dict.fromkeys(case[0] for case in CASES))
+        assert all(result['1']['seconds'] >= 0 and result['1']['peak_mb'] >= 0 for result in results.values())
+
+    def test_given_results_above_baseline_when_compared_then_regressions_reported(self):
+        baseline = {'record_route_summary': {'10000': {'seconds': 1.0, 'peak_mb': 20.0}}}
+        assert find_regressions({'record_route_summary': {'10000': {'seconds': 1.4, 'peak_mb': 21.0}}}, baseline) == []
+        assert find_regressions({'record_route_summary': {'10000': {'seconds': 2.0, 'peak_mb': 40.0}}}, baseline) == [
+            'record_route_summary at 10000x: seconds 2.000s, baseline 1.000s',
+            'record_route_summary at 10000x: peak_mb 40.000MB, baseline 20.000MB']
+        assert find_regressions({'record_pic_info': {'1': {'seconds': 9.0, 'peak_mb': 90.0}}}, baseline) == []
+
+    def test_given_stored_baseline_then_every_case_and_scale_present(self):
+        baseline = json.loads(BASELINE_FILE.read_text())
+        for method_name, _, _ in CASES:
+            assert set(baseline[method_name]) == {'1', '100', '10000'}
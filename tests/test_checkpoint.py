@@ -0,0 +1,44 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os
+import pytest
+
+from checkpoint import Checkpoint
+from junos_upgrader_exceptions import JunosInputsError
+
+DEVICE = {'RE0_HOST': '10.10.10.11', 'RE1_HOST': '10.10.10.12', 'NEW_JUNOS': '22.4R3.25'}
+
+
+class TestCheckpoint:
+    def test_given_completed_steps_when_load_then_return_steps_and_data(self, tmp_path):
+        path = str(tmp_path.joinpath('upgrade_checkpoint.json'))
+        checkpoint = Checkpoint(path, DEVICE)
+        checkpoint.complete('pre-checks', pre_upgrade_record={'alarms': []})
+        checkpoint.complete('deactivate-redundancy')
+        checkpoint.complete('deactivate-redundancy')
+        loaded = Checkpoint.load(path, DEVICE)
+        assert loaded.completed_steps == ['pre-checks', 'deactivate-redundancy']
+        assert loaded.is_complete('deactivate-redundancy')
+        assert not loaded.is_complete('re1-rescue-config')
+        assert loaded.data == {'pre_upgrade_record': {'alarms': []}}
+        assert not os.path.exists(f'{path}.tmp')
+
+    def test_given_no_checkpoint_when_load_then_return_none(self, tmp_path):
+        assert Checkpoint.load(str(tmp_path.joinpath('upgrade_checkpoint.json')), DEVICE) is None
+
+    def test_given_checkpoint_for_other_device_when_load_then_raise_junos_inputs_error(self, tmp_path):
+        path = str(tmp_path.joinpath('upgrade_checkpoint.json'))
+        Checkpoint(path, DEVICE).complete('pre-checks')
+        with pytest.raises(JunosInputsError):
+            Checkpoint.load(path, {**DEVICE, 'NEW_JUNOS': '23.2R1.14'})
+
+    def test_given_checkpoint_when_remove_then_file_deleted(self, tmp_path):
+        path = str(tmp_path.joinpath('upgrade_checkpoint.json'))
+        checkpoint = Checkpoint(path, DEVICE)
+        checkpoint.complete('pre-checks')
+        checkpoint.remove()
+        assert not os.path.exists(path)
+        checkpoint.remove()
@@ -0,0 +1,47 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+from lxml import etree
+
+from test_utils import TestUtils
+from config_diff import config_set_lines, diff_config_lines
+
+
+class TestConfigDiff:
+    def test_given_normalised_reply_when_config_set_lines_then_split_only_before_statements(self):
+        reply = etree.fromstring('<output>set system host-name offset-router set interfaces ae0 description "asset" '
+                                 'deactivate interfaces ae0</output>')
+        assert list(config_set_lines(reply)) == ['set system host-name offset-router',
+                                                 'set interfaces ae0 description "asset"',
+                                                 'deactivate interfaces ae0']
+
+    def test_given_normalised_reply_with_verbs_in_quoted_values_when_config_set_lines_then_values_not_split(self):
+        reply = etree.fromstring('<output>set interfaces ae0 description "set by ops; delete later" '
+                                 'set system login message "please activate MFA" set system host-name r1</output>')
+        assert list(config_set_lines(reply)) == ['set interfaces ae0 description "set by ops; delete later"',
+                                                 'set system login message "please activate MFA"',
+                                                 'set system host-name r1']
+
+    def test_given_reply_with_line_breaks_when_config_set_lines_then_yield_each_line(self):
+        reply = etree.fromstring('<configuration-set>\nset system host-name r1\nset interfaces ae0 description '
+                                 '"to set b"\n</configuration-set>')
+        assert list(config_set_lines(reply)) == ['set system host-name r1', 'set interfaces ae0 description "to set b"']
+
+    def test_given_fixture_when_config_set_lines_then_yield_every_statement(self):
+        reply = TestUtils.load_test_file_as_etree('rpc_responses/get_configuration_in_set_format.xml')
+        lines = list(config_set_lines(reply))
+        assert len(lines) == 12
+        assert lines[0] == 'set system host-name test123'
+
+    def test_given_changed_and_reordered_lines_when_diff_then_group_changes_by_hierarchy(self):
+        pre_upgrade = ['set system host-name r1', 'set interfaces ae0 mtu 9192', 'set protocols isis level 1 disable']
+        post_upgrade = ['set protocols isis level 1 disable', 'set interfaces ae0 mtu 1500', 'set system host-name r1',
+                        'set protocols ldp interface ae0']
+        diff = diff_config_lines(pre_upgrade, post_upgrade)
+        assert diff == {'removed': 1, 'added': 2, 'hierarchies': {
+            'interfaces': {'removed': ['set interfaces ae0 mtu 9192'], 'added': ['set interfaces ae0 mtu 1500']},
+            'protocols': {'removed': [], 'added': ['set protocols ldp interface ae0']}}}
+        assert diff_config_lines(pre_upgrade, list(reversed(pre_upgrade))) == {'removed': 0, 'added': 0,
+                                                                               'hierarchies': {}}
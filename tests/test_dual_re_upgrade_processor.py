@@ -4,6 +4,10 @@ Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
 """
 
 import argparse
+import json
+import os
+import threading
+import time
 from jnpr.junos import Device
 from jnpr.junos.utils import fs
 import pytest
@@ -17,6 +21,14 @@ from test_utils import TestUtils
 from junos_upgrader_exceptions import *
 from rpc_processor import RpcProcessor
 from rpc_caller import RpcCaller
+from checkpoint import Checkpoint
+from snapshot import Snapshot
+from snapshot_store import SnapshotStore
+
+CHECKPOINT_PATH = os.path.join('logs', 'upgrade_checkpoint.json')
+CHECKPOINT_DEVICE = {'RE0_HOST': '10.10.10.11', 'RE1_HOST': '10.10.10.12', 'NEW_JUNOS': '22.4R3.25'}
+PROFILE_PATHS = [os.path.join('logs', 'upgrade_profile.json'), os.path.join('logs', 'upgrade_profile.trace.json')]
+CONFIG_DIFF_PATH = os.path.join('logs', 'config_diff.json')
 
 
 class TestUpgradeProcessor:
@@ -28,13 +40,20 @@ class TestUpgradeProcessor:
         monkeypatch.setattr(Device, 'close', TestUtils.do_nothing)
         monkeypatch.setattr(Device, 'transform', TestUtils.do_nothing)
         monkeypatch.setattr(argparse.ArgumentParser, "parse_args", TestUtils.MockArgs)
-        monkeypatch.setattr(fs.FS, "ls", TestUtils.get_re_files)
+        monkeypatch.setattr(fs.FS, "stat", TestUtils.get_package_stat)
         monkeypatch.setattr(fs.FS, "cp", TestUtils.return_success)
         monkeypatch.setattr(Config, "__enter__", TestUtils.MockConfig.__enter__)
         monkeypatch.setattr(Config, "__exit__", TestUtils.do_nothing)
         monkeypatch.setattr(Config, "commit", TestUtils.return_success)
         monkeypatch.setattr(Config, "rescue", TestUtils.return_success)
         monkeypatch.setattr(RpcProcessor, "countdown_timer", TestUtils.do_nothing)
+        monkeypatch.setattr(RpcProcessor, "wait_for_re_ready", TestUtils.return_success)
+        monkeypatch.setattr(RpcProcessor, "wait_for_routing_convergence", TestUtils.return_success)
+        yield
+        Checkpoint(CHECKPOINT_PATH, CHECKPOINT_DEVICE).remove()
+        for path in PROFILE_PATHS + [CONFIG_DIFF_PATH]:
+            if os.path.exists(path):
+                os.remove(path)
 
     @profile
     def test_given_successful_upgrade_when_run_then_return_success_messages(self, monkeypatch, caplog):
@@ -47,6 +66,79 @@ class TestUpgradeProcessor:
             assert message in caplog.text
         TestUtils.mocker_resetter()
 
+    def test_given_successful_upgrade_when_run_then_write_run_profile(self, monkeypatch, caplog):
+        monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        dual_re_upgrade_upgrader()
+        TestUtils.mocker_resetter()
+        with open(PROFILE_PATHS[0]) as file:
+            profile = json.load(file)
+        events = {(event['category'], event['name']) for event in profile['events']}
+        assert {('phase', 'pre-checks'), ('phase', 'post-checks'), ('plan-step', 're0-chassis-alarms'),
+                ('upgrade-step', 'install_junos_on_device'), ('rpc', 'get_alarm_information')} <= events
+        assert all(event['bytes'] > 0 for event in profile['events']
+                   if event['name'] == 'get_alarm_information' and event['outcome'] == 'ok')
+        with open(PROFILE_PATHS[1]) as file:
+            trace = json.load(file)
+        assert {event['ph'] for event in trace['traceEvents']} == {'M', 'X'}
+
+    def test_given_compact_state_snapshots_when_run_upgrade_then_write_snapshots_matching_json(self, monkeypatch):
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(),
+                                                                    "COMPACT_STATE_SNAPSHOTS": True})
+        monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        dual_re_upgrade_upgrader()
+        TestUtils.mocker_resetter()
+        for phase in ('pre', 'post'):
+            with open(os.path.join('logs', f'{phase}_upgrade_state.json')) as file:
+                state = json.load(file)
+            with Snapshot(os.path.join('logs', f'{phase}_upgrade_state.snap')) as snapshot:
+                assert snapshot.to_dict() == state
+            os.remove(os.path.join('logs', f'{phase}_upgrade_state.snap'))
+
+    def test_given_snapshot_store_when_run_upgrade_then_store_pre_and_post_state_of_run(self, monkeypatch, tmp_path):
+        store_path = str(tmp_path.joinpath('snapshots.db'))
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(),
+                                                                    "SNAPSHOT_STORE": store_path})
+        monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        dual_re_upgrade_upgrader()
+        TestUtils.mocker_resetter()
+        with SnapshotStore(store_path) as store:
+            run, = store.runs()
+            assert run['to_junos'] == TestUtils.create_mock_inputs_json()['NEW_JUNOS']
+            with open(os.path.join('logs', 'pre_upgrade_state.json')) as file:
+                assert store.record(run['run_id'], 'pre') == json.load(file)
+            with open(os.path.join('logs', 'post_upgrade_state.json')) as file:
+                assert store.record(run['run_id'], 'post') == json.load(file)
+            assert store.lost_entries('bgp-summary') == []
+
+    def test_given_snapshot_store_when_dryrun_then_store_closed(self, monkeypatch, tmp_path):
+        closed = []
+        close = SnapshotStore.close
+        monkeypatch.setattr(SnapshotStore, "close", lambda store: closed.append(store) or close(store))
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(),
+                                                                    "SNAPSHOT_STORE": str(tmp_path.joinpath('snapshots.db'))})
+        monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        monkeypatch.setattr(argparse.ArgumentParser, "parse_args", TestUtils.MockFleetArgs)
+        with pytest.raises(SystemExit):
+            dual_re_upgrade_upgrader()
+        TestUtils.mocker_resetter()
+        assert len(closed) == 1
+        assert os.path.exists(PROFILE_PATHS[0])
+
+    def test_given_session_reconnect_interval_when_dryrun_then_session_pool_monitor_stopped(self, monkeypatch):
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(),
+                                                                    "SESSION_RECONNECT_INTERVAL": 0.01})
+        monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        monkeypatch.setattr(argparse.ArgumentParser, "parse_args", TestUtils.MockFleetArgs)
+        with pytest.raises(SystemExit):
+            dual_re_upgrade_upgrader()
+        TestUtils.mocker_resetter()
+        assert not any(thread.name == 'session-pool' for thread in threading.enumerate())
+
     def test_given_successful_upgrade_when_diff_in_config_and_state_then_return_config_and_state_warning_messages(self, monkeypatch, caplog):
         monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
         monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
@@ -62,6 +154,110 @@ class TestUpgradeProcessor:
         for message in messages:
             assert message in caplog.text
         TestUtils.mocker_resetter()
+        with open(CONFIG_DIFF_PATH) as file:
+            diff = json.load(file)
+        assert diff['removed'] == 2 and diff['added'] == 2
+        assert diff['hierarchies']['interfaces']['added'] == ["set interfaces xe-1/0/5:2 unit 10 family inet address 1.1.1.2/30",
+                                                              "set interfaces xe-1/0/5:2 unit 40 vlan-id 41"]
+
+    def test_given_dryrun_when_run_then_re0_and_re1_pre_checks_run_concurrently_and_log_in_re_order(self, monkeypatch, caplog):
+        threads = {}
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            threads.setdefault(device.hostname, set()).add(threading.get_ident())
+            return TestUtils.get_device_info(device, rpc_cmd, *args, **kwargs)
+
+        monkeypatch.setattr(Device, "execute", execute)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        monkeypatch.setattr(argparse.ArgumentParser, "parse_args", TestUtils.MockFleetArgs)
+        with pytest.raises(SystemExit):
+            dual_re_upgrade_upgrader()
+        assert threads['10.10.10.11'].isdisjoint(threads['10.10.10.12'])
+        assert (caplog.text.index('RUNNING RE0 PRE-CHECKS') < caplog.text.index('Recording route summary')
+                < caplog.text.index('RUNNING RE1 PRE-CHECKS') < caplog.text.index('Verify number of disks on RE1'))
+        TestUtils.mocker_resetter()
+
+    def test_given_parallel_staging_when_run_upgrade_then_re0_package_added_while_re1_upgraded(self, monkeypatch, caplog):
+        package_adds = []
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            if rpc_cmd.tag == 'request-vmhost-package-add':
+                package_adds.append((device.hostname, threading.current_thread().name))
+            return TestUtils.get_device_info(device, rpc_cmd, *args, **kwargs)
+
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(),
+                                                                    "PARALLEL_STAGING": True})
+        monkeypatch.setattr(Device, "execute", execute)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        dual_re_upgrade_upgrader()
+        TestUtils.mocker_resetter()
+        # RE0 is installed once on the staging thread and once after its first reboot, instead of twice after the switchover
+        assert [host for host, _ in package_adds].count('10.10.10.11') == 2
+        assert [thread for host, thread in package_adds if host == '10.10.10.11'][0].startswith('stage-re0')
+        assert (caplog.text.index('Staging junos-vmhost-install') < caplog.text.index('Initiating switchover to RE1')
+                < caplog.text.index('was staged on RE0 while RE1 was upgraded'))
+
+    def test_given_parallel_staging_when_re1_install_fails_then_wait_for_re0_staging_and_report_it(self, monkeypatch, caplog):
+        package_adds = []
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            if rpc_cmd.tag == 'request-vmhost-package-add':
+                if device.hostname == '10.10.10.12':
+                    raise Exception('install failed')
+                time.sleep(0.5)
+                package_adds.append(device.hostname)
+            return TestUtils.get_device_info(device, rpc_cmd, *args, **kwargs)
+
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(),
+                                                                    "PARALLEL_STAGING": True})
+        monkeypatch.setattr(Device, "execute", execute)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        with pytest.raises(JunosPackageInstallError):
+            dual_re_upgrade_upgrader()
+        TestUtils.mocker_resetter()
+        # the upgrader only returns once the package add on RE0 has finished
+        assert package_adds == ['10.10.10.11']
+        assert 'The upgrade of RE1 failed after junos-vmhost-install' in caplog.text
+        with open(CHECKPOINT_PATH) as file:
+            assert 're0-stage-partition-1' not in json.load(file)['completed_steps']
+
+    def test_given_upgrade_interrupted_when_install_fails_then_checkpoint_records_completed_steps(self, monkeypatch, caplog):
+        monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        monkeypatch.setattr(RpcProcessor, "install_junos_on_device", TestUtils.raise_exception)
+        with pytest.raises(Exception):
+            dual_re_upgrade_upgrader()
+        with open(CHECKPOINT_PATH) as file:
+            state = json.load(file)
+        assert state['device'] == CHECKPOINT_DEVICE
+        assert state['completed_steps'] == ['pre-checks', 'deactivate-redundancy', 're1-rescue-config']
+        assert state['data']['pre_upgrade_record']['subscriber-count-per-type'] == {'vlan': 10, 'pppoe': 5, 'dhcp': 10}
+        assert state['data']['pre_upgrade_config'] is not None
+        TestUtils.mocker_resetter()
+
+    def test_given_checkpoint_when_resume_then_skip_completed_steps_and_remove_checkpoint(self, monkeypatch, caplog):
+        monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
+        monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
+        monkeypatch.setattr(argparse.ArgumentParser, "parse_args", TestUtils.MockResumeArgs)
+        checkpoint = Checkpoint(CHECKPOINT_PATH, CHECKPOINT_DEVICE)
+        for step in ['deactivate-redundancy', 're1-rescue-config', 're1-install-partition-1',
+                     're1-install-partition-2', 're1-verify', 'switchover-to-re1', 're0-rescue-config']:
+            checkpoint.complete(step)
+        checkpoint.complete('pre-checks', pre_upgrade_record={}, pre_upgrade_config='',
+                            upgrade_error_log=[], upgrade_warning_log=[])
+        # RE0 has already been rebooted into the new Junos
+        TestUtils.ShowJunosVersion.version_idx = 2
+        dual_re_upgrade_upgrader()
+        assert 'RESUMING UPGRADE' in caplog.text
+        assert 'RUNNING RE0 PRE-CHECKS' not in caplog.text
+        assert 'Applying commands to deactivate redundancy features' not in caplog.text
+        assert 'Initiating switchover to RE1 as master' not in caplog.text
+        assert 'RE0 already has junos-install-mx-x86-64-22.4R3.25 on both partitions' in caplog.text
+        assert 'Installing' not in caplog.text
+        assert 'Initiating switchover to RE0 as master' in caplog.text
+        assert 'Applying commands to activate redundancy features' in caplog.text
+        assert not os.path.exists(CHECKPOINT_PATH)
+        TestUtils.mocker_resetter()
 
     def test_given_upgrade_fail_when_unable_to_init_rpc_processor_then_raise_rpc_processor_init_error(self, monkeypatch, caplog):
         monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
@@ -74,7 +270,7 @@ class TestUpgradeProcessor:
     def test_given_upgrade_fail_when_config_get_fail_then_raise_sysexit_and_get_config_error(self, monkeypatch, caplog):
         monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
         monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
-        message = "❌ ERROR: Unable to get configuration. Exception: Type 'NoneType' cannot be serialized."
+        message = "❌ ERROR: Unable to get configuration. Exception: No configuration returned"
         with pytest.raises(SystemExit):
             dual_re_upgrade_upgrader()
         assert message in caplog.text
@@ -164,7 +360,7 @@ class TestUpgradeProcessor:
     def test_given_upgrade_fail_when_new_junos_package_not_existing_then_raise_sysexit_and_sw_version_error(self, monkeypatch, caplog):
         monkeypatch.setattr(Device, "execute", TestUtils.get_device_info)
         monkeypatch.setattr(logging.Logger, "addHandler", TestUtils.do_nothing)
-        monkeypatch.setattr(fs.FS, "ls", TestUtils.get_re_files_no_new_package)
+        monkeypatch.setattr(fs.FS, "stat", TestUtils.get_no_package_stat)
         message = "❌ ERROR: RE1 does not have the new Junos package junos-vmhost-install-mx-x86-64-22.4R3.25.tgz in /var/tmp/"
         with pytest.raises(SystemExit):
             dual_re_upgrade_upgrader()
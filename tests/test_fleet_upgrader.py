@@ -0,0 +1,121 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from jnpr.junos import Device
+from jnpr.junos.utils import fs
+import pytest
+
+import upgraders.fleet_upgrader.fleet_upgrader as fleet_module
+from upgraders.fleet_upgrader.fleet_upgrader import fleet_upgrader
+from helpers import Helpers
+from jnpr.junos.utils.config import Config
+from test_utils import TestUtils
+from junos_upgrader_exceptions import *
+from rpc_processor import RpcProcessor
+
+
+DEVICES = [{"NAME": "mx-site1-01", "SITE": "SITE1", "RE0_HOST": "10.10.10.11", "RE1_HOST": "10.10.10.12"},
+           {"NAME": "mx-site1-02", "SITE": "SITE1", "RE0_HOST": "10.10.10.21", "RE1_HOST": "10.10.10.22"},
+           {"NAME": "mx-site2-01", "SITE": "SITE2", "RE0_HOST": "10.10.10.31", "RE1_HOST": "10.10.10.32"}]
+
+
+class TestFleetUpgrader:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self, monkeypatch, tmp_path):
+        fleet_inputs = {"FLEET_LOGS_DIR": str(tmp_path), "DEVICES": DEVICES,
+                        "MAX_CONCURRENT_UPGRADES": 3, "MAX_CONCURRENT_UPGRADES_PER_SITE": 1}
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(), **fleet_inputs})
+        monkeypatch.setattr(Device, 'open', TestUtils.set_device_connected)
+        monkeypatch.setattr(Device, 'close', TestUtils.do_nothing)
+        monkeypatch.setattr(Device, 'transform', TestUtils.do_nothing)
+        monkeypatch.setattr(Device, "execute", TestUtils.get_fleet_device_info)
+        monkeypatch.setattr(argparse.ArgumentParser, "parse_args", TestUtils.MockFleetArgs)
+        monkeypatch.setattr(fs.FS, "stat", TestUtils.get_package_stat)
+        monkeypatch.setattr(fs.FS, "cp", TestUtils.return_success)
+        monkeypatch.setattr(Config, "__enter__", TestUtils.MockConfig.__enter__)
+        monkeypatch.setattr(Config, "__exit__", TestUtils.do_nothing)
+        monkeypatch.setattr(RpcProcessor, "countdown_timer", TestUtils.do_nothing)
+        monkeypatch.setattr(RpcProcessor, "wait_for_re_ready", TestUtils.return_success)
+        monkeypatch.setattr(RpcProcessor, "wait_for_routing_convergence", TestUtils.return_success)
+        self.logs_dir = tmp_path
+
+    def test_given_fleet_dryrun_when_run_then_every_device_reported_and_site_limit_respected(self, monkeypatch):
+        running_per_site = Counter()
+        max_running_per_site = Counter()
+        lock = threading.Lock()
+        run_device_upgrade = fleet_module.run_device_upgrade
+
+        def tracking_run_device_upgrade(device, *args):
+            with lock:
+                running_per_site[device["SITE"]] += 1
+                max_running_per_site[device["SITE"]] = max(max_running_per_site[device["SITE"]], running_per_site[device["SITE"]])
+            time.sleep(0.1)
+            try:
+                return run_device_upgrade(device, *args)
+            finally:
+                with lock:
+                    running_per_site[device["SITE"]] -= 1
+
+        monkeypatch.setattr(fleet_module, "run_device_upgrade", tracking_run_device_upgrade)
+        report = fleet_upgrader()
+        assert [result['name'] for result in report['devices']] == [device["NAME"] for device in DEVICES]
+        assert report['summary'] == {'dryrun-complete': 3}
+        assert max_running_per_site == {"SITE1": 1, "SITE2": 1}
+        with open(self.logs_dir.joinpath('fleet_report.json')) as file:
+            assert json.load(file)['summary'] == {'dryrun-complete': 3}
+        for device in DEVICES:
+            assert self.logs_dir.joinpath(device["NAME"], 'upgrade.log').exists()
+            assert self.logs_dir.joinpath(device["NAME"], 'pre_upgrade_state.json').exists()
+
+    def test_given_fleet_dryrun_when_one_device_fails_pre_checks_then_other_devices_unaffected(self, monkeypatch):
+        devices = [dict(device) for device in DEVICES]
+        devices[1]["RE_MODEL"] = "RE-S-2X00x6"
+        monkeypatch.setattr(fleet_module, "load_inventory", lambda *args: devices)
+        report = fleet_upgrader()
+        statuses = {result['name']: result['status'] for result in report['devices']}
+        assert statuses == {"mx-site1-01": 'dryrun-complete', "mx-site1-02": 'pre-check-failed', "mx-site2-01": 'dryrun-complete'}
+        errors = report['devices'][1]['errors']
+        assert any("RE0 is not the expected model version" in error for error in errors)
+
+    def test_given_inventory_with_duplicate_device_names_when_run_then_raise_inputs_error(self, monkeypatch):
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(), "FLEET_LOGS_DIR": str(self.logs_dir), "DEVICES": DEVICES + DEVICES[:1]})
+        with pytest.raises(JunosInputsError):
+            fleet_upgrader()
+
+    def test_given_site_concurrency_limit_of_zero_when_run_then_raise_inputs_error(self, monkeypatch):
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(), "FLEET_LOGS_DIR": str(self.logs_dir), "DEVICES": DEVICES, "SITE_CONCURRENCY_LIMITS": {"SITE1": 0}})
+        with pytest.raises(JunosInputsError, match='SITE_CONCURRENCY_LIMITS.SITE1'):
+            fleet_upgrader()
+
+    def test_given_local_package_when_run_then_staged_on_every_re_before_upgrades(self, monkeypatch, tmp_path):
+        package = tmp_path.joinpath('junos-vmhost-install-mx-x86-64-22.4R3.25.tgz')
+        package.write_bytes(b'package')
+        events = []
+        monkeypatch.setattr(Helpers, "create_inputs_json", lambda: {**TestUtils.create_mock_inputs_json(), "FLEET_LOGS_DIR": str(self.logs_dir), "DEVICES": DEVICES, "LOCAL_JUNOS_PACKAGE": str(package)})
+
+        def stage_package_on_res(hosts, *args, connect=None, **kwargs):
+            events.append('staging')
+            results = []
+            for host in hosts:
+                with connect(host) as caller:
+                    results.append({'host': caller.host, 'status': 'staged'})
+            return results
+
+        run_device_upgrade = fleet_module.run_device_upgrade
+
+        def tracking_run_device_upgrade(device, *args):
+            events.append(device["NAME"])
+            return run_device_upgrade(device, *args)
+
+        monkeypatch.setattr(fleet_module, "stage_package_on_res", stage_package_on_res)
+        monkeypatch.setattr(fleet_module, "run_device_upgrade", tracking_run_device_upgrade)
+        report = fleet_upgrader()
+        assert events[0] == 'staging' and 'staging' not in events[1:]
+        assert [result['host'] for result in report['staging']] == [host for device in DEVICES for host in (device["RE0_HOST"], device["RE1_HOST"])]
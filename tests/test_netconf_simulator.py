@@ -0,0 +1,117 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import argparse
+import json
+import logging
+import time
+import pytest
+
+from upgraders.dual_re_upgrader.dual_re_upgrader import dual_re_upgrade_upgrader
+from upgraders.fleet_upgrader.fleet_upgrader import fleet_upgrader
+from helpers import Helpers
+from rpc_caller import RpcCaller
+from test_utils import TestUtils
+from netconf_simulator import NetconfSimulator
+from notifications import MASTERSHIP, ADJACENCY
+
+# short waits so that a whole upgrade, with four reboots, runs in a few seconds
+FAST_INPUTS = {"READY_INITIAL_DELAY": 0.2, "READY_POLL_INTERVAL": 0.1, "READY_MAX_POLL_INTERVAL": 0.2,
+               "POST_REBOOT_READY_TIMEOUT": 20, "POST_SWITCHOVER_READY_TIMEOUT": 20, "CONVERGENCE_TIMEOUT": 5}
+
+
+class TestNetconfSimulator:
+    """
+    Runs the upgraders against the simulator, over real NETCONF sessions, without any mocks.
+    """
+    @pytest.fixture(scope="function")
+    def simulator(self):
+        with NetconfSimulator(reboot_seconds=0.3) as simulator:
+            yield simulator
+
+    def test_given_simulated_mx_when_run_upgrade_then_both_res_upgraded_and_re0_master(self, simulator, tmp_path, caplog):
+        caplog.set_level(logging.INFO)
+        inputs_json = {**TestUtils.create_mock_inputs_json(), **FAST_INPUTS, "LOGS_DIR": str(tmp_path),
+                       "RE0_HOST": simulator.addresses[0], "RE1_HOST": simulator.addresses[1], "PORT": simulator.port}
+        args = argparse.Namespace(dryrun=False, force=False, debug=False, resume=False)
+
+        result = dual_re_upgrade_upgrader(inputs_json, args, logging.getLogger('simulated-upgrade'))
+
+        assert result['errors'] == []
+        assert simulator.master == 0
+        for re_state in simulator.res:
+            assert re_state.partitions == {'p': '22.4R3.25', 'b': '22.4R3.25'}
+        assert [slot for slot, tag in simulator.rpcs if tag == 'request-vmhost-reboot'] == [1, 1, 0, 0]
+        assert "There are no differences between the pre and post configs. ✅" in caplog.text
+        assert json.loads(tmp_path.joinpath('pre_upgrade_state.json').read_text()) == \
+            json.loads(tmp_path.joinpath('post_upgrade_state.json').read_text())
+
+    def test_given_simulated_fleet_when_run_dryrun_then_every_device_complete(self, monkeypatch, tmp_path):
+        with NetconfSimulator(addresses=('127.0.1.1', '127.0.1.2')) as first, \
+                NetconfSimulator(addresses=('127.0.2.1', '127.0.2.2')) as second:
+            devices = [{"NAME": f"mx-{index}", "SITE": "SITE1", "RE0_HOST": simulator.addresses[0],
+                        "RE1_HOST": simulator.addresses[1], "PORT": simulator.port}
+                       for index, simulator in enumerate((first, second))]
+            inputs_json = {**TestUtils.create_mock_inputs_json(), "FLEET_LOGS_DIR": str(tmp_path), "DEVICES": devices,
+                           "MAX_CONCURRENT_UPGRADES": 2}
+            monkeypatch.setattr(Helpers, "create_inputs_json", lambda: inputs_json)
+            monkeypatch.setattr(argparse.ArgumentParser, "parse_args", TestUtils.MockFleetArgs)
+            fleet_upgrader()
+
+        report = json.loads(tmp_path.joinpath('fleet_report.json').read_text())
+        assert report['summary'] == {'dryrun-complete': 2}
+
+    def test_given_latency_when_run_rpc_then_reply_delayed(self, simulator):
+        simulator.latency = 0.2
+        caller = RpcCaller(simulator.addresses[0], 'username', 'password', simulator.port, logging.getLogger(__name__))
+        caller.open()
+        start = time.monotonic()
+        caller.show_chassis_alarms()
+        assert time.monotonic() - start >= 0.2
+        caller.close()
+
+    def test_given_reply_scale_when_run_rpc_then_reply_entries_repeated(self, simulator):
+        simulator.reply_scale = {'get-interface-information': 100}
+        caller = RpcCaller(simulator.addresses[0], 'username', 'password', simulator.port, logging.getLogger(__name__))
+        caller.open()
+        interfaces = caller.show_interfaces(terse=True)
+        fixture = TestUtils.load_test_file_as_etree('rpc_responses/get_interface_info_terse_as_xml.xml')
+        assert len(interfaces.findall('physical-interface')) == 100 * len(fixture.findall('physical-interface'))
+        caller.close()
+
+    def test_given_reboot_when_connect_then_refused_until_re_is_back(self, simulator):
+        caller = RpcCaller(simulator.addresses[1], 'username', 'password', simulator.port, logging.getLogger(__name__))
+        simulator.reboot(1, seconds=0.5)
+        assert not caller.port_is_open(timeout=1)
+        time.sleep(0.7)
+        assert caller.port_is_open(timeout=1)
+
+    def test_given_crowded_directory_when_stat_package_then_only_package_listed(self, simulator):
+        package = 'junos-vmhost-install-mx-x86-64-22.4R3.25.tgz'
+        simulator.files = {'/var/tmp/': {**{f'core.{i}.gz': 1000 for i in range(5000)}, package: 4044498756}}
+        caller = RpcCaller(simulator.addresses[0], 'username', 'password', simulator.port, logging.getLogger(__name__))
+        caller.open()
+        stat = caller.file_stat(f'/var/tmp/{package}')
+        assert stat['type'] == 'file' and stat['size'] == 4044498756
+        assert caller.file_stat('/var/tmp/missing.tgz') is None
+        caller.close()
+
+    def test_given_subscription_when_switchover_and_reboot_then_notified_and_resubscribed(self, simulator):
+        caller = RpcCaller(simulator.addresses[1], 'username', 'password', simulator.port, logging.getLogger(__name__))
+        caller.open()
+        listener = caller.subscribe_notifications()
+        simulator.switchover()
+        assert listener.wait((MASTERSHIP,), 5).message.endswith('Routing Engine 1 became master')
+        # the RPC session is not affected by the notifications
+        assert caller.show_chassis_routing_engine(slot='1').findtext('route-engine/mastership-state') == 'master'
+        simulator.reboot(1, seconds=0.5)
+        since = listener.cursor()
+        for _ in range(100):
+            simulator.notify(1, 'rpd[1234]: RPD_ISIS_ADJUP: IS-IS new L2 adjacency to r1 on et-0/0/0.0')
+            if listener.wait((ADJACENCY,), 0.1, since) is not None:
+                break
+        assert listener.wait((ADJACENCY,), 0, since).tag == 'RPD_ISIS_ADJUP'
+        caller.close()
+        assert not listener.running
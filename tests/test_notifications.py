@@ -0,0 +1,99 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import logging
+import queue
+import threading
+import time
+from lxml import etree
+from jnpr.junos import Device
+import pytest
+
+from test_utils import TestUtils
+from rpc_processor import RpcProcessor
+from notifications import NotificationListener, NotificationWaiter, parse_notification, MASTERSHIP, ADJACENCY, SYSLOG
+
+
+def notification(message: str) -> etree.Element:
+    return etree.fromstring('<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">'
+                            f'<eventTime>2024-08-27T17:38:51Z</eventTime><syslog-message>{message}</syslog-message>'
+                            '</notification>')
+
+
+class SimulatedNotificationSource:
+    """
+    Stands in for the notification session of an RE. Tests send it notifications with send.
+    """
+    def __init__(self):
+        self.notifications = queue.Queue()
+        self.closed = False
+
+    def send(self, message: str):
+        self.notifications.put(notification(message))
+
+    def take(self, timeout: float):
+        try:
+            return self.notifications.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+
+
+class TestNotifications:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self):
+        self.logger = logging.getLogger(__name__)
+        self.source = SimulatedNotificationSource()
+        self.listener = NotificationListener(self.source.take, self.logger, '10.10.10.11', close=self.source.close).start()
+        yield
+        self.listener.stop()
+
+    def test_given_syslog_notifications_when_parsed_then_classified_by_tag(self):
+        assert parse_notification(notification('rpd[1234]: RPD_ISIS_ADJUP: IS-IS new L2 adjacency to r1 on et-0/0/0.0'))[:2] == (ADJACENCY, 'RPD_ISIS_ADJUP')
+        assert parse_notification(notification('chassisd[1422]: CHASSISD_RE_MASTERSHIP_CHANGE: Routing Engine 1 became master'))[0] == MASTERSHIP
+        assert parse_notification(notification('mgd[987]: UI_COMMIT: User root requested commit'))[:2] == (SYSLOG, 'UI_COMMIT')
+
+    def test_given_awaited_notification_when_sleeping_then_woken_at_once(self):
+        waiter = NotificationWaiter(self.listener, (ADJACENCY,))
+        threading.Timer(0.1, self.source.send, ['mgd[987]: UI_COMMIT: User root requested commit']).start()
+        threading.Timer(0.2, self.source.send, ['rpd[1234]: RPD_OSPF_NBRUP: OSPF neighbor 10.0.0.2 state changed to Full']).start()
+        start = time.monotonic()
+        event = waiter.sleep(10)
+        assert event.tag == 'RPD_OSPF_NBRUP' and time.monotonic() - start < 5
+        # the notification only wakes the waiter once
+        assert waiter.sleep(0.1) is None
+
+    def test_given_notification_before_wait_started_when_sleeping_then_ignored(self):
+        self.source.send('rpd[1234]: RPD_ISIS_ADJUP: IS-IS new L2 adjacency to r1 on et-0/0/0.0')
+        assert self.listener.wait((ADJACENCY,), 5) is not None
+        assert NotificationWaiter(self.listener, (ADJACENCY,)).sleep(0.1) is None
+
+    def test_given_stopped_listener_when_sleeping_then_sleep_full_time(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(time, 'sleep', sleeps.append)
+        self.listener.stop()
+        assert self.source.closed
+        assert NotificationWaiter(self.listener, (ADJACENCY,)).sleep(30) is None
+        assert NotificationWaiter(None, (ADJACENCY,)).sleep(30) is None
+        assert sleeps == [30, 30]
+
+    def test_given_adjacency_notification_when_wait_for_routing_convergence_then_poll_again_at_once(self, monkeypatch):
+        responses = ['rpc_responses/get_isis_adjacency_information_one_adj.xml', 'rpc_responses/get_isis_adjacency_information.xml']
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            return TestUtils.load_test_file_as_etree(responses.pop(0) if len(responses) > 1 else responses[0])
+
+        monkeypatch.setattr(Device, 'open', TestUtils.set_device_connected)
+        monkeypatch.setattr(Device, 'close', TestUtils.do_nothing)
+        monkeypatch.setattr(Device, 'execute', execute)
+        processor = RpcProcessor(self.logger, [], [], host='10.10.10.11', username='username', password='password',
+                                 port='22', connection_retries=1, connection_retry_interval=0)
+        processor.dev.notifications = self.listener
+        threading.Timer(0.2, self.source.send, ['rpd[1234]: RPD_ISIS_ADJUP: IS-IS new L2 adjacency to r2 on et-0/0/1.0']).start()
+        start = time.monotonic()
+        assert processor.wait_for_routing_convergence(min_isis_adjacencies=2, timeout=300, poll_interval=60, stable_polls=1)
+        assert time.monotonic() - start < 5
@@ -0,0 +1,206 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from jnpr.junos import Device
+from jnpr.junos.utils.fs import FS
+import pytest
+
+from test_utils import TestUtils
+from rpc_caller import RpcCaller
+from rpc_processor import RpcProcessor
+from package_staging import stage_package, stage_package_on_res, BandwidthLimiter
+from junos_upgrader_exceptions import JunosPackageStagingError
+
+PACKAGE_PATH = '/var/tmp/'
+PACKAGE_NAME = 'junos-vmhost-install-mx-x86-64-22.4R3.25.tgz'
+
+
+class FakeSFTPFile:
+    def __init__(self, file):
+        self.file = file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    def set_pipelined(self, pipelined):
+        pass
+
+    def write(self, data):
+        self.file.write(data)
+
+
+class FakeSFTP:
+    """
+    SFTP client on a folder of the test, standing in for the file system of one RE.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def local(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def stat(self, path):
+        if not os.path.exists(self.local(path)):
+            raise IOError(errno.ENOENT, 'No such file')
+        return os.stat(self.local(path))
+
+    def open(self, path, mode):
+        os.makedirs(os.path.dirname(self.local(path)), exist_ok=True)
+        return FakeSFTPFile(open(self.local(path), mode))
+
+    def remove(self, path):
+        os.remove(self.local(path))
+
+    def rename(self, source, target):
+        os.rename(self.local(source), self.local(target))
+
+
+class TestPackageStaging:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self, monkeypatch, tmp_path):
+        self.tmp_path = tmp_path
+        self.checksums = []
+        self.stats = []
+        self.package = tmp_path.joinpath('local', PACKAGE_NAME)
+        self.package.parent.mkdir()
+        self.package.write_bytes(os.urandom(1000000))
+        self.sha256 = hashlib.sha256(self.package.read_bytes()).hexdigest()
+
+        @contextmanager
+        def sftp(caller):
+            yield FakeSFTP(str(tmp_path.joinpath(caller.host)))
+
+        def file_checksum(caller, path, algorithm):
+            self.checksums.append((caller.host, path))
+            with open(FakeSFTP(str(tmp_path.joinpath(caller.host))).local(path), 'rb') as file:
+                return hashlib.new(algorithm, file.read()).hexdigest()
+
+        def stat(fs, path):
+            self.stats.append(path)
+            local = FakeSFTP(str(tmp_path.joinpath(fs._dev.hostname))).local(path)
+            if not os.path.exists(local):
+                return None
+            return {'type': 'file', 'path': path, 'size': os.path.getsize(local), 'ts_date': 'Aug 27 17:38'}
+
+        monkeypatch.setattr(RpcCaller, 'sftp', sftp)
+        monkeypatch.setattr(FS, 'stat', stat)
+        monkeypatch.setattr(RpcCaller, '_file_checksum', file_checksum)
+        monkeypatch.setattr(Device, 'open', TestUtils.set_device_connected)
+        self.logger = logging.getLogger(__name__)
+
+    def create_rpc_caller(self, host='10.10.10.11'):
+        return RpcCaller(host=host, username='username', password='password', port='22', logger=self.logger)
+
+    def remote(self, host='10.10.10.11', suffix=''):
+        return self.tmp_path.joinpath(host, 'var', 'tmp', PACKAGE_NAME + suffix)
+
+    def test_given_package_missing_when_staged_then_copied_and_verified_on_box(self):
+        result = stage_package(self.create_rpc_caller(), str(self.package), PACKAGE_PATH)
+        assert result['status'] == 'staged' and result['bytes_sent'] == 1000000
+        assert self.remote().read_bytes() == self.package.read_bytes()
+        assert not self.remote(suffix='.part').exists()
+        assert self.checksums == [('10.10.10.11', f'/var/tmp/{PACKAGE_NAME}.part')]
+
+    def test_given_interrupted_transfer_when_staged_then_resumed_from_partial_copy(self):
+        self.remote(suffix='.part').parent.mkdir(parents=True)
+        self.remote(suffix='.part').write_bytes(self.package.read_bytes()[:400000])
+        result = stage_package(self.create_rpc_caller(), str(self.package), PACKAGE_PATH)
+        assert result['resumed_from'] == 400000 and result['bytes_sent'] == 600000
+        assert self.remote().read_bytes() == self.package.read_bytes()
+
+    def test_given_intact_package_on_re_when_staged_then_nothing_sent(self):
+        stage_package(self.create_rpc_caller(), str(self.package), PACKAGE_PATH)
+        result = stage_package(self.create_rpc_caller(), str(self.package), PACKAGE_PATH)
+        assert result['status'] == 'present' and result['bytes_sent'] == 0
+
+    def test_given_truncated_package_on_re_when_staged_then_replaced(self):
+        self.remote().parent.mkdir(parents=True)
+        self.remote().write_bytes(self.package.read_bytes()[:1000])
+        result = stage_package(self.create_rpc_caller(), str(self.package), PACKAGE_PATH)
+        assert result['status'] == 'staged'
+        assert self.remote().read_bytes() == self.package.read_bytes()
+
+    def test_given_wrong_checksum_when_staged_then_raise_and_remove_partial_copy(self):
+        with pytest.raises(JunosPackageStagingError, match='expected 0123'):
+            stage_package(self.create_rpc_caller(), str(self.package), PACKAGE_PATH, checksum='0123')
+        assert not self.remote(suffix='.part').exists() and not self.remote().exists()
+
+    def test_given_bandwidth_limit_when_sent_faster_then_wait_for_rate(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(time, 'monotonic', lambda: 100.0)
+        monkeypatch.setattr(time, 'sleep', sleeps.append)
+        limiter = BandwidthLimiter(bytes_per_second=1000)
+        limiter.wait(500)
+        limiter.wait(1500)
+        assert sleeps == [0.5, 2.0]
+
+    def test_given_many_res_when_staged_then_each_staged_and_failures_reported(self, monkeypatch):
+        callers = [self.create_rpc_caller(f'10.10.10.{i}') for i in range(11, 15)]
+        callers[2].host = 'unreachable'
+        sftp = RpcCaller.sftp
+
+        @contextmanager
+        def failing_sftp(caller):
+            if caller.host == 'unreachable':
+                raise OSError('No route to host')
+            with sftp(caller) as client:
+                yield client
+
+        monkeypatch.setattr(RpcCaller, 'sftp', failing_sftp)
+        results = stage_package_on_res(callers, str(self.package), PACKAGE_PATH, max_workers=4, logger=self.logger)
+        assert [result['status'] for result in results] == ['staged', 'staged', 'failed', 'staged']
+        assert results[2]['error'] == 'OSError: No route to host'
+
+    def test_given_connect_when_staged_then_sessions_opened_in_parallel_by_workers(self):
+        hosts = [f'10.10.10.{i}' for i in range(11, 15)] + ['unreachable']
+        closed = []
+
+        @contextmanager
+        def connect(host):
+            # every connection takes a while and one RE never answers
+            time.sleep(0.5)
+            if host == 'unreachable':
+                raise OSError('No route to host')
+            yield self.create_rpc_caller(host)
+            closed.append(host)
+
+        start = time.monotonic()
+        results = stage_package_on_res(hosts, str(self.package), PACKAGE_PATH, max_workers=5, logger=self.logger,
+                                       connect=connect)
+        assert time.monotonic() - start < 2
+        assert [result['status'] for result in results] == ['staged'] * 4 + ['failed']
+        assert results[4] == {'host': 'unreachable', 'status': 'failed', 'error': 'OSError: No route to host'}
+        assert sorted(closed) == hosts[:4]
+
+    def test_given_checksum_when_verified_then_match_and_mismatch_reported(self):
+        stage_package(self.create_rpc_caller(), str(self.package), PACKAGE_PATH)
+        errors = []
+        processor = RpcProcessor(self.logger, errors, [], host='10.10.10.11', username='username',
+                                 password='password', port='22', connection_retries=1, connection_retry_interval=0)
+        assert processor.verify_junos_package_checksum(PACKAGE_PATH, PACKAGE_NAME, self.sha256.upper(), 0)
+        assert not processor.verify_junos_package_checksum(PACKAGE_PATH, PACKAGE_NAME, '0123', 0)
+        assert errors[0].startswith(f'❌ ERROR: The sha256 checksum of {PACKAGE_NAME} on RE0 is {self.sha256}')
+        assert processor.verify_junos_package_checksum(PACKAGE_PATH, PACKAGE_NAME, None, 0) is None
+
+    def test_given_cache_phase_when_package_staged_then_stat_and_checksum_reused_by_checks(self):
+        processor = RpcProcessor(self.logger, [], [], host='10.10.10.11', username='username',
+                                 password='password', port='22', connection_retries=1, connection_retry_interval=0)
+        processor.dev.start_cache_phase('pre-check')
+        assert processor.stage_junos_package(str(self.package), PACKAGE_PATH, PACKAGE_NAME, 0, self.sha256)
+        assert processor.verify_proposed_junos_install_package_exists_on_re(PACKAGE_PATH, PACKAGE_NAME, 0)
+        assert processor.verify_junos_package_checksum(PACKAGE_PATH, PACKAGE_NAME, self.sha256, 0)
+        assert processor.verify_proposed_junos_install_package_exists_on_re(PACKAGE_PATH, PACKAGE_NAME, 0)
+        # the package is stat before and after it is staged, and its checksum only calculated while staging
+        assert self.stats == [f'/var/tmp/{PACKAGE_NAME}'] * 2
+        assert self.checksums == [('10.10.10.11', f'/var/tmp/{PACKAGE_NAME}.part')]
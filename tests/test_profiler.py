@@ -0,0 +1,53 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import json
+import pytest
+
+from profiler import RunProfiler
+
+
+class TestRunProfiler:
+    def test_given_spans_when_run_then_record_duration_bytes_and_outcome(self):
+        profiler = RunProfiler()
+        with profiler.span('get_alarm_information', 'rpc', host='re0') as event:
+            event['bytes'] = 100
+        with profiler.span('get_alarm_information', 'rpc', host='re0') as event:
+            event['outcome'] = 'cached'
+        with pytest.raises(ValueError):
+            with profiler.span('install_junos_on_device', 'upgrade-step'):
+                raise ValueError('install failed')
+
+        assert [event['outcome'] for event in profiler.events] == ['ok', 'cached', 'error: ValueError']
+        assert all(event['duration'] >= 0 for event in profiler.events)
+        summary = {total['name']: total for total in profiler.summary()}
+        assert summary['get_alarm_information']['count'] == 2
+        assert summary['get_alarm_information']['bytes'] == 100
+        assert summary['install_junos_on_device']['errors'] == 1
+
+    def test_given_disabled_profiler_when_span_then_record_nothing(self, tmp_path):
+        profiler = RunProfiler(enabled=False)
+        with profiler.span('get_alarm_information', 'rpc') as event:
+            event['bytes'] = 100
+        assert profiler.events == []
+        assert profiler.write(str(tmp_path)) == []
+
+    def test_given_events_when_write_then_write_json_profile_and_chrome_trace(self, tmp_path):
+        profiler = RunProfiler()
+        with profiler.span('pre-checks', 'phase'):
+            with profiler.span('get_alarm_information', 'rpc', host='re0') as event:
+                event['bytes'] = 100
+        profile_path, trace_path = profiler.write(str(tmp_path))
+
+        with open(profile_path) as file:
+            profile = json.load(file)
+        assert [event['name'] for event in profile['events']] == ['get_alarm_information', 'pre-checks']
+        with open(trace_path) as file:
+            trace = json.load(file)['traceEvents']
+        assert trace[0] == {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'MainThread'}}
+        rpc = trace[1]
+        assert rpc['cat'] == 'rpc' and rpc['ph'] == 'X'
+        assert rpc['args'] == {'bytes': 100, 'outcome': 'ok', 'host': 're0'}
+        assert trace[2]['ts'] <= rpc['ts'] and rpc['dur'] <= trace[2]['dur']
@@ -0,0 +1,307 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import logging
+import random
+import socket
+import time
+import paramiko
+from lxml import etree
+from jnpr.junos import Device
+from jnpr.junos.utils.config import Config
+from jnpr.junos.exception import ConnectError, ConnectAuthError, ConnectRefusedError, ConnectTimeoutError, ConnectClosedError
+import pytest
+
+from test_utils import TestUtils
+from rpc_caller import RpcCaller
+from rpc_processor import RpcProcessor
+from junos_upgrader_exceptions import JunosConnectError, JunosSessionLostError
+from connection_policy import enable_keepalive
+
+
+class TestRpcCaller:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self, monkeypatch):
+        self.executed = []
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            self.executed.append(rpc_cmd.tag)
+            return TestUtils.get_device_info(device, rpc_cmd, *args, **kwargs)
+
+        monkeypatch.setattr(Device, "execute", execute)
+        monkeypatch.setattr(Device, 'open', TestUtils.set_device_connected)
+        monkeypatch.setattr(Device, 'close', TestUtils.do_nothing)
+        self.rpc_caller = RpcCaller(host='10.10.10.11', username='username', password='password', port='22',
+                                    logger=logging.getLogger(__name__), connection_retries=2, connection_retry_interval=0)
+
+    def test_given_cache_phase_when_same_rpc_called_twice_then_rpc_executed_once(self):
+        self.rpc_caller.start_cache_phase('pre-check')
+        first = self.rpc_caller.show_chassis_routing_engine(slot='0')
+        second = self.rpc_caller.show_chassis_routing_engine(slot='0')
+        self.rpc_caller.show_chassis_routing_engine(slot='1')
+        stats = self.rpc_caller.end_cache_phase()
+        assert first is second
+        assert self.executed == ['get-route-engine-information', 'get-route-engine-information']
+        assert stats == {'phase': 'pre-check', 'hits': 1, 'misses': 2}
+
+    def test_given_no_cache_phase_when_same_rpc_called_twice_then_rpc_executed_twice(self):
+        self.rpc_caller.show_chassis_routing_engine(slot='0')
+        self.rpc_caller.show_chassis_routing_engine(slot='0')
+        assert len(self.executed) == 2
+
+    def test_given_cache_phase_when_rpc_not_cacheable_then_rpc_executed_every_time(self):
+        self.rpc_caller.start_cache_phase('pre-check')
+        self.rpc_caller.show_chassis_hardware()
+        self.rpc_caller.show_chassis_hardware()
+        assert self.rpc_caller.end_cache_phase()['misses'] == 0
+        assert len(self.executed) == 2
+
+    def test_given_cache_phase_when_reboot_or_switchover_then_cache_invalidated(self):
+        self.rpc_caller.start_cache_phase('upgrade')
+        self.rpc_caller.show_chassis_alarms()
+        self.rpc_caller.request_vmhost_reboot_re(1)
+        self.rpc_caller.show_chassis_alarms()
+        self.rpc_caller.request_chassis_routing_engine_master_switch(no_confirm=True)
+        self.rpc_caller.show_chassis_alarms()
+        assert self.executed.count('get-alarm-information') == 3
+
+    def test_given_cache_phase_when_config_committed_then_cache_invalidated(self, monkeypatch):
+        monkeypatch.setattr(Config, "__enter__", TestUtils.MockConfig.__enter__)
+        monkeypatch.setattr(Config, "__exit__", TestUtils.do_nothing)
+        rpc_processor = RpcProcessor(logging.getLogger(__name__), [], [], host='10.10.10.11', username='username',
+                                     password='password', port='22', connection_retries=2, connection_retry_interval=0)
+        rpc_processor.dev.start_cache_phase('upgrade')
+        rpc_processor.dev.show_ldp_session()
+        rpc_processor.load_and_commit_config_on_device('inputs/deactivate_redundancy.txt', 'private')
+        rpc_processor.dev.show_ldp_session()
+        assert self.executed.count('get-ldp-session-information') == 2
+
+    def test_given_cache_phase_when_polled_without_cache_then_rpc_executed_every_time(self):
+        self.rpc_caller.start_cache_phase('upgrade')
+        self.rpc_caller.show_chassis_routing_engine(slot='1')
+        self.rpc_caller.show_chassis_routing_engine(slot='1', use_cache=False)
+        self.rpc_caller.show_task_replication()
+        self.rpc_caller.show_task_replication(use_cache=False)
+        assert self.rpc_caller.end_cache_phase()['hits'] == 0
+        assert len(self.executed) == 4
+
+    def test_given_cache_phase_when_mastership_checked_once_then_cached_reply_shared(self):
+        rpc_processor = RpcProcessor(logging.getLogger(__name__), [], [], host='10.10.10.11', username='username',
+                                     password='password', port='22', connection_retries=2, connection_retry_interval=0)
+        rpc_processor.dev.start_cache_phase('pre-check')
+        rpc_processor.verify_re_status(slot=0)
+        rpc_processor.verify_re_mastership(slot=0)
+        assert rpc_processor.dev.end_cache_phase()['hits'] == 1
+        assert self.executed == ['get-route-engine-information']
+
+    def test_given_subscriber_reply_in_small_chunks_when_streamed_then_subscribers_counted_and_released(self, monkeypatch):
+        reply = TestUtils.load_test_file_as_etree('rpc_responses/get_subscriber_detail_as_xml.xml')
+        subscribers = len(reply.findall('subscriber'))
+        body = etree.tostring(reply).replace(b'<subscribers-information>',
+                                             b'<subscribers-information xmlns="http://xml.juniper.net/junos/subscribers">')
+        server_data = (b'<hello><capabilities/></hello>]]>]]><rpc-reply message-id="1">' + body
+                       + b'</rpc-reply>]]>]]>')
+        channel = FakeChannel([server_data[i:i + 7] for i in range(0, len(server_data), 7)])
+        monkeypatch.setattr(paramiko, 'SSHClient', lambda: FakeSSHClient(channel))
+
+        access_types = []
+        max_children = 0
+        for subscriber in self.rpc_caller.stream_subscribers(detail=True):
+            access_types.append(subscriber.findtext('{*}access-type'))
+            max_children = max(max_children, len(subscriber.getparent()))
+        assert len(access_types) == subscribers
+        assert max_children <= 2
+        assert b'<get-subscribers><detail/></get-subscribers>' in channel.sent
+        assert self.executed == []
+
+    def test_given_rpc_error_in_reply_when_streamed_then_raise(self, monkeypatch):
+        channel = FakeChannel([b'<hello/>]]>]]><rpc-reply><rpc-error><error-message>syntax error</error-message>'
+                               b'</rpc-error></rpc-reply>]]>]]>'])
+        monkeypatch.setattr(paramiko, 'SSHClient', lambda: FakeSSHClient(channel))
+        with pytest.raises(RuntimeError, match='syntax error'):
+            list(self.rpc_caller.stream_subscribers(detail=True))
+
+    def test_given_pipelined_rpcs_when_prefetched_then_replies_used_once_without_rpc_execution(self, monkeypatch):
+        hardware = etree.tostring(TestUtils.load_test_file_as_etree('rpc_responses/get_chassis_hardware_as_xml.xml'))
+        server_data = (b'<hello><capabilities/></hello>]]>]]>'
+                       b'<rpc-reply xmlns:junos="http://xml.juniper.net/junos/" message-id="2"><rpc-error>'
+                       b'<error-message>syntax error</error-message></rpc-error></rpc-reply>]]>]]>'
+                       b'<rpc-reply message-id="1">'
+                       + hardware.replace(b'<chassis-inventory>', b'<chassis-inventory xmlns="http://xml.juniper.net/junos/chassis">')
+                       + b'</rpc-reply>]]>]]>')
+        channel = FakeChannel([server_data[i:i + 100] for i in range(0, len(server_data), 100)])
+        monkeypatch.setattr(paramiko, 'SSHClient', lambda: FakeSSHClient(channel))
+
+        stats = self.rpc_caller.prefetch_rpcs([('get_chassis_inventory', {}), ('get_interface_information', {'terse': True})])
+        assert stats['rpcs'] == 2
+        assert channel.sent.count(b'<rpc message-id=') == 2
+        assert b'<get-interface-information><terse/></get-interface-information>' in channel.sent
+
+        chassis = self.rpc_caller.show_chassis_hardware()
+        assert chassis.tag == 'chassis-inventory'
+        assert chassis.find('chassis/name') is not None
+        assert self.executed == []
+        self.rpc_caller.show_interfaces(terse=True)
+        self.rpc_caller.show_chassis_hardware()
+        assert self.executed == ['get-interface-information', 'get-chassis-inventory']
+
+    def test_given_delimiters_split_across_chunks_when_prefetched_then_every_reply_read_and_setup_not_counted_as_saved(self, monkeypatch):
+        server_data = (b'<hello><capabilities/></hello>]]>]]>'
+                       b'<rpc-reply message-id="1"><alarm-information/></rpc-reply>]]>]]>'
+                       b'<rpc-reply message-id="2"><ldp-session-information/></rpc-reply>]]>]]>')
+        channel = FakeChannel([server_data[i:i + 3] for i in range(0, len(server_data), 3)])
+        monkeypatch.setattr(paramiko, 'SSHClient', lambda: FakeSSHClient(channel))
+
+        stats = self.rpc_caller.prefetch_rpcs([('get_alarm_information', {}), ('get_ldp_session_information', {})])
+        assert stats['saved_seconds'] == pytest.approx(stats['round_trip_seconds'] - stats['setup_seconds'])
+        assert self.rpc_caller.show_chassis_alarms().tag == 'alarm-information'
+        assert self.rpc_caller.show_ldp_session().tag == 'ldp-session-information'
+        assert self.executed == []
+
+    def test_given_cached_rpc_when_prefetched_then_rpc_not_sent(self, monkeypatch):
+        self.rpc_caller.start_cache_phase('pre-check')
+        self.rpc_caller.show_chassis_alarms()
+        stats = self.rpc_caller.prefetch_rpcs([('get_alarm_information', {})])
+        assert stats['rpcs'] == 0
+
+    def test_given_session_lost_during_long_rpc_when_called_then_raise_session_lost(self, monkeypatch):
+        def execute(device, rpc_cmd, *args, **kwargs):
+            raise ConnectClosedError(device)
+        monkeypatch.setattr(Device, "execute", execute)
+        with pytest.raises(JunosSessionLostError, match='lost 0 seconds into request_vmhost_package_add'):
+            self.rpc_caller.request_vmhost_software_add(package_name='junos.tgz', re0=True, dev_timeout=900)
+
+    def test_given_session_lost_during_reboot_when_rebooted_then_reboot_under_way(self, monkeypatch):
+        def execute(device, rpc_cmd, *args, **kwargs):
+            self.executed.append(rpc_cmd.tag)
+            raise ConnectClosedError(device)
+        monkeypatch.setattr(Device, "execute", execute)
+        assert self.rpc_caller.request_vmhost_reboot_re(1) is None
+        assert self.executed == ['request-vmhost-reboot']
+
+    def test_given_transport_socket_when_keepalive_enabled_then_dead_peer_found_after_interval_times_count(self):
+        class Transport:
+            def __init__(self):
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.keepalive = None
+
+            def set_keepalive(self, interval):
+                self.keepalive = interval
+
+        transport = Transport()
+        try:
+            assert enable_keepalive(transport, 10, 3)
+            assert transport.keepalive == 10
+            assert transport.sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+            if hasattr(socket, 'TCP_USER_TIMEOUT'):
+                assert transport.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT) == 30000
+        finally:
+            transport.sock.close()
+        assert not enable_keepalive(None, 10, 3)
+
+
+class FakeChannel:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.sent = b''
+
+    def settimeout(self, timeout):
+        pass
+
+    def invoke_subsystem(self, name):
+        pass
+
+    def sendall(self, data):
+        self.sent += data
+
+    def recv(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+class FakeSSHClient:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, *args, **kwargs):
+        pass
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return self.channel
+
+    def global_request(self, kind, data=None, wait=True):
+        return None
+
+    def close(self):
+        pass
+
+
+class TestConnectionPolicy:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self, monkeypatch):
+        self.sleeps = []
+        self.errors = []
+        self.clock = 0
+
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.clock += seconds
+
+        def open_device(device, *args, **kwargs):
+            if self.errors:
+                raise self.errors.pop(0)
+            device.connected = True
+
+        monkeypatch.setattr(time, 'sleep', sleep)
+        monkeypatch.setattr(time, 'monotonic', lambda: self.clock)
+        monkeypatch.setattr(random, 'random', lambda: 0.5)
+        monkeypatch.setattr(Device, 'open', open_device)
+
+    def create_rpc_caller(self, **kwargs):
+        return RpcCaller(host='10.10.10.11', username='username', password='password', port='22',
+                         logger=logging.getLogger(__name__), **kwargs)
+
+    def test_given_transient_errors_when_open_then_back_off_exponentially_with_jitter(self):
+        self.errors = [ConnectRefusedError(Device(host='10.10.10.11'))] * 4
+        rpc_caller = self.create_rpc_caller(connection_retries=5, connection_retry_interval=4,
+                                            connection_max_retry_interval=20)
+        rpc_caller.open()
+        # the wait doubles up to the maximum and half the jitter of 0.5 is taken off
+        assert self.sleeps == [3, 6, 12, 15]
+        assert [attempt['outcome'] for attempt in rpc_caller.connect_attempts] == ['transient error'] * 4 + ['connected']
+
+    def test_given_auth_error_when_open_then_fail_without_retry(self):
+        self.errors = [ConnectAuthError(Device(host='10.10.10.11'))]
+        rpc_caller = self.create_rpc_caller(connection_retries=5, connection_retry_interval=4)
+        with pytest.raises(JunosConnectError, match='ConnectAuthError is not re-tried'):
+            rpc_caller.open()
+        assert self.sleeps == []
+        assert rpc_caller.connect_attempts[0]['outcome'] == 'permanent error'
+
+    def test_given_wrapped_host_key_error_when_open_then_fail_without_retry(self):
+        error = ConnectError(Device(host='10.10.10.11'))
+        error._orig = paramiko.BadHostKeyException('10.10.10.11', paramiko.RSAKey.generate(1024),
+                                                   paramiko.RSAKey.generate(1024))
+        self.errors = [error]
+        with pytest.raises(JunosConnectError):
+            self.create_rpc_caller(connection_retries=5, connection_retry_interval=4).open()
+        assert self.sleeps == []
+
+    def test_given_deadline_when_open_keeps_failing_then_stop_before_deadline(self):
+        self.errors = [ConnectTimeoutError(Device(host='10.10.10.11'))] * 10
+        rpc_caller = self.create_rpc_caller(connection_retries=10, connection_retry_interval=4, connection_deadline=20)
+        with pytest.raises(JunosConnectError, match='deadline of 20 seconds'):
+            rpc_caller.open()
+        assert self.sleeps == [3, 6]
+
+    def test_given_retries_used_up_when_open_then_raise_maximum_retries_error(self):
+        self.errors = [ConnectRefusedError(Device(host='10.10.10.11'))] * 3
+        with pytest.raises(JunosConnectError, match='Maximum number of retries has been reached'):
+            self.create_rpc_caller(connection_retries=3, connection_retry_interval=0).open()
@@ -0,0 +1,155 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import logging
+import time
+from lxml import etree
+from jnpr.junos import Device
+import pytest
+
+from test_utils import TestUtils
+from junos_upgrader_exceptions import JunosConnectError
+from rpc_caller import RpcCaller
+from rpc_processor import RpcProcessor
+
+
+class TestRpcProcessor:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self, monkeypatch):
+        self.sleeps = []
+        self.clock = 0
+        self.responses = {'get-software-information': 'rpc_responses/get_software_information_new.xml',
+                          'get-route-engine-information': 'rpc_responses/get_re_info.xml',
+                          'get-isis-adjacency-information': 'rpc_responses/get_isis_adjacency_information.xml'}
+
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.clock += seconds
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            response = self.responses[rpc_cmd.tag]
+            # a list of responses is answered in turn, the last one from then on
+            if isinstance(response, list):
+                response = response.pop(0) if len(response) > 1 else response[0]
+            return TestUtils.load_test_file_as_etree(response)
+
+        monkeypatch.setattr(time, 'sleep', sleep)
+        monkeypatch.setattr(time, 'monotonic', lambda: self.clock)
+        monkeypatch.setattr(Device, 'open', TestUtils.set_device_connected)
+        monkeypatch.setattr(Device, 'close', TestUtils.do_nothing)
+        monkeypatch.setattr(Device, 'execute', execute)
+        self.rpc_processor = RpcProcessor(logging.getLogger(__name__), [], [], host='10.10.10.11', username='username',
+                                          password='password', port='22', connection_retries=2, connection_retry_interval=0)
+
+    def test_given_port_closed_twice_when_wait_for_re_ready_then_back_off_and_return_true(self, monkeypatch):
+        port_checks = iter([False, False, True])
+        monkeypatch.setattr(RpcCaller, 'port_is_open', lambda *args, **kwargs: next(port_checks))
+        assert self.rpc_processor.wait_for_re_ready(slot=0, timeout=600, initial_delay=60, poll_interval=5, max_poll_interval=30)
+        assert self.sleeps == [60, 5, 10]
+
+    def test_given_bad_re_status_when_wait_for_re_ready_deadline_passed_then_raise_connect_error(self, monkeypatch, caplog):
+        self.responses['get-route-engine-information'] = 'rpc_responses/get_re_info_bad_status.xml'
+        monkeypatch.setattr(RpcCaller, 'port_is_open', TestUtils.return_success)
+        with pytest.raises(JunosConnectError, match='RE0 was not ready after 100 seconds'):
+            self.rpc_processor.wait_for_re_ready(slot=0, timeout=100, initial_delay=10, poll_interval=5, max_poll_interval=30)
+        assert self.sleeps == [10, 5, 10, 20, 30, 25]
+        assert 'RE status (status: Bad, mastership: master) check not passed' in caplog.text
+
+    def test_given_re_not_master_when_wait_for_re_ready_expecting_master_then_raise_connect_error(self, monkeypatch):
+        self.responses['get-route-engine-information'] = 'rpc_responses/get_re_info_backup_mastership.xml'
+        monkeypatch.setattr(RpcCaller, 'port_is_open', TestUtils.return_success)
+        with pytest.raises(JunosConnectError, match='mastership: backup'):
+            self.rpc_processor.wait_for_re_ready(slot=0, timeout=0, reopen_session=False, expect_master=True)
+
+    def test_given_session_dropped_while_booting_when_wait_for_re_ready_then_reopen_session(self, monkeypatch):
+        opens = []
+        versions = iter([Exception('session closed'), None])
+
+        def show_version(*args, **kwargs):
+            result = next(versions)
+            if isinstance(result, Exception):
+                raise result
+            return TestUtils.load_test_file_as_etree(self.responses['get-software-information'])
+
+        monkeypatch.setattr(RpcCaller, 'port_is_open', TestUtils.return_success)
+        monkeypatch.setattr(RpcCaller, 'open', lambda *args, **kwargs: opens.append(kwargs))
+        monkeypatch.setattr(RpcCaller, 'show_version', show_version)
+        assert self.rpc_processor.wait_for_re_ready(slot=0, timeout=600, initial_delay=0)
+        assert len(opens) == 2
+
+    def test_given_isis_adjacencies_up_when_wait_for_routing_convergence_then_return_true_after_stable_polls(self):
+        assert self.rpc_processor.wait_for_routing_convergence(min_isis_adjacencies=2, timeout=300, poll_interval=5)
+        assert self.sleeps == [5]
+
+    def test_given_too_few_isis_adjacencies_when_wait_for_routing_convergence_then_warn_and_return_false(self):
+        self.responses['get-isis-adjacency-information'] = 'rpc_responses/get_isis_adjacency_information_one_adj.xml'
+        assert not self.rpc_processor.wait_for_routing_convergence(min_isis_adjacencies=2, timeout=60, poll_interval=5)
+        assert 'Routing had not converged after 60 seconds' in self.rpc_processor.upgrade_warning_log[0]
+        assert self.sleeps == [5, 10, 20, 25]
+
+    def test_given_re_master_on_third_poll_when_verify_re_mastership_then_poll_at_growing_intervals(self):
+        self.responses['get-route-engine-information'] = ['rpc_responses/get_re_info_backup_mastership.xml'] * 2 + ['rpc_responses/get_re_info.xml']
+        assert self.rpc_processor.verify_re_mastership(slot=0, timeout=300)
+        assert self.sleeps == [1, 2]
+
+    def test_given_re_never_master_when_verify_re_mastership_then_error_at_deadline(self):
+        self.responses['get-route-engine-information'] = 'rpc_responses/get_re_info_backup_mastership.xml'
+        assert not self.rpc_processor.verify_re_mastership(slot=0, timeout=40)
+        assert self.sleeps == [1, 2, 4, 8, 15, 10]
+        assert self.rpc_processor.upgrade_error_log == ['\u274C ERROR: RE0 is not master after 40 seconds']
+
+    def test_given_re_not_master_when_verify_re_mastership_without_timeout_then_error_at_once(self):
+        self.responses['get-route-engine-information'] = 'rpc_responses/get_re_info_backup_mastership.xml'
+        assert not self.rpc_processor.verify_re_mastership(slot=0)
+        assert self.sleeps == []
+        assert self.rpc_processor.upgrade_error_log == ['\u274C ERROR: RE0 is not master']
+
+    def test_given_replication_completes_when_confirm_replication_complete_then_return_true(self):
+        self.responses['get-routing-task-replication-state'] = ['rpc_responses/get_protocol_replication_state_not_complete.xml',
+                                                                'rpc_responses/get_protocol_replication_state.xml']
+        assert self.rpc_processor.confirm_replication_complete(timeout=600)
+        assert self.sleeps == [1]
+
+    def test_given_replication_disabled_when_confirm_replication_complete_then_warn_without_waiting(self):
+        self.responses['get-routing-task-replication-state'] = 'rpc_responses/get_protocol_replication_state_disabled.xml'
+        assert not self.rpc_processor.confirm_replication_complete(timeout=600)
+        assert self.sleeps == []
+        assert 'Stateful replication is disabled' in self.rpc_processor.upgrade_warning_log[0]
+
+    def test_given_stream_when_record_subscriber_count_for_each_subscriber_type_then_count_streamed_subscribers(self, monkeypatch):
+        reply = TestUtils.load_test_file_as_etree('rpc_responses/get_subscriber_detail_as_xml.xml')
+        monkeypatch.setattr(RpcCaller, 'stream_subscribers', lambda *args, **kwargs: iter(reply.findall('subscriber')))
+        record = {}
+        self.rpc_processor.record_subscriber_count_for_each_subscriber_type(record, stream=True)
+        assert record['subscriber-count-per-type'] == {'vlan': 10, 'pppoe': 5, 'dhcp': 10}
+
+    def test_given_protocol_not_running_when_record_ospf_neighbor_info_then_record_not_running(self):
+        self.responses['get-ospf-neighbor-information'] = 'rpc_responses/get_ospf_nei_no_ospf_running.xml'
+        record = {}
+        self.rpc_processor.record_ospf_neighbor_info(record)
+        assert record['ospf-neighbor-info'] == "OSPF is not running"
+
+    def test_given_replies_when_reply_messages_then_return_output_and_error_lines_only(self):
+        vmhost = TestUtils.load_test_file_as_etree('rpc_responses/get_vmhost_version.xml')
+        assert sum(line.count('Junos Disk') for line in RpcProcessor.reply_messages(vmhost)) == 2
+        switchover = TestUtils.load_test_file_as_etree('rpc_responses/request_re_switchover.xml')
+        assert RpcProcessor.reply_messages(switchover) == ['First message', 'Complete']
+        error = etree.fromstring('<rpc-error><error-message>ISIS instance is not running</error-message></rpc-error>')
+        assert RpcProcessor.reply_contains(error, 'ISIS instance is not running')
+        adjacencies = etree.fromstring('<isis-adjacency-information><isis-adjacency><description>ISIS instance is not '
+                                       'running</description></isis-adjacency></isis-adjacency-information>')
+        assert not RpcProcessor.reply_contains(adjacencies, 'ISIS instance is not running')
+
+    def test_given_set_format_config_when_get_config_in_set_format_then_fetched_without_normalising(self, monkeypatch):
+        calls = []
+
+        def show_configuration(rpc_caller, *args, **kwargs):
+            calls.append(kwargs)
+            return TestUtils.load_test_file_as_etree('rpc_responses/get_configuration_in_set_format.xml')
+
+        monkeypatch.setattr(RpcCaller, 'show_configuration', show_configuration)
+        config = self.rpc_processor.get_config_in_set_format()
+        assert calls[0]['normalize'] is False
+        assert config.splitlines()[0] == 'set system host-name test123'
@@ -0,0 +1,121 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from jnpr.junos import Device
+import pytest
+
+from test_utils import TestUtils
+from rpc_caller import RpcCaller
+from rpc_processor import RpcProcessor
+from session_pool import SessionPool
+from notifications import NotificationListener
+
+
+class TestSessionPool:
+    @pytest.fixture(scope="function", autouse=True)
+    def before(self, monkeypatch):
+        self.opened = []
+        self.closed = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        def open_device(device, *args, **kwargs):
+            self.opened.append(device.hostname)
+            device.connected = True
+
+        def close_device(device):
+            self.closed.append(device.hostname)
+            device.connected = False
+
+        def execute(device, rpc_cmd, *args, **kwargs):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.01)
+            with self.lock:
+                self.in_flight -= 1
+            return TestUtils.load_test_file_as_etree('rpc_responses/get_re_info.xml')
+
+        monkeypatch.setattr(Device, 'open', open_device)
+        monkeypatch.setattr(Device, 'close', close_device)
+        monkeypatch.setattr(Device, 'execute', execute)
+        self.logger = logging.getLogger(__name__)
+
+    def create_rpc_processor(self, session_pool, host='10.10.10.11', port='22'):
+        return RpcProcessor(self.logger, [], [], host=host, username='username', password='password', port=port,
+                            connection_retries=2, connection_retry_interval=0, session_pool=session_pool)
+
+    def test_given_processors_for_same_host_when_created_then_share_one_session(self):
+        with SessionPool() as session_pool:
+            first = self.create_rpc_processor(session_pool)
+            second = self.create_rpc_processor(session_pool)
+            other_port = self.create_rpc_processor(session_pool, port='830')
+            other_host = self.create_rpc_processor(session_pool, host='10.10.10.12')
+            assert first.dev is second.dev
+            assert other_port.dev is not first.dev and other_host.dev is not first.dev
+            assert self.opened == ['10.10.10.11', '10.10.10.11', '10.10.10.12']
+
+    def test_given_shared_session_when_released_then_closed_after_last_user(self):
+        session_pool = SessionPool()
+        first = self.create_rpc_processor(session_pool)
+        second = self.create_rpc_processor(session_pool)
+        first.close()
+        assert self.closed == [] and second.dev.device.connected
+        second.close()
+        assert self.closed == ['10.10.10.11']
+        # the next processor opens a new session
+        third = self.create_rpc_processor(session_pool)
+        assert third.dev is not first.dev and len(self.opened) == 2
+        session_pool.close()
+        assert self.closed == ['10.10.10.11', '10.10.10.11']
+
+    def test_given_dropped_session_when_acquired_then_reopened(self):
+        with SessionPool() as session_pool:
+            first = self.create_rpc_processor(session_pool)
+            first.dev.device.connected = False
+            second = self.create_rpc_processor(session_pool)
+            assert second.dev is first.dev and second.dev.device.connected
+            assert len(self.opened) == 2
+
+    def test_given_dropped_session_with_notifications_when_released_then_listener_stopped(self):
+        session_pool = SessionPool()
+        processor = self.create_rpc_processor(session_pool)
+        listener = processor.dev.notifications = NotificationListener(lambda timeout: time.sleep(timeout), self.logger,
+                                                                      '10.10.10.11').start()
+        processor.dev.device.connected = False
+        processor.close()
+        assert not listener.running and processor.dev.notifications is None
+        session_pool.close()
+
+    def test_given_reconnect_interval_when_session_drops_then_reopened_in_background(self, monkeypatch):
+        monkeypatch.setattr(RpcCaller, 'port_is_open', lambda caller, timeout=5: True)
+        with SessionPool(reconnect_interval=0.01) as session_pool:
+            processor = self.create_rpc_processor(session_pool)
+            processor.dev.device.connected = False
+            for _ in range(200):
+                if processor.dev.device.connected:
+                    break
+                time.sleep(0.01)
+            assert processor.dev.device.connected
+            assert len(self.opened) == 2
+
+    def test_given_released_session_when_monitored_then_not_reopened(self, monkeypatch):
+        monkeypatch.setattr(RpcCaller, 'port_is_open', lambda caller, timeout=5: True)
+        with SessionPool(reconnect_interval=0.01) as session_pool:
+            self.create_rpc_processor(session_pool).close()
+            time.sleep(0.05)
+            assert self.opened == ['10.10.10.11']
+
+    def test_given_shared_session_when_used_from_threads_then_rpcs_serialized(self):
+        with SessionPool() as session_pool:
+            processors = [self.create_rpc_processor(session_pool) for _ in range(4)]
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda processor: processor.dev.show_version(), processors))
+            assert self.max_in_flight == 1
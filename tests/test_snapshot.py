@@ -0,0 +1,47 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import json
+import pytest
+
+from snapshot import SnapshotWriter, StreamingRecord, Snapshot
+
+
+class TestSnapshot:
+    def test_given_record_when_written_then_read_back_unchanged(self, tmp_path):
+        record = {'interface-summary': [{'name': 'xe-1/0/5:1.100', 'admin-status': 'up', 'oper-status': 'up'},
+                                        {'name': 'xe-1/0/6:1.100', 'admin-status': 'up'}],
+                  'subscriber-count-per-type': {'vlan': 10, 'pppoe': 5},
+                  'chassis-alarms': "No active alarms",
+                  'route-summary': []}
+        with SnapshotWriter(str(tmp_path.joinpath('state.snap'))) as writer:
+            for record_type, value in record.items():
+                writer.add(record_type, value)
+        with Snapshot(str(tmp_path.joinpath('state.snap'))) as snapshot:
+            assert snapshot.record_types() == list(record)
+            assert snapshot.get('interface-summary') == record['interface-summary']
+            assert snapshot.to_dict() == record
+
+    def test_given_streaming_record_when_record_type_set_twice_then_stream_latest_value(self, tmp_path):
+        record = StreamingRecord(SnapshotWriter(str(tmp_path.joinpath('state.snap'))))
+        record['bfd-session-state'] = "No sessions"
+        record['bfd-session-state'] = "2"
+        record.close()
+        assert record == {'bfd-session-state': "2"}
+        with Snapshot(str(tmp_path.joinpath('state.snap'))) as snapshot:
+            assert snapshot.to_dict() == {'bfd-session-state': "2"}
+
+    def test_given_large_record_when_written_then_much_smaller_than_json(self, tmp_path):
+        interfaces = [{'name': f'ge-0/0/{index % 48}.{index}', 'admin-status': 'up',
+                       'oper-status': 'up' if index % 10 else 'down'} for index in range(50000)]
+        with SnapshotWriter(str(tmp_path.joinpath('state.snap'))) as writer:
+            writer.add('interface-summary', interfaces)
+        json_size = len(json.dumps({'interface-summary': interfaces}, indent=4))
+        assert tmp_path.joinpath('state.snap').stat().st_size * 10 < json_size
+
+    def test_given_other_file_when_read_then_raise_value_error(self, tmp_path):
+        tmp_path.joinpath('state.json').write_text('{}')
+        with pytest.raises(ValueError):
+            Snapshot(str(tmp_path.joinpath('state.json')))
@@ -0,0 +1,33 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+from snapshot_store import SnapshotStore
+
+PEERS = [{'address': '11.11.11.11', 'state': 'Established'}, {'address': '12.12.12.12', 'state': 'Established'}]
+
+
+class TestSnapshotStore:
+    def test_given_runs_when_query_lost_entries_then_return_entries_missing_after_upgrade(self, tmp_path):
+        with SnapshotStore(str(tmp_path.joinpath('snapshots.db'))) as store:
+            for device, to_junos, post_peers in (('mx-1', '22.4R3.25', PEERS[:1]), ('mx-2', '22.4R3.25', PEERS[::-1]),
+                                                 ('mx-3', '23.2R1.14', [])):
+                run_id = store.start_run(device, '19.4R3-S4.1', to_junos)
+                store.add(run_id, 'pre', 'bgp-summary', PEERS)
+                store.add(run_id, 'post', 'bgp-summary', post_peers)
+            # a dry run has no post upgrade state, so it has lost nothing
+            store.add(store.start_run('mx-4', '19.4R3-S4.1', '22.4R3.25'), 'pre', 'bgp-summary', PEERS)
+
+            lost = store.lost_entries('bgp-summary', '22.4R3.25')
+            assert [(entry['device'], entry['entry_key']) for entry in lost] == [('mx-1', '12.12.12.12')]
+            assert [entry['device'] for entry in store.lost_entries('bgp-summary')] == ['mx-1', 'mx-3', 'mx-3']
+
+    def test_given_record_added_twice_when_read_then_return_latest(self, tmp_path):
+        with SnapshotStore(str(tmp_path.joinpath('snapshots.db'))) as store:
+            run_id = store.start_run('mx-1')
+            store.add(run_id, 'pre', 'bgp-summary', PEERS)
+            store.add(run_id, 'pre', 'bgp-summary', PEERS[:1])
+            store.add(run_id, 'pre', 'subscriber-count-per-type', {'vlan': 10})
+            assert store.record(run_id, 'pre') == {'bgp-summary': PEERS[:1], 'subscriber-count-per-type': {'vlan': 10}}
+            assert [run['device'] for run in store.runs('mx-1')] == ['mx-1']
@@ -0,0 +1,49 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+from state_diff import diff_state
+
+
+class TestStateDiff:
+    def test_given_reordered_entries_when_diff_state_then_no_differences(self):
+        before = {'bgp-summary': [{'address': '11.11.11.11', 'state': 'Established'},
+                                  {'address': '12.12.12.12', 'state': 'Established'}],
+                  'replication-state': [{'OSPF': 'Complete'}, {'BGP': 'Complete'}]}
+        after = {'bgp-summary': list(reversed(before['bgp-summary'])),
+                 'replication-state': list(reversed(before['replication-state']))}
+        assert diff_state(before, after) == {}
+
+    def test_given_added_removed_and_changed_entries_when_diff_state_then_report_each_entity(self):
+        before = {'bgp-summary': [{'address': '11.11.11.11', 'state': 'Established'},
+                                  {'address': '12.12.12.12', 'state': 'Established'}],
+                  'subscriber-count-per-type': {'vlan': 10}}
+        after = {'bgp-summary': [{'address': '13.13.13.13', 'state': 'Established'},
+                                 {'address': '11.11.11.11', 'state': 'Active'}],
+                 'subscriber-count-per-type': {'vlan': 9}}
+        assert diff_state(before, after) == {
+            'bgp-summary[11.11.11.11].state': ('Established', 'Active'),
+            'bgp-summary[12.12.12.12]': ({'address': '12.12.12.12', 'state': 'Established'}, 'Missing in dict2'),
+            'bgp-summary[13.13.13.13]': ('Missing in dict1', {'address': '13.13.13.13', 'state': 'Established'}),
+            'subscriber-count-per-type.vlan': (10, 9)}
+
+    def test_given_route_counts_when_diff_state_with_tolerance_then_report_only_counts_outside_tolerance(self):
+        def route_summary(direct, bgp):
+            return {'route-summary': [
+                {'route_table_name': 'inet.0', 'protocol-name': 'Direct', 'protocol-route-count': direct},
+                {'route_table_name': 'inet.0', 'protocol-name': 'BGP', 'protocol-route-count': bgp}]}
+        before, after = route_summary('100', '1000'), route_summary('104', '1100')
+        assert diff_state(before, after, tolerances={'route-summary': 5}) == {
+            'route-summary[inet.0/BGP].protocol-route-count': ('1000', '1100')}
+        assert len(diff_state(before, after)) == 2
+
+    def test_given_duplicate_and_unkeyed_entries_when_diff_state_then_match_by_value(self):
+        before = {'chassis-alarms': [{'alarm-class': 'Minor', 'alarm_description': 'PEM 1 Not OK'}] * 2,
+                  'other': ['a', 'b']}
+        after = {'chassis-alarms': [{'alarm-class': 'Minor', 'alarm_description': 'PEM 1 Not OK'}],
+                 'other': ['b', 'a', 'c']}
+        assert diff_state(before, after) == {
+            'chassis-alarms[Minor/PEM 1 Not OK#2]': ({'alarm-class': 'Minor', 'alarm_description': 'PEM 1 Not OK'},
+                                                     'Missing in dict2'),
+            'other[c]': ('Missing in dict1', 'c')}
@@ -0,0 +1,130 @@
+"""
+Copyright (c) Juniper Networks 2024
+Created by Andrew Southard <southarda@juniper.net> <andsouth44@gmail.com>
+"""
+
+import os
+import threading
+import time
+import logging
+import pytest
+
+from upgrade_plan import UpgradePlan, PlanScheduler
+from junos_upgrader_exceptions import JunosInputsError
+
+UPGRADERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'junos_upgrader', 'upgraders')
+
+
+class FakeProcessor:
+    def __init__(self, name):
+        self.name = name
+        self.threads = set()
+        self.logger = None
+        self.upgrade_error_log = None
+        self.upgrade_warning_log = None
+
+    def use_logs(self, logger, upgrade_error_log, upgrade_warning_log):
+        self.logger = logger
+        self.upgrade_error_log = upgrade_error_log
+        self.upgrade_warning_log = upgrade_warning_log
+
+    def check(self, message, result=True, delay=0):
+        self.threads.add(threading.get_ident())
+        time.sleep(delay)
+        self.logger.info(f'{self.name}: {message}')
+        if not result:
+            self.upgrade_error_log.append(f'{self.name}: {message} failed')
+        return result
+
+    def record(self, record, key, value):
+        record[key] = value
+
+    def fail(self):
+        raise RuntimeError('step failed')
+
+
+class TestUpgradePlan:
+    def test_given_step_depending_on_later_step_when_create_plan_then_raise_junos_inputs_error(self):
+        with pytest.raises(JunosInputsError):
+            UpgradePlan([{'id': 'a', 'target': 're0', 'method': 'check', 'after': ['b']},
+                         {'id': 'b', 'target': 're0', 'method': 'check'}])
+
+    def test_given_duplicate_step_id_when_create_plan_then_raise_junos_inputs_error(self):
+        with pytest.raises(JunosInputsError):
+            UpgradePlan([{'id': 'a', 'target': 're0', 'method': 'check'},
+                         {'id': 'a', 'target': 're1', 'method': 'check'}])
+
+    def test_given_unknown_method_or_input_when_create_scheduler_then_raise_junos_inputs_error(self):
+        processors = {'re0': FakeProcessor('re0')}
+        with pytest.raises(JunosInputsError):
+            PlanScheduler(UpgradePlan([{'id': 'a', 'target': 're0', 'method': 'missing'}]), processors, {},
+                          logging.getLogger(__name__), [], [])
+        with pytest.raises(JunosInputsError):
+            PlanScheduler(UpgradePlan([{'id': 'a', 'target': 're0', 'method': 'check', 'args': ['$MISSING']}]),
+                          processors, {}, logging.getLogger(__name__), [], [])
+
+    def test_given_shipped_plans_when_load_then_plans_are_valid(self):
+        for upgrader in ['dual_re_upgrader', 'single_re_upgrader']:
+            plan_file = os.path.join(UPGRADERS_DIR, upgrader, 'inputs', 'UPGRADE_PLAN.json')
+            for phase in ['pre-checks', 'post-checks']:
+                assert len(UpgradePlan.load({}, phase, plan_file).steps) > 0
+
+
+class TestPlanScheduler:
+    def test_given_two_targets_when_run_then_targets_run_concurrently_and_log_in_plan_order(self, caplog):
+        caplog.set_level(logging.INFO)
+        processors = {'re0': FakeProcessor('re0'), 're1': FakeProcessor('re1')}
+        record = {}
+        plan = UpgradePlan([
+            {'id': 're0-banner', 'target': 're0', 'log': 'RE0 CHECKS'},
+            {'id': 're0-slow', 'target': 're0', 'method': 'check', 'args': ['slow'], 'kwargs': {'delay': 0.2}},
+            {'id': 're0-record', 'target': 're0', 'method': 'record', 'args': ['$RECORD', 'model', '${MODEL}-re0']},
+            {'id': 're1-banner', 'target': 're1', 'log': 'RE1 CHECKS'},
+            {'id': 're1-fast', 'target': 're1', 'method': 'check', 'args': ['fast'], 'kwargs': {'result': False}},
+        ])
+        errors = []
+        start = time.monotonic()
+        results = PlanScheduler(plan, processors, {'RECORD': record, 'MODEL': 'mx'}, logging.getLogger(__name__),
+                                errors, []).run()
+        assert time.monotonic() - start < 0.4
+        assert processors['re0'].threads.isdisjoint(processors['re1'].threads)
+        assert record == {'model': 'mx-re0'}
+        assert results['re0-slow'] is True and results['re1-fast'] is False
+        assert errors == ['re1: fast failed']
+        assert [r.getMessage() for r in caplog.records] == ['RE0 CHECKS', 're0: slow', 'RE1 CHECKS', 're1: fast']
+
+    def test_given_when_step_false_when_run_then_skip_step(self):
+        processors = {'re0': FakeProcessor('re0')}
+        plan = UpgradePlan([
+            {'id': 'status', 'target': 're0', 'method': 'check', 'args': ['status'], 'kwargs': {'result': False}},
+            {'id': 'memory', 'target': 're0', 'method': 'check', 'args': ['memory'], 'when': 'status'},
+            {'id': 'model', 'target': 're0', 'method': 'check', 'args': ['model']},
+        ])
+        results = PlanScheduler(plan, processors, {}, logging.getLogger(__name__), [], []).run()
+        assert results == {'status': False, 'memory': None, 'model': True}
+
+    def test_given_cross_target_dependency_when_run_then_wait_for_dependency(self):
+        processors = {'re0': FakeProcessor('re0'), 're1': FakeProcessor('re1')}
+        order = []
+        processors['re0'].record = lambda record, key, value: order.append(key)
+        processors['re1'].record = lambda record, key, value: order.append(key)
+        plan = UpgradePlan([
+            {'id': 'slow', 'target': 're0', 'method': 'check', 'args': ['slow'], 'kwargs': {'delay': 0.1}},
+            {'id': 'first', 'target': 're0', 'method': 'record', 'args': [{}, 'first', None]},
+            {'id': 'second', 'target': 're1', 'method': 'record', 'args': [{}, 'second', None], 'after': ['first']},
+        ])
+        PlanScheduler(plan, processors, {}, logging.getLogger(__name__), [], []).run()
+        assert order == ['first', 'second']
+
+    def test_given_failing_step_when_run_then_stop_and_raise_step_exception(self, caplog):
+        caplog.set_level(logging.INFO)
+        processors = {'re0': FakeProcessor('re0')}
+        plan = UpgradePlan([
+            {'id': 'before', 'target': 're0', 'method': 'check', 'args': ['before']},
+            {'id': 'fail', 'target': 're0', 'method': 'fail'},
+            {'id': 'after', 'target': 're0', 'method': 'check', 'args': ['after']},
+        ])
+        with pytest.raises(RuntimeError):
+            PlanScheduler(plan, processors, {}, logging.getLogger(__name__), [], []).run()
+        assert 're0: before' in caplog.text
+        assert 're0: after' not in caplog.text
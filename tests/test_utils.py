@@ -16,6 +16,11 @@ class TestUtils:
 
     @staticmethod
     def get_test_name():
+        # RPCs made from worker threads have no test function in their call stack,
+        # so use the test name that pytest publishes for the whole process first
+        current_test = os.environ.get('PYTEST_CURRENT_TEST')
+        if current_test is not None:
+            return current_test.split('::')[-1].split(' ')[0]
         cwd = os.path.dirname(os.path.abspath(__file__))
         current_frame = inspect.currentframe()
         outer_frames = inspect.getouterframes(current_frame)
@@ -29,6 +34,21 @@ class TestUtils:
             self.dryrun = False
             self.force = False
 
+    class MockResumeArgs:
+        def __init__(self):
+            self.debug = False
+            self.dryrun = False
+            self.force = False
+            self.resume = True
+
+    class MockFleetArgs:
+        def __init__(self):
+            self.debug = False
+            self.dryrun = True
+            self.force = False
+            self.inventory = None
+            self.pool = 'thread'
+
     class MockConfig:
         def __init__(self, *args, **kwargs):
             pass
@@ -260,12 +280,26 @@ class TestUtils:
         return element_tree.getroot()
 
     @staticmethod
-    def get_re_files(*args, **kwargs):
-        return TestUtils.load_test_file('rpc_responses/get_re_files.json')
+    def get_package_stat(*args, **kwargs):
+        return TestUtils.load_test_file('rpc_responses/get_package_stat.json')
+
+    @staticmethod
+    def get_no_package_stat(*args, **kwargs):
+        return None
 
     @staticmethod
-    def get_re_files_no_new_package(*args, **kwargs):
-        return TestUtils.load_test_file('rpc_responses/get_re_files_no_new_package.json')
+    def get_fleet_device_info(*args, **kwargs):
+        """
+        The sequenced mockers used by get_device_info expect a single device. Every device of a
+        fleet gets the same pre-upgrade config and Junos version instead.
+        """
+        if args[1].tag == 'get-configuration':
+            return TestUtils.load_test_file_as_etree('rpc_responses/get_configuration_in_set_format.xml')
+        elif args[1].tag == 'get-software-information':
+            return TestUtils.load_test_file_as_etree('rpc_responses/get_software_information_old.xml')
+        elif args[1].tag == 'get-subscribers':
+            return TestUtils.load_test_file_as_etree('rpc_responses/get_subscriber_detail_as_xml.xml')
+        return TestUtils.get_device_info(*args, **kwargs)
 
     @staticmethod
     def get_device_info(*args, **kwargs):